@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+
+"""
+Select, project and count instances of an ARFF file, reading it in a single
+pass with bounded memory.
+
+Usage: ./arff_query.py [-s attr1,attr2...] [-w condition ...] [-i] \\
+                       [-c | -g attr1,attr2...] [-m name[:value]] \\
+                       [-f arff|tsv] [-b batch_size] [-e encoding] \\
+                       in.arff [out]
+
+-s = output only the given attributes (in the order of the input file)
+
+-w = select only instances that satisfy the given condition (may be
+     repeated, all conditions must hold). Conditions have the form
+     "attr OP value", where OP is = (equal), != (not equal),
+     ~ (regular expression search) or !~ (regular expression does not
+     match). Values starting with @ refer to another attribute, ? stands
+     for a missing value. Regular expressions may contain Unicode
+     properties, e.g. "Lemma~^\\p{P}".
+
+-i = case-insensitive comparisons and regular expressions
+
+-c = print just the number of selected instances
+
+-g = print the numbers of selected instances for each combination
+     of values of the given attributes
+
+-m = keep all instances and mark the selected ones in a new string
+     attribute of the given name (with the given value, default: 1)
+
+-f = output format: arff (default for instances) or tsv (default
+     for group-by counts)
+
+-b = number of instances processed at once (defaults to 10000)
+
+-e = encoding of the input and output files (defaults to UTF-8)
+
+The output goes to the standard output if no output file is given.
+"""
+
+from __future__ import unicode_literals
+import sys
+import getopt
+from flect.arffquery import ArffQuery, parse_condition
+from flect.logf import log_info
+
+__author__ = "Ondřej Dušek"
+__date__ = "2013"
+
+
+# default number of instances processed at once
+BATCH_SIZE = 10000
+
+
+def display_usage():
+    """\
+    Display program usage information.
+    """
+    print >> sys.stderr, __doc__
+
+
+def main():
+    """\
+    Main application entry: parse command line and run the query.
+    """
+    opts, filenames = getopt.getopt(sys.argv[1:], 's:w:icg:m:f:b:e:h')
+    select = None
+    preds = []
+    ignore_case = False
+    count = False
+    group_by = None
+    mark = None
+    mark_value = '1'
+    out_format = None
+    batch_size = BATCH_SIZE
+    encoding = 'UTF-8'
+    show_help = False
+    for opt, arg in opts:
+        if opt == '-s':
+            select = arg.split(',')
+        elif opt == '-w':
+            preds.append(arg)
+        elif opt == '-i':
+            ignore_case = True
+        elif opt == '-c':
+            count = True
+        elif opt == '-g':
+            group_by = arg.split(',')
+        elif opt == '-m':
+            mark, _, value = arg.partition(':')
+            mark_value = value or mark_value
+        elif opt == '-f':
+            out_format = arg
+        elif opt == '-b':
+            batch_size = int(arg)
+        elif opt == '-e':
+            encoding = arg
+        elif opt == '-h':
+            show_help = True
+    # display help and exit
+    if len(filenames) not in [1, 2] or show_help or \
+            out_format not in [None, 'arff', 'tsv']:
+        display_usage()
+        sys.exit(1)
+    # run the query
+    query = ArffQuery(select, [parse_condition(pred.decode('UTF-8'),
+                                               ignore_case)
+                               for pred in preds],
+                      group_by, count, mark, mark_value)
+    if out_format is None:
+        out_format = 'tsv' if group_by else 'arff'
+    filename_in = filenames[0]
+    output = filenames[1] if len(filenames) > 1 else sys.stdout
+    log_info('Querying data: ' + filename_in)
+    query.run(filename_in, output, out_format, encoding, batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+
+"""
+Measuring the performance of Flect's data handling.
+
+Usage: ./benchmark.py [-n instances] [-r repeats] [-w workers] \\
+                      test [file.arff ...]
+
+Tests:
+
+load = ARFF loading throughput (DataSet.load_from_arff)
+cache = loading throughput from the binary ARFF cache
+save = ARFF writing throughput (DataSet.save_to_arff)
+lines = line iteration throughput of text file streams (varutil.file_stream,
+        compared to reading through the codecs module)
+bunch = conversion to scikit-learn input (DataSet.as_bunch, compared to
+        a row-by-row conversion); the last attribute is the target
+
+If no ARFF files are given, a dense and a sparse data set with the given
+number of instances (default: 100000) are generated into a temporary
+directory. Each measurement is repeated (default: 3 times) and the best
+time is reported. The -w switch sets the number of worker processes
+for ARFF loading (default: 1).
+"""
+
+from __future__ import unicode_literals
+import sys
+import os
+import getopt
+import codecs
+import gzip
+import random
+import shutil
+import tempfile
+import time
+import numpy as np
+import scipy.sparse as sp
+from flect.dataset import DataSet
+from flect.arffcache import cache_dir
+from flect.varutil import file_stream
+
+__author__ = "Ondřej Dušek"
+__date__ = "2013"
+
+
+# default number of instances in generated data sets
+INSTANCES = 100000
+# default number of repetitions of each measurement
+REPEATS = 3
+
+# some values for generated string attributes
+WORDS = ['pes', 'kočka', 'dům', 'město', 'být', 'mít', 'a', 'v', ',', '.',
+         'ten', 'který', 'rok', 'člověk', 'O\'Brien', 'a,b', 'x y', '']
+
+
+def arff_string(value):
+    """\
+    Return a (possibly quoted) ARFF representation of a generated value.
+    """
+    if value == '' or any(c in value for c in '\'", {}?%\\'):
+        return "'" + value.replace('\\', '\\\\').replace('\'', '\\\'') + "'"
+    return value
+
+
+def generate_dense(filename, instances):
+    """\
+    Generate a dense ARFF file similar to Flect training data.
+    """
+    rnd = random.Random(1234)
+    fh = file_stream(filename, 'w', index=True)
+    print >> fh, '@relation bench-dense'
+    print >> fh, '@attribute sent_id string'
+    print >> fh, '@attribute word_id numeric'
+    for name in ['Lemma', 'Form'] + ['LemmaSuff_' + str(i)
+                                     for i in xrange(1, 9)]:
+        print >> fh, '@attribute ' + name + ' string'
+    print >> fh, '@attribute Tag_POS {N,V,A,D,P,R,C,J,Z}'
+    print >> fh, '@attribute LemmaFormDiff_Back string'
+    print >> fh, '@data'
+    for idx in xrange(instances):
+        lemma = rnd.choice(WORDS) + rnd.choice(WORDS)
+        vals = ['s' + str(idx / 20), str(idx % 20 + 1), arff_string(lemma),
+                arff_string(lemma.upper() if rnd.random() < 0.1 else lemma)]
+        vals.extend(arff_string(lemma[-i:]) for i in xrange(1, 9))
+        vals.append(rnd.choice('NVADPRCJZ'))
+        vals.append(arff_string('>' + str(rnd.randint(0, 3)) +
+                                rnd.choice(['', 'a', 'u', 'em', 'ou'])))
+        print >> fh, ','.join(vals)
+    fh.close()
+
+
+def generate_sparse(filename, instances, attribs=500):
+    """\
+    Generate a sparse ARFF file with mostly numeric (binary) attributes
+    and a string class attribute.
+    """
+    rnd = random.Random(1234)
+    fh = file_stream(filename, 'w', index=True)
+    print >> fh, '@relation bench-sparse'
+    for idx in xrange(attribs):
+        print >> fh, '@attribute f' + str(idx) + ' numeric'
+    print >> fh, '@attribute class string'
+    print >> fh, '@data'
+    for _ in xrange(instances):
+        cols = sorted(rnd.sample(xrange(attribs), 12))
+        vals = [str(col) + ' 1' for col in cols]
+        vals.append(str(attribs) + ' ' + arff_string(rnd.choice(WORDS)))
+        print >> fh, '{' + ','.join(vals) + '}'
+    fh.close()
+
+
+def measure(func, repeats):
+    """\
+    Run the given function repeatedly, return the best time and the last
+    result.
+    """
+    best = None
+    for _ in xrange(repeats):
+        start = time.time()
+        res = func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, res
+
+
+def bench_load(filenames, repeats, cache=False, workers=1):
+    """\
+    Measure ARFF loading throughput (from the ARFF files or from
+    their binary caches).
+    """
+    for filename in filenames:
+        if cache:
+            DataSet().load_from_arff(filename, cache=True)
+
+        def load():
+            data = DataSet()
+            data.load_from_arff(filename, cache=cache, workers=workers)
+            return data
+        elapsed, data = measure(load, repeats)
+        size = os.path.getsize(filename) / 1048576.0
+        print '%s %s: %d instances, %.1f MB, %.3f s, %.0f inst/s, %.2f MB/s' % \
+                ('cache' if cache else 'load', os.path.basename(filename),
+                 len(data), size, elapsed, len(data) / elapsed, size / elapsed)
+        if cache:
+            shutil.rmtree(cache_dir(filename))
+
+
+def bench_save(filenames, repeats):
+    """\
+    Measure ARFF writing throughput (the data sets are loaded first and
+    written into a temporary file).
+    """
+    for filename in filenames:
+        data = DataSet()
+        data.load_from_arff(filename)
+        out_file = filename + '.out'
+
+        def save():
+            data.save_to_arff(out_file)
+        elapsed, _ = measure(save, repeats)
+        size = os.path.getsize(out_file) / 1048576.0
+        print 'save %s: %d instances, %.1f MB, %.3f s, %.0f inst/s, %.2f MB/s' % \
+                (os.path.basename(filename), len(data), size, elapsed,
+                 len(data) / elapsed, size / elapsed)
+        os.remove(out_file)
+
+
+def bench_lines(filenames, repeats):
+    """\
+    Measure the throughput of reading text files by lines, using
+    file_stream and using a codecs reader over a plain/GZip file.
+    """
+    for filename in filenames:
+
+        def read_codecs():
+            raw = gzip.open(filename) if filename.endswith('.gz') \
+                    else open(filename)
+            fh = codecs.getreader('UTF-8')(raw)
+            lines = sum(1 for _ in fh)
+            fh.close()
+            return lines
+
+        def read_io():
+            fh = file_stream(filename)
+            lines = sum(1 for _ in fh)
+            fh.close()
+            return lines
+        size = os.path.getsize(filename) / 1048576.0
+        for label, func in [('codecs', read_codecs), ('io', read_io)]:
+            elapsed, lines = measure(func, repeats)
+            print 'lines-%s %s: %d lines, %.1f MB, %.3f s, %.0f lines/s, %.2f MB/s' % \
+                    (label, os.path.basename(filename), lines, size, elapsed,
+                     lines / elapsed, size / elapsed)
+
+
+def as_bunch_rows(data, target):
+    """\
+    Convert a data set to scikit-learn input instance by instance (the
+    way DataSet.as_bunch used to work), return the attribute matrix
+    and the target vector.
+    """
+    target = data.attrib_index(target)
+    rows = [data.instance(idx, 'list') for idx in xrange(len(data))]
+    y = np.array([inst[target] for inst in rows])
+    if data.is_sparse:
+        X = sp.vstack([sp.csr_matrix([val for idx, val in enumerate(inst)
+                                      if idx != target]) for inst in rows],
+                      'csr')
+    else:
+        X = np.matrix([[val for idx, val in enumerate(inst) if idx != target]
+                       for inst in rows])
+    return X, y
+
+
+def bench_bunch(filenames, repeats):
+    """\
+    Measure the conversion of data sets to scikit-learn input (with the last
+    attribute as the target), by DataSet.as_bunch and row by row.
+    """
+    for filename in filenames:
+        data = DataSet()
+        data.load_from_arff(filename)
+        target = data.attribs[-1].name
+        for label, func in [('rows', lambda: as_bunch_rows(data, target)),
+                            ('vect', lambda: data.as_bunch(target).data)]:
+            elapsed, res = measure(func, repeats)
+            X = res[0] if label == 'rows' else res
+            print 'bunch-%s %s: %d instances, %d features, %.3f s, %.0f inst/s' % \
+                    (label, os.path.basename(filename), X.shape[0], X.shape[1],
+                     elapsed, len(data) / elapsed)
+
+
+def display_usage():
+    """\
+    Display program usage information.
+    """
+    print >> sys.stderr, __doc__
+
+
+def main():
+    """\
+    Main application entry: parse command line and run the benchmark.
+    """
+    opts, args = getopt.getopt(sys.argv[1:], 'n:r:w:h')
+    instances = INSTANCES
+    repeats = REPEATS
+    workers = 1
+    show_help = False
+    for opt, arg in opts:
+        if opt == '-n':
+            instances = int(arg)
+        elif opt == '-r':
+            repeats = int(arg)
+        elif opt == '-w':
+            workers = int(arg)
+        elif opt == '-h':
+            show_help = True
+    if not args or args[0] not in ['load', 'cache', 'save', 'lines',
+                                   'bunch'] or show_help:
+        display_usage()
+        sys.exit(1)
+    test, filenames = args[0], args[1:]
+    temp_dir = None
+    if not filenames:
+        temp_dir = tempfile.mkdtemp(prefix='flect-bench-')
+        filenames = [os.path.join(temp_dir, 'dense.arff'),
+                     os.path.join(temp_dir, 'sparse.arff')]
+        generate_dense(filenames[0], instances)
+        generate_sparse(filenames[1], instances)
+    try:
+        if test == 'load':
+            bench_load(filenames, repeats, workers=workers)
+        elif test == 'cache':
+            bench_load(filenames, repeats, cache=True)
+        elif test == 'save':
+            bench_save(filenames, repeats)
+        elif test == 'lines':
+            bench_lines(filenames, repeats)
+        elif test == 'bunch':
+            bench_bunch(filenames, repeats)
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
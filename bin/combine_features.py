@@ -8,7 +8,7 @@ Various functions to generate new features using existing ones.
 Usage on ARFF files from the command line:
 
     ./combine_features.py [-s N:attr|-c|-a N:attr1,...|-n N:attr1,...] \\
-            in.arff out.arff
+            [-b N] in.arff out.arff
 
 -s = add substrings of up to N characters from the given attribute
      (negative = from the end)
@@ -18,13 +18,16 @@ Usage on ARFF files from the command line:
      The word must stay in the same sentence.
 
 The switches may be combined and will be applied in the above order.
+
+The data are processed in batches of about N instances (-b, default: 10000),
+which never split a sentence, and written out as they are processed.
 """
 
 from __future__ import unicode_literals
 
 import re
 import flect.flect
-from flect.dataset import Attribute, DataSet
+from flect.dataset import Attribute, DataSet, ArffWriter
 from flect.logf import log_info, log_warn
 from itertools import combinations
 import getopt
@@ -36,6 +39,7 @@ __date__ = "2013"
 
 
 SENT_ID_ATTR = 'sent_id'  # sentence ID attribute
+BATCH_SIZE = 10000  # default number of instances processed at once
 
 
 def concat_attrib(data, attribs, new_name=None, divider='', nonempty=False):
@@ -48,12 +52,13 @@ def concat_attrib(data, attribs, new_name=None, divider='', nonempty=False):
     attrib_list = [data.get_attrib(a).name for a in attribs]
     if new_name is None:
         new_name = '+'.join(attrib_list)
+    columns = [data.attrib_as_vect(a) for a in attrib_list]
     values = []
-    for inst in data:
+    for inst in zip(*columns):
         if nonempty:
-            val = [inst[a] if inst[a] is not None else '' for a in attrib_list]
+            val = [v if v is not None else '' for v in inst]
         else:
-            val = [inst[a] if inst[a] is not None else '?' for a in attrib_list]
+            val = [v if v is not None else '?' for v in inst]
         if not nonempty or '' not in val:
             values.append(divider.join(val))
         else:
@@ -137,6 +142,39 @@ def add_substr_attributes(data, sub_len, attrib):
         data.add_attrib(Attribute(new_name, 'string'), values)
 
 
+def sentence_batches(filename, batch_size):
+    """\
+    Read an ARFF file in batches of about the given size which do not split
+    sentences (so that neighboring words' attributes are available).
+    """
+    tail = None
+    for batch in DataSet.iter_arff(filename, batch_size=batch_size):
+        relation_name = batch.relation_name
+        if tail is not None:
+            tail.append(batch)
+            batch = tail
+        # no sentences: keep the batch as it is
+        if SENT_ID_ATTR not in batch.attribs_by_name:
+            yield batch
+            continue
+        # find the start of the last (possibly incomplete) sentence
+        sent_ids = batch.attrib_as_vect(SENT_ID_ATTR)
+        cut = len(sent_ids)
+        while cut > 0 and sent_ids[cut - 1] == sent_ids[-1]:
+            cut -= 1
+        # keep the last sentence for the next batch
+        if cut == 0:
+            tail = batch
+            continue
+        tail = batch.subset(cut, len(batch))
+        batch = batch.subset(0, cut)
+        batch.relation_name = relation_name
+        yield batch
+    if tail is not None:
+        tail.relation_name = relation_name
+        yield tail
+
+
 def display_usage():
     """\
     Display program usage information.
@@ -148,8 +186,9 @@ def main():
     """\
     Main application entry: parse command line and run the test.
     """
-    opts, filenames = getopt.getopt(sys.argv[1:], 'ca:s:n:')
+    opts, filenames = getopt.getopt(sys.argv[1:], 'ca:s:n:b:')
     show_help = False
+    batch_size = BATCH_SIZE
     combine_cng = False
     subsets = []
     neighbors = []
@@ -166,38 +205,42 @@ def main():
         elif opt == '-n':
             shift, attrs = arg.split(':', 1)
             neighbors.append((int(shift), re.split(r'[, ]+', attrs)))
+        elif opt == '-b':
+            batch_size = int(arg)
     # display help and exit
     if len(filenames) != 2 or not (combine_cng or substrs or
                                    subsets or neighbors) or show_help:
         display_usage()
         sys.exit(1)
-    # run the training
+    # process the data in batches
     filename_in, filename_out = filenames
-    data = DataSet()
-    log_info('Loading data: ' + filename_in)
-    data.load_from_arff(filename_in)
-    if substrs:
-        for (sub_len, attr) in substrs:
-            log_info(('Adding substrings from the %s of %s ' +
-                      'up to %d characters long ...') %
-                     (('beginning' if sub_len > 0 else 'end'),
-                      attr, abs(sub_len)))
-            add_substr_attributes(data, sub_len, attr)
-    if combine_cng:
-        log_info('Combining case, number, gender ...')
-        combine_tag_num_gen_cas(data)
-    if subsets:
-        for (set_size, set_attrs) in subsets:
-            log_info('Combining up to %d attributes from [%s] ...' %
-                     (set_size, ','.join(set_attrs)))
-            combine_subsets(data, set_attrs, set_size)
-    if neighbors:
-        for (shift, attrs) in neighbors:
-            log_info('Adding neighbor %d\'s attributes [%s] ...' %
-                     (shift, ','.join(attrs)))
-            add_neighbor_attributes(data, shift, attrs)
-    log_info('Saving data: ' + filename_out)
-    data.save_to_arff(filename_out)
+    log_info('Processing data: ' + filename_in + ' -> ' + filename_out)
+    writer = None
+    for data in sentence_batches(filename_in, batch_size):
+        if substrs:
+            for (sub_len, attr) in substrs:
+                log_info(('Adding substrings from the %s of %s ' +
+                          'up to %d characters long ...') %
+                         (('beginning' if sub_len > 0 else 'end'),
+                          attr, abs(sub_len)))
+                add_substr_attributes(data, sub_len, attr)
+        if combine_cng:
+            log_info('Combining case, number, gender ...')
+            combine_tag_num_gen_cas(data)
+        if subsets:
+            for (set_size, set_attrs) in subsets:
+                log_info('Combining up to %d attributes from [%s] ...' %
+                         (set_size, ','.join(set_attrs)))
+                combine_subsets(data, set_attrs, set_size)
+        if neighbors:
+            for (shift, attrs) in neighbors:
+                log_info('Adding neighbor %d\'s attributes [%s] ...' %
+                         (shift, ','.join(attrs)))
+                add_neighbor_attributes(data, shift, attrs)
+        if writer is None:
+            writer = ArffWriter(filename_out, data)
+        writer.write(data)
+    writer.close()
 
 
 if __name__ == '__main__':
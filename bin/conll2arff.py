@@ -22,7 +22,7 @@ import getopt
 import sys
 from flect.string_distances import edit_script
 from flect.varutil import file_stream
-from flect.dataset import DataSet
+from flect.dataset import ArffWriter
 
 __author__ = "Ondřej Dušek"
 __date__ = "2013"
@@ -35,13 +35,12 @@ def display_usage():
     print >> sys.stderr, __doc__
 
 
-def convert(in_file, out_file, feat_no, use_feat_names, cpos_chars):
+def read_conll(in_file, feat_no, use_feat_names, cpos_chars):
     """\
-    This does the conversion to ARFF.
+    Read the CoNLL file and yield instances as dictionaries.
     """
     fh_in = file_stream(in_file)
 
-    buf = []
     sent_id = 1
     word_id = 1
 
@@ -78,17 +77,36 @@ def convert(in_file, out_file, feat_no, use_feat_names, cpos_chars):
                 inst['Tag_FEAT' + str(feat_ord)] = feat
         # increase word number
         word_id += 1
-        # save the instance to the buffer
-        buf.append(inst)
-    # write this all out as ARFF
-    data = DataSet()
+        yield inst
+    fh_in.close()
+
+
+def convert(in_file, out_file, feat_no, use_feat_names, cpos_chars):
+    """\
+    This does the conversion to ARFF.
+    """
     attr_order = ['sent_id', 'word_id', 'Lemma', 'Form',
             'LemmaFormDiff_Front', 'LemmaFormDiff_Back']
     for i in xrange(1, 9):
         attr_order.append('LemmaSuff_' + str(i))
     attr_order.extend(['Tag_POS', 'Tag_CPOS'])
-    data.load_from_dict(buf, {'word_id': 'numeric'}, attr_order)
-    data.save_to_arff(out_file)
+    # find all the attributes, in the order of their appearance (all instances
+    # have the same attributes only if the number of POS features is fixed
+    # and their names are not used)
+    attr_set = set(attr_order)
+    for inst in read_conll(in_file, feat_no, use_feat_names, cpos_chars):
+        for attr in inst:
+            if attr not in attr_set:
+                attr_order.append(attr)
+                attr_set.add(attr)
+        if feat_no > 0 and not use_feat_names:
+            break
+    # write the instances out as ARFF, as they are read
+    writer = ArffWriter(out_file, [(attr, 'numeric' if attr == 'word_id'
+                                    else 'string') for attr in attr_order])
+    for inst in read_conll(in_file, feat_no, use_feat_names, cpos_chars):
+        writer.write(inst)
+    writer.close()
 
 
 def main():
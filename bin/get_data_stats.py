@@ -19,38 +19,40 @@ Prints the percentages of data:
 from __future__ import unicode_literals
 import sys
 import getopt
-import regex
 from flect.dataset import DataSet
+from flect.arffquery import count_matches
+from flect.colexpr import col
 from flect.logf import log_info
 
 __author__ = "Ondřej Dušek"
 __date__ = "2013"
 
 
-def print_feat(data, func, label):
-    filtered = data[func]
+def print_feat(count, total, label):
     print('Data %s: %d (%2.2f)' %
-          (label, len(filtered), float(len(filtered)) / len(data) * 100))
+          (label, count, float(count) / total * 100))
 
 
 def get_stats(data_file, train_file, source_attr, target_attr):
     """\
+    Count all the statistics in a single pass over the data file.
     """
-    data = DataSet()
-    log_info('Loading data from %s...' % data_file)
-    data.load_from_arff(data_file)
-    print_feat(data, lambda a, b: True, 'total')
-    print_feat(data, lambda _, i: not regex.match(r'^\p{P}', i[source_attr]),
-               'excluding punctuation')
-    print_feat(data, lambda _, i: i[source_attr].lower() != \
-               i[target_attr].lower(), 'inflected forms')
+    conditions = [('total', []),
+                  ('excluding punctuation',
+                   [~col(source_attr).matches(r'^\p{P}')]),
+                  ('inflected forms',
+                   [col(source_attr).lower() != col(target_attr).lower()])]
     if train_file is not None:
         log_info('Loading known data from %s...' % train_file)
-        train = DataSet()
-        train.load_from_arff(train_file)
-        known = {i[target_attr].lower() for i in train}
-        print_feat(data, lambda _, i: not i[target_attr].lower() in known,
-                   'unknown')
+        known = set()
+        for train in DataSet.iter_arff(train_file, select_attrib=[target_attr]):
+            known.update(val.lower() for val in train[target_attr])
+        conditions.append(('unknown',
+                           [~col(target_attr).lower().isin(known)]))
+    log_info('Loading data from %s...' % data_file)
+    counts = count_matches(data_file, [cond for _, cond in conditions])
+    for (label, _), count in zip(conditions, counts):
+        print_feat(count, counts[0], label)
 
 
 def display_usage():
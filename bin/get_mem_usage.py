@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+
+"""
+Printing the memory used by a data set loaded from an ARFF file, or by
+the data headers of a trained model, broken down by attributes.
+
+Usage: ./get_mem_usage.py [-m] [-s] [-f] [-e encoding] file
+
+-m = the file is a pickled model (default: ARFF file); for split models,
+     the total size of headers of all sub-models is shown as well
+
+-s = sort attributes by their total memory usage
+
+-f = freeze the headers first (see DataSet.freeze_headers)
+
+-e = encoding of the ARFF file (defaults to UTF-8)
+
+All sizes are in MB. Label sizes include the label strings. Types of frozen
+attributes are marked with *.
+"""
+
+from __future__ import unicode_literals
+import sys
+import getopt
+from flect.dataset import DataSet
+from flect.model import Model
+
+__author__ = "Ondřej Dušek"
+__date__ = "2013"
+
+
+MB = 1048576.0
+
+
+def print_usage(data, sort=False):
+    """\
+    Print the memory usage table of the given data set.
+    """
+    usage = data.memory_usage(deep=True)
+    attribs = zip(data.attribs, usage['attribs'])
+    if sort:
+        attribs.sort(key=lambda item: item[1][1] + item[1][2], reverse=True)
+    print '%-30s %-8s %9s %10s %10s %10s' % ('attribute', 'type', 'labels',
+                                             'label MB', 'value MB',
+                                             'total MB')
+    for attr, (name, labels, values) in attribs:
+        print '%-30s %-8s %9s %10.3f %10.3f %10.3f' % \
+                (name, attr.type + ('*' if attr.is_frozen else ''),
+                 attr.num_values if attr.type != 'numeric' else '-',
+                 labels / MB, values / MB, (labels + values) / MB)
+    for key in ['index', 'weights', 'headers']:
+        print '%-30s %43.3f' % ('(' + key + ')', usage[key] / MB)
+    print '%-30s %43.3f' % ('TOTAL (%d instances)' % len(data),
+                            usage['total'] / MB)
+
+
+def print_model_usage(model_file, sort=False, freeze=False):
+    """\
+    Print the memory usage of data headers of the given model (and the
+    total for all its sub-models).
+    """
+    model = Model.load_from_file(model_file)
+    if freeze:
+        model.data_headers.freeze_headers()
+    print_usage(model.data_headers, sort)
+    models = getattr(model, 'models', None)
+    if models:
+        if isinstance(models, dict):
+            models = models.values()
+        total = 0
+        for submodel in models:
+            if freeze:
+                submodel.data_headers.freeze_headers()
+            total += submodel.data_headers.memory_usage(deep=True)['total']
+        print '%-30s %43.3f' % ('SUB-MODELS (%d)' % len(models), total / MB)
+
+
+def display_usage():
+    """\
+    Display program usage information.
+    """
+    print >> sys.stderr, __doc__
+
+
+def main():
+    """\
+    Main application entry.
+    """
+    opts, filenames = getopt.getopt(sys.argv[1:], 'msfe:')
+    is_model = False
+    sort = False
+    freeze = False
+    encoding = 'UTF-8'
+    for opt, arg in opts:
+        if opt == '-m':
+            is_model = True
+        elif opt == '-s':
+            sort = True
+        elif opt == '-f':
+            freeze = True
+        elif opt == '-e':
+            encoding = arg
+    if len(filenames) != 1:
+        display_usage()
+        sys.exit(1)
+    if is_model:
+        print_model_usage(filenames[0], sort, freeze)
+    else:
+        data = DataSet()
+        data.load_from_arff(filenames[0], encoding)
+        if freeze:
+            data.freeze_headers()
+        print_usage(data, sort)
+
+
+if __name__ == '__main__':
+    main()
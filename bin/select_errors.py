@@ -6,19 +6,27 @@
 Select erroneously classified examples and save them to a separate data set.
 
 Usage:
-./select_errors.py [-i] -g gold_attr [-p predict_attr] in.arff out.arff
+./select_errors.py [-i] [-a] [-b batch_size] -g gold_attr [-p predict_attr] \\
+        in.arff out.arff
 
 Predicted attribute name defaults to 'PREDICTED'.
+
+The data are processed in batches of 10000 instances unless -b is set.
 """
 
 from __future__ import unicode_literals
 
-from flect.dataset import DataSet, Attribute
+from flect.arffquery import ArffQuery
+from flect.colexpr import col
 from flect.logf import log_info
 import getopt
 import sys
 
 
+# default number of instances processed at once
+BATCH_SIZE = 10000
+
+
 def display_usage():
     """\
     Display program usage information.
@@ -30,12 +38,13 @@ def main():
     """\
     Main application entry: parse command line and run the test.
     """
-    opts, filenames = getopt.getopt(sys.argv[1:], 'g:p:ai')
+    opts, filenames = getopt.getopt(sys.argv[1:], 'g:p:aib:')
     show_help = False
     annot_errors = False
     gold = None
     predicted = 'PREDICTED'
     ignore_case = False
+    batch_size = BATCH_SIZE
     for opt, arg in opts:
         if opt == '-g':
             gold = arg
@@ -45,29 +54,23 @@ def main():
             annot_errors = True
         elif opt == '-i':
             ignore_case = True
+        elif opt == '-b':
+            batch_size = int(arg)
     # display help and exit
     if len(filenames) != 2 or not gold or show_help:
         display_usage()
         sys.exit(1)
-    # run the training
+    # run the query
     filename_in, filename_out = filenames
-    data = DataSet()
-    log_info('Loading data: ' + filename_in)
-    data.load_from_arff(filename_in)
+    gold_val, pred_val = col(gold), col(predicted)
     if ignore_case:
-        cmp_func = lambda a, b: a.lower() != b.lower()
-    else:
-        cmp_func = lambda a, b: a != b
-    if annot_errors:
-        log_info('Annotating errors...')
-        err_ind = ['ERR' if cmp_func(i[gold], i[predicted]) else ''
-                   for i in data]
-        data.add_attrib(Attribute('ERROR_IND', 'string'), err_ind)
-    else:
-        log_info('Selecting errors...')
-        data = data[lambda _, i: cmp_func(i[gold], i[predicted])]
+        gold_val, pred_val = gold_val.lower(), pred_val.lower()
+    query = ArffQuery(where=[gold_val != pred_val],
+                      mark='ERROR_IND' if annot_errors else None,
+                      mark_value='ERR')
+    log_info('Loading data: ' + filename_in)
     log_info('Saving data: ' + filename_out)
-    data.save_to_arff(filename_out)
+    query.run(filename_in, filename_out, batch_size=batch_size)
 
 
 if __name__ == '__main__':
@@ -8,7 +8,7 @@ Testing trained models on given data.
 Usage: ./flect_test.py -h for this help
        ./flect_test.py -s source_attr -t target_attr -m model1 \\
                         [-m model2 ...] [-o [perc:]train_set.arff] \\
-                        [-i] [-p] \\
+                        [-i] [-p] [-b batch_size] \\
                         test_set.arff output.arff
 
 -s = name of the source ARFF attribute (lemma)
@@ -24,21 +24,30 @@ Usage: ./flect_test.py -h for this help
 
 -p = POS attribute (to evaluate performance in individual POSes)
 
+-b = number of instances to be read and classified at once (defaults
+     to 10000)
+
 """
 
 from __future__ import unicode_literals
 import sys
 import getopt
-import regex
+from collections import OrderedDict
 from flect.dataset import DataSet, Attribute
+from flect.colexpr import col
 from flect.model import Model
 from flect.flect import inflect
 from flect.logf import log_info
+from flect.varutil import file_stream
 
 __author__ = "Ondřej Dušek"
 __date__ = "2013"
 
 
+# default number of instances processed at once
+BATCH_SIZE = 10000
+
+
 def display_usage():
     """\
     Display program usage information.
@@ -46,70 +55,93 @@ def display_usage():
     print >> sys.stderr, __doc__
 
 
-def evaluate_oov(data, source_attr, target_attr, forms_attr,
-                 oov_test_file, oov_part):
+def load_known(oov_test_file, source_attr, target_attr, oov_part,
+               batch_size):
     """\
-    Out-of-vocabulary evaluation
+    Load sets of known (lowercased) forms and lemmas from the given file.
     """
     log_info('Loading known lemmas and forms from: ' + oov_test_file)
-    train = DataSet()
-    train.load_from_arff(oov_test_file)
+    sample = None
     if oov_part < 1:
         log_info('Using only %f-part of the file.' % oov_part)
-        train = train.subset(0, int(round(oov_part * len(train))), copy=False)
-    known_forms = {i[target_attr].lower() for i in train}
-    known_lemmas = {i[source_attr].lower() for i in train}
-    oov_forms = [1 if i[target_attr].lower() not in known_forms else 0
-                 for i in data]
-    oov_lemmas = [1 if i[source_attr] not in known_lemmas else 0
-                  for i in data]
-    data.add_attrib(Attribute('OOV_FORM', 'numeric'), oov_forms)
-    data.add_attrib(Attribute('OOV_LEMMA', 'numeric'), oov_lemmas)
-    oov_forms_count = sum(oov_forms)
+        sample = ('head', float(oov_part))
+    known_forms = set()
+    known_lemmas = set()
+    for train in DataSet.iter_arff(oov_test_file, batch_size=batch_size,
+                                   select_attrib=[source_attr, target_attr],
+                                   sample=sample):
+        known_forms.update(i[target_attr].lower() for i in train)
+        known_lemmas.update(i[source_attr].lower() for i in train)
+    return known_forms, known_lemmas
+
+
+def evaluate_oov(data, scores, source_attr, target_attr, forms_attr,
+                 known_forms, known_lemmas):
+    """\
+    Out-of-vocabulary evaluation
+    """
+    oov_forms = (~col(target_attr).lower().isin(known_forms)).mask(data)
+    oov_lemmas = (~col(source_attr).isin(known_lemmas)).mask(data)
+    data.add_attrib(Attribute('OOV_FORM', 'numeric'), oov_forms.astype(int))
+    data.add_attrib(Attribute('OOV_LEMMA', 'numeric'), oov_lemmas.astype(int))
     oov_forms_good = count_correct(data, target_attr, forms_attr,
-                                   lambda i: i['OOV_FORM'])
-    print_score(oov_forms_good, oov_forms_count, 'OOV forms')
-    oov_lemmas_count = sum(oov_lemmas)
+                                   col('OOV_FORM') == 1)
+    add_score(scores, 'OOV forms', oov_forms_good, int(oov_forms.sum()))
     oov_lemmas_good = count_correct(data, target_attr, forms_attr,
-                                    lambda i: i['OOV_LEMMA'])
-    print_score(oov_lemmas_good, oov_lemmas_count, 'OOV lemmas')
+                                    col('OOV_LEMMA') == 1)
+    add_score(scores, 'OOV lemmas', oov_lemmas_good, int(oov_lemmas.sum()))
 
 
-def evaluate_poses(data, gold_attr, predict_attr, pos_attr):
+def evaluate_poses(data, scores, gold_attr, predict_attr, pos_attr):
     """\
-    Print scores for different POSes.
+    Add scores for different POSes.
     """
-    poses = data.split(lambda _, i: i[pos_attr])
+    poses = data.split(col(pos_attr))
     for pos, pos_data in poses.iteritems():
         good = count_correct(pos_data, gold_attr, predict_attr)
-        print_score(good, len(pos_data), 'POS = ' + pos)
+        add_score(scores, 'POS = ' + pos, good, len(pos_data))
 
 
-def evaluate_nopunct(data, lemma_attr, gold_attr, predict_attr):
+def evaluate_nopunct(data, scores, lemma_attr, gold_attr, predict_attr):
     """\
     Evaluate on data excluding punctuation.
     """
-    nopunct = data[lambda _, i: not regex.match(r'^\p{P}', i[lemma_attr])]
+    nopunct = data.where(~col(lemma_attr).matches(r'^\p{P}'))
     good = count_correct(nopunct, gold_attr, predict_attr)
-    print_score(good, len(nopunct), 'Excluding punctuation lemmas')
+    add_score(scores, 'Excluding punctuation lemmas', good, len(nopunct))
 
 
-def evaluate_nolemma(data, lemma_attr, gold_attr, predict_attr):
+def evaluate_nolemma(data, scores, lemma_attr, gold_attr, predict_attr):
     """\
     Evaluate on data where the target forms are not equal to lemmas.
     """
-    nolemma = data[lambda _, i: i[lemma_attr].lower() != i[gold_attr].lower()]
+    nolemma = data.where(col(lemma_attr).lower() != col(gold_attr).lower())
     good = count_correct(nolemma, gold_attr, predict_attr)
-    print_score(good, len(nolemma), 'Target forms not equal to lemma')
+    add_score(scores, 'Target forms not equal to lemma', good, len(nolemma))
 
 
-def count_correct(data, gold_attr, predict_attr, cond=lambda _: True):
+def count_correct(data, gold_attr, predict_attr, cond=None):
     """\
     Return the number of correctly predicted forms on the given data set.
-    If cond is set, count only the instances that satisfy cond.
+    If cond (a column expression condition) is set, count only
+    the instances that satisfy cond.
     """
-    return sum(1 for i in data if cond(i) and
-               i[gold_attr].lower() == i[predict_attr].lower())
+    correct = col(gold_attr).lower() == col(predict_attr).lower()
+    if cond is not None:
+        correct = cond & correct
+    return int(correct.mask(data).sum())
+
+
+def add_score(scores, key, good, total, label=None):
+    """\
+    Add the numbers of correctly predicted and all items to the scores
+    collected under the given key (which is also used as the label
+    unless a label is given).
+    """
+    if key not in scores:
+        scores[key] = [label if label is not None else key, 0, 0]
+    scores[key][1] += good
+    scores[key][2] += total
 
 
 def print_score(good, total, label):
@@ -122,56 +154,76 @@ def print_score(good, total, label):
 
 
 def test_models(file_in, file_out, model_files, source_attr, target_attr,
-                oov_test_file, oov_part, pos_attr, test_indiv):
+                oov_test_file, oov_part, pos_attr, test_indiv,
+                batch_size=BATCH_SIZE):
     """\
     Test all the given models on the selected file and save the target.
 
     If oov_test_file is set, performs also OOV evaluation.
     If test_pos is True, prints detailed results for various POSs.
+
+    The testing data are processed in batches of the given size.
     """
+    # load all models
+    models = []
+    for model_file in model_files:
+        log_info('Loading model: ' + model_file)
+        models.append(Model.load_from_file(model_file))
+    # load training data for OOV tests
+    if oov_test_file:
+        known_forms, known_lemmas = load_known(oov_test_file, source_attr,
+                                               target_attr, oov_part,
+                                               batch_size)
+    scores = OrderedDict()
+    pos_scores = {}
     # load testing data
     log_info('Loading data: ' + file_in)
-    data = DataSet()
-    data.load_from_arff(file_in)
-    forms = data[source_attr]
-    # apply all models
-    for model_num, model_file in enumerate(model_files, start=1):
-        model = Model.load_from_file(model_file)
-        log_info('Applying model: ' + model_file)
-        rules = model.classify(data)
-        output_attr = 'OUTPUT_M' + str(model_num)
-        data.add_attrib(Attribute(output_attr, 'string'), rules)
-        if test_indiv:
-            good = count_correct(data, model.class_attr, output_attr)
-            print_score(good, len(data), 'Model accuracy')
-        forms = [inflect(form, rule) for form, rule in zip(forms, rules)]
-        forms_attr = 'FORMS_M' + str(model_num)
-        data.add_attrib(Attribute(forms_attr, 'string'), forms)
-    # test the final performance
-    log_info('Evaluating...')
-    good = count_correct(data, target_attr, forms_attr)
-    print_score(good, len(data), 'ALL')
-    # evaluate without punctuation
-    evaluate_nopunct(data, source_attr, target_attr, forms_attr)
-    # evaluate forms different from lemma
-    evaluate_nolemma(data, source_attr, target_attr, forms_attr)
-    # load training data for OOV tests, evaluate on OOV
-    if oov_test_file:
-        evaluate_oov(data, source_attr, target_attr, forms_attr,
-                     oov_test_file, oov_part)
-    # test on different POSes
-    if pos_attr:
-        evaluate_poses(data, target_attr, forms_attr, pos_attr)
-    # save the classification results
     log_info('Saving data: ' + file_out)
-    data.save_to_arff(file_out)
+    fh = file_stream(file_out, 'w', index=True)
+    for batch_num, data in enumerate(DataSet.iter_arff(file_in,
+                                                       batch_size=batch_size)):
+        forms = data[source_attr]
+        # apply all models
+        for model_num, model in enumerate(models, start=1):
+            rules = model.classify(data) if len(data) else []
+            output_attr = 'OUTPUT_M' + str(model_num)
+            data.add_attrib(Attribute(output_attr, 'string'), rules)
+            if test_indiv:
+                good = count_correct(data, model.class_attr, output_attr)
+                add_score(scores, output_attr, good, len(data),
+                          'Model accuracy')
+            forms = [inflect(form, rule) for form, rule in zip(forms, rules)]
+            forms_attr = 'FORMS_M' + str(model_num)
+            data.add_attrib(Attribute(forms_attr, 'string'), forms)
+        # test the final performance
+        good = count_correct(data, target_attr, forms_attr)
+        add_score(scores, 'ALL', good, len(data))
+        # evaluate without punctuation
+        evaluate_nopunct(data, scores, source_attr, target_attr, forms_attr)
+        # evaluate forms different from lemma
+        evaluate_nolemma(data, scores, source_attr, target_attr, forms_attr)
+        # evaluate on OOV
+        if oov_test_file:
+            evaluate_oov(data, scores, source_attr, target_attr, forms_attr,
+                         known_forms, known_lemmas)
+        # test on different POSes
+        if pos_attr:
+            evaluate_poses(data, pos_scores, target_attr, forms_attr,
+                           pos_attr)
+        # save the classification results
+        data.save_to_arff(fh, None, headers=(batch_num == 0))
+    fh.close()
+    # print the scores
+    log_info('Evaluating...')
+    for label, good, total in scores.values() + sorted(pos_scores.values()):
+        print_score(good, total, label)
 
 
 def main():
     """\
     Main application entry: parse command line and run the test.
     """
-    opts, filenames = getopt.getopt(sys.argv[1:], 'm:s:t:hio:p:')
+    opts, filenames = getopt.getopt(sys.argv[1:], 'm:s:t:hio:p:b:')
     show_help = False
     models = []
     source_attr = None
@@ -180,6 +232,7 @@ def main():
     train_part = 1.0
     pos_attr = None
     eval_indiv = False
+    batch_size = BATCH_SIZE
     for opt, arg in opts:
         if opt == '-m':
             models.append(arg)
@@ -199,6 +252,8 @@ def main():
             pos_attr = arg
         elif opt == '-i':
             eval_indiv = True
+        elif opt == '-b':
+            batch_size = int(arg)
     # display help and exit
     if not models or len(filenames) != 2 or \
             not source_attr or not target_attr or show_help:
@@ -206,7 +261,7 @@ def main():
         sys.exit(1)
     # run the training
     test_models(filenames[0], filenames[1], models, source_attr, target_attr,
-                train_file, train_part, pos_attr, eval_indiv)
+                train_file, train_part, pos_attr, eval_indiv, batch_size)
 
 
 if __name__ == '__main__':
@@ -15,7 +15,9 @@ Locations of config.py, model-file.pickle.gz and classif-file are assumed
 to be relative to the work-dir.
 
 If divide_func is specified in the configuration file, a SplitModel is
-trained instead of Model.
+trained instead of Model. The attributes it uses may be listed in divide_attr
+(otherwise, all data attributes are loaded unless all string literals in
+divide_func are attribute names).
 
 If unfold_pattern is specified, subdirectories are created in the main
 working directory for each model variant.
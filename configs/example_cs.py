@@ -48,5 +48,13 @@ config = {
           'classifier_params': {'penalty': ['l1', 'l2'],
                                 'C': [1, 10, 100, 1000],
                                 'tol': [0.01, 0.001, 0.0001]},
-          'unfold_pattern': '^(penalty|C|tol)$'
+          'unfold_pattern': '^(penalty|C|tol)$',
+
+          # Create binary caches of the training and testing ARFF files (next to the files,
+          # as <file>.cache directories) so that they load faster the next time.
+          # Existing valid caches are always used.
+          'cache_data': True,
+
+          # Number of processes used to parse the ARFF files.
+          'load_workers': 4,
           }
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Binary columnar cache for ARFF files.
+
+The cache is a directory next to the ARFF file (<file>.cache) which
+contains one NumPy array per attribute in the column store format (label
+codes for nominal and string attributes, values for numeric ones, see
+flect.colstore), the instance weights, and a pickle with the headers
+(including label tables). It is keyed by the source file path, size,
+modification time and encoding, so a stale cache is never used.
+The arrays are loaded memory-mapped and used by data sets as they are.
+"""
+
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import cPickle as pickle
+import numpy as np
+import scipy.sparse as sp
+from logf import log_info, log_warn
+from colstore import encode
+
+__author__ = "Ondřej Dušek"
+__date__ = "2013"
+
+
+# cache format version (increase on incompatible changes)
+CACHE_VERSION = 2
+# cache directory suffix
+CACHE_SUFFIX = '.cache'
+# header pickle file name
+META_FILE = 'meta.pickle'
+
+
+def cache_dir(filename):
+    """\
+    Return the cache directory for the given ARFF file.
+    """
+    return filename + CACHE_SUFFIX
+
+
+def cache_key(filename, encoding):
+    """\
+    Return the key identifying the given version of an ARFF file (absolute
+    path, size, modification time and encoding).
+    """
+    stat = os.stat(filename)
+    return (os.path.abspath(filename), stat.st_size, stat.st_mtime, encoding)
+
+
+def load_cache(filename, encoding, headers_only=False):
+    """\
+    Load the cache for the given ARFF file. Return None if the cache does
+    not exist or is not valid for the current version of the file.
+
+    Otherwise, return a dictionary with the keys relation_name, attribs,
+    is_sparse, and (unless headers_only is set) columns (list of per-attribute
+    arrays in the column store format; dense data sets only), matrix (CSR
+    matrix; sparse data sets only) and weights. All arrays are
+    memory-mapped read-only.
+    """
+    if not isinstance(filename, basestring) or not os.path.isfile(filename):
+        return None
+    dirname = cache_dir(filename)
+    try:
+        fh = open(os.path.join(dirname, META_FILE), 'rb')
+        meta = pickle.load(fh)
+        fh.close()
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if meta.get('version') != CACHE_VERSION or \
+            meta.get('key') != cache_key(filename, encoding):
+        return None
+    ret = {'relation_name': meta['relation_name'],
+           'attribs': meta['attribs'],
+           'is_sparse': meta['is_sparse']}
+    if not headers_only:
+        try:
+            _load_arrays(dirname, meta, ret)
+        except (IOError, OSError, ValueError):
+            # the cache has been removed or replaced in the meantime
+            return None
+    log_info('Using cached data from ' + dirname)
+    return ret
+
+
+def save_cache(filename, encoding, data):
+    """\
+    Save the cache for the given ARFF file, taking the values from the given
+    (loaded) DataSet. Failures to write the cache are logged and ignored.
+    """
+    key = cache_key(filename, encoding)
+    dirname = cache_dir(filename)
+    try:
+        tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(dirname) + '-',
+                                   dir=os.path.dirname(os.path.abspath(dirname)))
+    except (IOError, OSError) as e:
+        log_warn('Cannot create data cache for ' + filename + ': ' + str(e))
+        return
+    try:
+        meta = {'version': CACHE_VERSION,
+                'key': key,
+                'relation_name': data.relation_name,
+                'attribs': data.attribs,
+                'is_sparse': data.is_sparse,
+                'length': len(data)}
+        np.save(os.path.join(tmp_dir, 'weights.npy'),
+                np.array(data.inst_weights, dtype=np.float64))
+        if data.is_sparse:
+            matrix = data.data.tocsr()
+            matrix.sort_indices()
+            for name in ['data', 'indices', 'indptr']:
+                np.save(os.path.join(tmp_dir, name + '.npy'),
+                        getattr(matrix, name))
+        else:
+            for idx, attrib in enumerate(data.attribs):
+                col = encode(data.attrib_as_array(idx),
+                             attrib.type == 'numeric')
+                np.save(os.path.join(tmp_dir, 'attr-' + str(idx) + '.npy'),
+                        col)
+        # the header file is written last, so that incomplete caches are
+        # never used
+        fh = open(os.path.join(tmp_dir, META_FILE), 'wb')
+        pickle.dump(meta, fh, pickle.HIGHEST_PROTOCOL)
+        fh.close()
+        if os.path.isdir(dirname):
+            shutil.rmtree(dirname)
+        os.rename(tmp_dir, dirname)
+        log_info('Data cache saved to ' + dirname)
+    except (IOError, OSError) as e:
+        log_warn('Cannot create data cache for ' + filename + ': ' + str(e))
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _load_arrays(dirname, meta, ret):
+    """\
+    Load the data arrays from the cache directory, store them in the
+    ret dictionary.
+    """
+    ret['weights'] = _load_array(dirname, 'weights')
+    if meta['is_sparse']:
+        ret['matrix'] = sp.csr_matrix((_load_array(dirname, 'data'),
+                                       _load_array(dirname, 'indices'),
+                                       _load_array(dirname, 'indptr')),
+                                      shape=(meta['length'],
+                                             len(meta['attribs'])))
+    else:
+        ret['columns'] = [_load_array(dirname, 'attr-' + str(idx))
+                          for idx in xrange(len(meta['attribs']))]
+
+
+def _load_array(dirname, name):
+    """\
+    Load one memory-mapped array from the cache directory.
+    """
+    return np.load(os.path.join(dirname, name + '.npy'), mmap_mode='r')
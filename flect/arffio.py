@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Low-level ARFF format handling: splitting data lines and value lists
+into individual values, quoting values for output, splitting the data
+section into parts.
+
+The tokenizer takes a fast path using plain string splitting for lines that
+contain no quoted values and only scans the line character by character
+if quotes are present.
+"""
+
+from __future__ import unicode_literals
+import re
+
+__author__ = "Ondřej Dušek"
+__date__ = "2013"
+
+
+# ARFF special characters for regexps
+SPEC_CHARS = r'[\n\r\'"\\\t%]'
+
+# unescaping special characters in quoted values
+_UNESCAPE = re.compile(r'\\(' + SPEC_CHARS + ')')
+# escaping special characters
+_ESCAPE = re.compile('(' + SPEC_CHARS + ')')
+# values that need to be quoted
+_NEEDS_QUOTES = re.compile('(' + SPEC_CHARS + '|[{}?, ])')
+# instance weight value
+_WEIGHT = re.compile(r'^([0-9]+(\.[0-9]*)?|\.[0-9]+)$')
+
+
+def unescape(value):
+    """\
+    Remove backslash escaping of special characters from a (previously
+    quoted) ARFF value.
+    """
+    if '\\' not in value:
+        return value
+    return _UNESCAPE.sub(r'\1', value)
+
+
+def quote(value):
+    """\
+    Return an ARFF-output safe version of a string value (with special
+    characters escaped, quoted if needed).
+    """
+    if value != '' and not _NEEDS_QUOTES.search(value):
+        return value
+    return "'" + _ESCAPE.sub(r'\\\1', value) + "'"
+
+
+def split_weight(line):
+    """\
+    Split an instance weight ("..., {weight}") from the end of an ARFF
+    data line. Return the rest of the line and the weight (defaults to 1.0).
+    """
+    if line.endswith('}'):
+        brace = line.rfind('{')
+        if brace > 0:
+            head = line[:brace].rstrip()
+            weight = line[brace + 1:-1]
+            if head.endswith(',') and _WEIGHT.match(weight):
+                return head[:-1], float(weight)
+    return line, 1.0
+
+
+def split_dense(line, limit=None):
+    """\
+    Split a dense ARFF data line (without weight) or a list of nominal
+    values into a list of values. Quoted values are unquoted and unescaped,
+    missing values ('?') are returned as None.
+
+    If limit is set, at most the given number of values is returned and
+    the rest of the line is not parsed.
+    """
+    # fast path: no quoted values
+    if '\'' not in line and '"' not in line:
+        if limit is None:
+            fields = line.split(',')
+        else:
+            fields = line.split(',', limit)[:limit]
+        if ' ' in line or '\t' in line:
+            fields = [field.strip() for field in fields]
+        if '?' in line:
+            fields = [None if field == '?' else field for field in fields]
+        return fields
+    return _split_quoted(line, False, limit)
+
+
+def split_sparse(line):
+    """\
+    Split the inside of a sparse ARFF data line (without braces and weight)
+    into a list of (index, value) pairs. Values are unquoted and
+    unescaped, missing values ('?') are returned as None.
+    """
+    if not line or line.isspace():
+        return []
+    # fast path: no quoted values
+    if '\'' not in line and '"' not in line:
+        fields = []
+        for field in line.split(','):
+            try:
+                idx, val = field.split(None, 1)
+            except ValueError:
+                raise ValueError('Invalid sparse field "' + field + '"')
+            val = val.rstrip()
+            fields.append((int(idx), val if val != '?' else None))
+        return fields
+    return _split_quoted(line, True)
+
+
+def _split_quoted(line, sparse, limit=None):
+    """\
+    Split a line containing quoted values by scanning it from left to right
+    (slow path for split_dense and split_sparse), stopping after the given
+    number of values if limit is set.
+    """
+    fields = []
+    pos = 0
+    end = len(line)
+    while True:
+        # sparse fields: read the index first
+        if sparse:
+            while pos < end and line[pos].isspace():
+                pos += 1
+            idx_end = pos
+            while idx_end < end and line[idx_end].isdigit():
+                idx_end += 1
+            if idx_end == pos:
+                raise ValueError('Invalid sparse field index at "' +
+                                 line[pos:] + '"')
+            idx = int(line[pos:idx_end])
+            pos = idx_end
+        while pos < end and line[pos] in ' \t':
+            pos += 1
+        # quoted value: find the matching unescaped quote
+        if pos < end and line[pos] in '\'"':
+            close = _find_closing_quote(line, pos)
+            val = unescape(line[pos + 1:close])
+            comma = line.find(',', close + 1)
+        # plain value: read up to the next comma
+        else:
+            comma = line.find(',', pos)
+            val = line[pos:comma if comma != -1 else end].strip()
+            if val == '?':
+                val = None
+        fields.append((idx, val) if sparse else val)
+        if comma == -1 or len(fields) == limit:
+            return fields
+        pos = comma + 1
+
+
+def _find_closing_quote(line, start):
+    """\
+    Return the position of the quote that closes a value starting at
+    the given position (skipping quotes escaped by a backslash).
+    """
+    quote = line[start]
+    pos = start
+    while True:
+        pos = line.find(quote, pos + 1)
+        if pos == -1:
+            raise ValueError('Unterminated quoted value "' + line[start:] + '"')
+        # count the backslashes right before the quote
+        escapes = 0
+        while line[pos - 1 - escapes] == '\\':
+            escapes += 1
+        if escapes % 2 == 0:
+            return pos
+
+
+def split_data_section(fh, encoding, parts):
+    """\
+    Given a binary (possibly GZip) stream with an ARFF file, find its
+    data section and split it into the given number of parts at line
+    boundaries. Return a list of (start, end) byte offsets (in the
+    uncompressed data).
+    """
+    # find the start of the data section
+    while True:
+        line = fh.readline()
+        if not line or line.decode(encoding).strip().lower().startswith('@data'):
+            break
+    start = fh.tell()
+    # find the end of the file
+    try:
+        fh.seek(0, 2)
+    except (IOError, ValueError):
+        # GZip streams do not support seeking from the end
+        while fh.read(1048576):
+            pass
+    end = fh.tell()
+    # find line boundaries close to equal parts
+    bounds = [start]
+    for part in xrange(1, parts):
+        pos = start + (end - start) * part / parts
+        if pos <= bounds[-1]:
+            continue
+        fh.seek(pos - 1)
+        fh.readline()
+        pos = fh.tell()
+        if bounds[-1] < pos < end:
+            bounds.append(pos)
+    bounds.append(end)
+    return zip(bounds[:-1], bounds[1:])
+
+
+def count_data_lines(fh, encoding):
+    """\
+    Given a binary (possibly GZip) stream with an ARFF file, return the
+    number of instances in its data section (without decoding or parsing
+    them).
+    """
+    for line in fh:
+        if line.decode(encoding).strip().lower().startswith('@data'):
+            break
+    count = 0
+    for line in fh:
+        line = line.strip()
+        if line and not line.startswith(b'%'):
+            count += 1
+    return count
+
+
+def read_lines(fh, start, end, encoding):
+    """\
+    Read and decode lines from a binary stream, given the byte offsets
+    of the first line and the end of the last line.
+    """
+    fh.seek(start)
+    pos = start
+    while pos < end:
+        line = fh.readline()
+        if not line:
+            break
+        pos += len(line)
+        yield line.decode(encoding)
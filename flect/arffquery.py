@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Streaming queries over ARFF files: selecting instances by conditions,
+projecting attributes, counting and group-by counting.
+
+The input file is read in a single pass, in batches (see DataSet.iter_arff),
+and only the attributes needed by the query are parsed. Results are written
+out as ARFF or tab-separated values as soon as each batch is processed.
+
+Conditions are column expression conditions (see flect.colexpr), evaluated
+on each batch at once, or strings of the form "attr OP value", where OP is:
+
+=  (equal), != (not equal), ~ (regular expression search),
+!~ (regular expression does not match).
+
+Values prefixed with @ refer to another attribute, ? stands for a missing
+value. Regular expressions may use Unicode properties such as \\p{P}.
+"""
+
+from __future__ import unicode_literals
+import math
+import regex
+import numpy as np
+from dataset import DataSet, Attribute, ArffWriter
+from colexpr import Condition, col
+from varutil import file_stream
+
+__author__ = "Ondřej Dušek"
+__date__ = "2013"
+
+
+# 'attr OP value' condition syntax
+CONDITION_SYNTAX = regex.compile(r'^\s*([^!=~\s]+)\s*(!=|=|!~|~)\s?(.*)$',
+                                 regex.DOTALL)
+
+
+def parse_condition(spec, ignore_case=False):
+    """\
+    Create a column expression condition (see flect.colexpr) from an
+    'attr OP value' string (see the module description). If ignore_case
+    is set, string values are compared case-insensitively.
+    """
+    match = CONDITION_SYNTAX.match(spec)
+    if not match:
+        raise ValueError('Invalid condition: ' + spec)
+    attrib, op, value = match.groups()
+    if op.endswith('~'):
+        cond = col(attrib).matches(value, ignore_case)
+    else:
+        expr = col(attrib)
+        if value.startswith('@'):
+            value = col(value[1:])
+        elif value == '?':
+            value = None
+        if ignore_case:
+            expr = expr.lower()
+            value = value.lower() if value is not None else None
+        cond = expr == value
+    if op.startswith('!'):
+        return ~cond
+    return cond
+
+
+class ArffQuery(object):
+    """\
+    A streaming query over an ARFF file: select instances that satisfy all
+    the given conditions, then either write them out (possibly only some
+    of their attributes), mark them in a new attribute, count them, or
+    count them by values of some attributes.
+    """
+
+    def __init__(self, select=None, where=[], group_by=None, count=False,
+                 mark=None, mark_value='1'):
+        """\
+        Create a query.
+
+        @param select: names of the output attributes (None = all)
+        @param where: a list of conditions (column expression conditions \
+            or 'attr OP value' strings) that must all hold
+        @param group_by: names of attributes to count instances by
+        @param count: just count the instances
+        @param mark: instead of removing instances that do not satisfy \
+            the conditions, add a string attribute of this name which \
+            contains mark_value for the selected instances
+        @param mark_value: value of the mark attribute for selected instances
+        """
+        self.select = select
+        self.where = [cond if isinstance(cond, Condition)
+                      else parse_condition(cond) for cond in where]
+        # all the conditions combined into one
+        self.cond = (reduce(lambda first, second: first & second, self.where)
+                     if self.where else None)
+        self.group_by = group_by
+        self.count = count
+        self.mark = mark
+        self.mark_value = mark_value
+
+    def get_load_attr(self):
+        """\
+        Return the names of all attributes needed by the query (None if
+        all attributes are needed).
+        """
+        if self.select is None and not (self.count or self.group_by):
+            return None
+        attribs = set(self.select or [])
+        attribs.update(self.group_by or [])
+        for cond in self.where:
+            attribs.update(cond.attribs)
+        return attribs
+
+    def iter_batches(self, filename, encoding='UTF-8', batch_size=10000):
+        """\
+        Read the given ARFF file in batches and yield them with only the
+        selected instances (or with all instances and the mark attribute
+        added) and attributes.
+        """
+        attribs = self.get_load_attr()
+        for data in DataSet.iter_arff(filename, encoding,
+                                      batch_size=batch_size,
+                                      select_attrib=attribs):
+            _check_attribs(data, attribs)
+            if self.mark is not None:
+                res = self.evaluate(data)
+            elif self.cond is not None:
+                relation_name = data.relation_name
+                data = data.where(self.cond)
+                data.relation_name = relation_name
+            # remove the attributes needed only for the conditions
+            if self.select is not None:
+                select = set(self.select)
+                extra = [attr.name for attr in data.attribs
+                         if attr.name not in select]
+                if extra:
+                    data.delete_attrib(extra)
+            if self.mark is not None:
+                data.add_attrib(Attribute(self.mark, 'string'),
+                                [self.mark_value if val else ''
+                                 for val in res])
+            yield data
+
+    def evaluate(self, data):
+        """\
+        Evaluate all the conditions on the given data set, return a boolean
+        array (True for instances that satisfy all of them).
+        """
+        if self.cond is None:
+            return np.ones(len(data), dtype=bool)
+        return self.cond.mask(data)
+
+    def run(self, filename, output, out_format='arff', encoding='UTF-8',
+            batch_size=10000):
+        """\
+        Run the query on the given ARFF file and write the result to the
+        given output file/stream.
+
+        @param filename: the input ARFF file
+        @param output: the output file/stream
+        @param out_format: output format for instances and group-by \
+            counts: 'arff' or 'tsv'
+        @param encoding: the encoding of both files
+        @param batch_size: number of instances processed at once
+        """
+        if out_format not in ['arff', 'tsv']:
+            raise ValueError('Unknown output format: ' + out_format)
+        # count only
+        if self.count and not self.group_by:
+            fh = file_stream(output, 'w', encoding)
+            print >> fh, count_matches(filename, [self.where], encoding,
+                                       batch_size)[0]
+            fh.close()
+            return
+        # group-by counts
+        if self.group_by:
+            counts = self.group_counts(filename, encoding, batch_size)
+            rows = sorted(counts.iteritems(),
+                          key=lambda item: (-item[1], item[0]))
+            if out_format == 'tsv':
+                fh = file_stream(output, 'w', encoding)
+                print >> fh, '\t'.join(self.group_by + ['count'])
+                for key, count in rows:
+                    print >> fh, '\t'.join([_tsv_value(val) for val in key] +
+                                           [str(count)])
+                fh.close()
+                return
+            writer = ArffWriter(output, [(attr, 'string')
+                                         for attr in self.group_by] +
+                                [('count', 'numeric')], 'group-by',
+                                encoding)
+            writer.write([list(key) + [count] for key, count in rows])
+            writer.close()
+            return
+        # instances
+        writer = None
+        fh = None
+        for data in self.iter_batches(filename, encoding, batch_size):
+            if out_format == 'arff':
+                if writer is None:
+                    writer = ArffWriter(output, data, encoding=encoding)
+                writer.write(data)
+                continue
+            if fh is None:
+                fh = file_stream(output, 'w', encoding)
+                print >> fh, '\t'.join(attr.name for attr in data.attribs)
+            columns = [data.attrib_as_vect(idx)
+                       for idx in xrange(len(data.attribs))]
+            for vals in zip(*columns):
+                print >> fh, '\t'.join(_tsv_value(val) for val in vals)
+        if writer is not None:
+            writer.close()
+        if fh is not None:
+            fh.close()
+
+    def group_counts(self, filename, encoding='UTF-8', batch_size=10000):
+        """\
+        Return a dictionary of counts of selected instances by values
+        of the group-by attributes (tuples of values -> counts).
+        """
+        counts = {}
+        attribs = self.get_load_attr()
+        for data in DataSet.iter_arff(filename, encoding,
+                                      batch_size=batch_size,
+                                      select_attrib=attribs):
+            _check_attribs(data, attribs)
+            if self.cond is not None:
+                data = data.where(self.cond)
+            columns = [[_norm_value(val) for val in data.attrib_as_vect(attr)]
+                       for attr in self.group_by]
+            for key in zip(*columns):
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+
+def count_matches(filename, conditions, encoding='UTF-8', batch_size=10000):
+    """\
+    Count instances in an ARFF file that satisfy each of the given
+    conditions (lists of conditions that must all hold; an empty list
+    matches all instances), in a single pass over the file. Return a list
+    of counts.
+    """
+    queries = [ArffQuery(where=cond, count=True) for cond in conditions]
+    attribs = set()
+    for query in queries:
+        attribs.update(query.get_load_attr())
+    counts = [0] * len(queries)
+    for data in DataSet.iter_arff(filename, encoding, batch_size=batch_size,
+                                  select_attrib=attribs):
+        _check_attribs(data, attribs)
+        for num, query in enumerate(queries):
+            counts[num] += int(query.evaluate(data).sum())
+    return counts
+
+
+def _check_attribs(data, attribs):
+    """\
+    Check that all the given attributes were found in the data.
+    """
+    missing = set(attribs or []) - set(attr.name for attr in data.attribs)
+    if missing:
+        raise ValueError('Attributes not found: ' +
+                         ', '.join(sorted(missing)))
+
+
+def _norm_value(val):
+    """\
+    Convert missing numeric values (NaN) to None.
+    """
+    if isinstance(val, float) and math.isnan(val):
+        return None
+    return val
+
+
+def _tsv_value(val):
+    """\
+    Return a TSV-output safe version of a value (missing values are
+    empty, tabs, newlines and backslashes are escaped).
+    """
+    val = _norm_value(val)
+    if val is None:
+        return ''
+    if not isinstance(val, basestring):
+        return unicode(val)
+    return val.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
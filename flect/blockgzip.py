@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Blocked GZip files, compatible with BGZF (as used by bgzip/samtools).
+
+The data are split into blocks of at most 64 kB, and each block is stored
+as a separate GZip member whose header records the block's compressed size.
+Such files can be read by any GZip tool, but the blocks can also be
+compressed and decompressed independently -- here, in a pool of threads
+(zlib releases the interpreter lock while compressing).
+
+The offsets of the blocks may be stored in an index file next to the data
+(<file>.gzi, in the format used by bgzip), so that readers can seek directly
+to any position in the uncompressed data. The index is only written when
+requested (for data files, which are read in parallel); if it is missing or
+outdated, it is rebuilt by scanning the block headers.
+"""
+
+from __future__ import unicode_literals
+import io
+import os
+import gzip
+import zlib
+import struct
+import threading
+from bisect import bisect_right
+from collections import deque
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+__author__ = "Ondřej Dušek"
+__date__ = "2013"
+
+
+# maximum uncompressed block size (so that compressed blocks fit into 64 kB)
+BLOCK_SIZE = 0xff00
+# default number of compression/decompression threads
+THREADS = min(cpu_count(), 8)
+# default buffer size for buffered reading
+BUFFER_SIZE = 1048576
+# default compression level (the same as used by gzip.open)
+LEVEL = 9
+
+# block header: gzip magic, deflate, FEXTRA flag, mtime, xfl, OS, XLEN,
+# 'BC' subfield with the total block size - 1
+_HEADER = struct.Struct(b'<4BI2BH2BHH')
+_HEADER_SIZE = _HEADER.size
+_TRAILER = struct.Struct(b'<II')
+# empty block marking the end of a BGZF file
+_EOF_BLOCK = (b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+              b'\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+
+# the thread pool shared by all readers and writers in a process
+_POOL = None
+_POOL_PID = None
+_POOL_LOCK = threading.Lock()
+
+
+def open_gzip(filename, mode='rb', threads=THREADS,
+              buffer_size=BUFFER_SIZE, level=LEVEL, index=False):
+    """\
+    Open a GZip file for reading or writing, return a buffered binary
+    stream. New files are written as blocked GZip (with the given
+    compression level, and with the block index if index is set);
+    blocked files are read in parallel, other GZip files using the
+    standard gzip module.
+    """
+    if mode.startswith('r'):
+        if is_blocked(filename):
+            return io.BufferedReader(BlockGzipReader(filename, threads),
+                                     buffer_size)
+        return io.BufferedReader(gzip.open(filename, 'rb'), buffer_size)
+    return io.BufferedWriter(BlockGzipWriter(filename, 'ab'
+                                             if mode.startswith('a') else 'wb',
+                                             level, threads, index),
+                             buffer_size)
+
+
+def is_blocked(filename):
+    """\
+    Return true if the given file starts with a blocked GZip header.
+    """
+    with open(filename, 'rb') as fh:
+        return _block_size(fh.read(_HEADER_SIZE)) is not None
+
+
+class BlockGzipWriter(io.RawIOBase):
+    """\
+    A writer for blocked GZip files. Full blocks are compressed in
+    a thread pool while further data are written; the blocks are
+    stored in order and the block index may be saved when the file
+    is closed.
+    """
+
+    def __init__(self, filename, mode='wb', level=LEVEL, threads=THREADS,
+                 index=False):
+        """\
+        Open the file for writing.
+
+        @param filename: the file to write
+        @param mode: 'wb' (create a new file) or 'ab' (append to an \
+            existing one)
+        @param level: compression level
+        @param threads: number of compression threads
+        @param index: save the block index when the file is closed \
+            (files with a single block are read without it)
+        """
+        self.filename = filename
+        self.level = level
+        self.threads = threads
+        self.buf = []
+        self.buf_len = 0
+        self.pending = deque()
+        self.index = [] if index else None
+        self.uoffset = 0
+        # continue an existing file
+        if mode.startswith('a') and os.path.isfile(filename) and \
+                os.path.getsize(filename):
+            if index and is_blocked(filename):
+                self.index, self.uoffset = _read_index(filename)
+            else:
+                self.index = None
+        self.fh = open(filename, mode)
+        self.fh.seek(0, 2)
+        self.coffset = self.fh.tell()
+        if self.index is None and os.path.isfile(filename + '.gzi'):
+            os.remove(filename + '.gzi')
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        """\
+        Write the given data (compressed as soon as a block is full).
+        """
+        data = data.tobytes() if isinstance(data, memoryview) else bytes(data)
+        size = len(data)
+        self.buf.append(data)
+        self.buf_len += size
+        if self.buf_len >= BLOCK_SIZE:
+            data = b''.join(self.buf)
+            end = len(data) - len(data) % BLOCK_SIZE
+            for start in xrange(0, end, BLOCK_SIZE):
+                self.__add_block(data[start:start + BLOCK_SIZE])
+            self.buf = [data[end:]]
+            self.buf_len = len(data) - end
+        return size
+
+    def flush(self):
+        """\
+        Compress the buffered data into a block and write all pending
+        blocks to the file.
+        """
+        if self.fh.closed:
+            return
+        if self.buf_len:
+            self.__add_block(b''.join(self.buf))
+            self.buf = []
+            self.buf_len = 0
+        while self.pending:
+            self.__write_block(*self.pending.popleft())
+        self.fh.flush()
+
+    def close(self):
+        """\
+        Write all the data, the end-of-file block and the block index
+        (if required and the file has more than one block), and close
+        the file.
+        """
+        if self.closed:
+            return
+        self.flush()
+        self.fh.write(_EOF_BLOCK)
+        self.fh.close()
+        if self.index:
+            _write_index(self.filename, self.index)
+        elif os.path.isfile(self.filename + '.gzi'):
+            os.remove(self.filename + '.gzi')
+        super(BlockGzipWriter, self).close()
+
+    def __add_block(self, data):
+        """\
+        Compress a block of data (in the thread pool, if used) and write
+        out the blocks that are already compressed.
+        """
+        if self.threads > 1:
+            pool = _get_pool(self.threads)
+            self.pending.append((len(data), pool.apply_async(
+                    _compress_block, (data, self.level))))
+            # limit the number of blocks held in memory
+            while len(self.pending) > 2 * self.threads or \
+                    (self.pending and self.pending[0][1].ready()):
+                self.__write_block(*self.pending.popleft())
+        else:
+            self.__write_block(len(data), _compress_block(data, self.level))
+
+    def __write_block(self, size, block):
+        """\
+        Write one compressed block (given its uncompressed size and
+        the block itself or an asynchronous result).
+        """
+        if not isinstance(block, bytes):
+            block = block.get()
+        if self.index is not None and self.uoffset:
+            self.index.append((self.coffset, self.uoffset))
+        self.fh.write(block)
+        self.coffset += len(block)
+        self.uoffset += size
+
+
+class BlockGzipReader(io.RawIOBase):
+    """\
+    A reader for blocked GZip files. Blocks are read and decompressed
+    ahead of the consumer in a thread pool. Seeking in the uncompressed
+    data uses the block index.
+
+    This is a raw stream; use io.BufferedReader for efficient reading
+    by lines.
+    """
+
+    def __init__(self, filename, threads=THREADS):
+        """\
+        Open the file for reading.
+
+        @param filename: the file to read
+        @param threads: number of decompression threads
+        """
+        self.filename = filename
+        self.threads = threads
+        self.fh = open(filename, 'rb')
+        self.index = None
+        self.uoffsets = None
+        self.total = None
+        self.__restart(0, 0)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buf):
+        """\
+        Read decompressed data into the given buffer, return the number
+        of bytes read (0 at the end of the file).
+        """
+        while self.pos >= len(self.block):
+            if not self.__next_block():
+                return 0
+        size = min(len(buf), len(self.block) - self.pos)
+        buf[:size] = self.block[self.pos:self.pos + size]
+        self.pos += size
+        return size
+
+    def tell(self):
+        return self.block_uoffset + self.pos
+
+    def seek(self, offset, whence=0):
+        """\
+        Move to the given position in the uncompressed data (using
+        the block index).
+        """
+        if whence == 1:
+            offset += self.tell()
+        elif whence == 2:
+            offset += self.__get_total()
+        if offset < 0:
+            raise IOError('Invalid seek position: ' + str(offset))
+        # the position is inside the current block
+        if self.block_uoffset <= offset < self.block_uoffset + len(self.block):
+            self.pos = offset - self.block_uoffset
+            return offset
+        self.__get_total()
+        block_no = bisect_right(self.uoffsets, offset) - 1
+        coffset, uoffset = self.index[block_no]
+        self.__restart(coffset, uoffset)
+        while self.block_uoffset + len(self.block) <= offset:
+            if not self.__next_block():
+                break
+        self.pos = min(offset - self.block_uoffset, len(self.block))
+        return self.tell()
+
+    def close(self):
+        if not self.closed:
+            self.fh.close()
+            self.pending = deque()
+        super(BlockGzipReader, self).close()
+
+    def __restart(self, coffset, uoffset):
+        """\
+        Start reading blocks at the given compressed offset, which
+        corresponds to the given uncompressed offset.
+        """
+        self.fh.seek(coffset)
+        self.pending = deque()
+        self.eof = False
+        self.block = b''
+        self.block_uoffset = uoffset
+        self.pos = 0
+
+    def __next_block(self):
+        """\
+        Move to the next decompressed block, reading and decompressing
+        further blocks in the background. Return false at the end of
+        the file.
+        """
+        self.block_uoffset += len(self.block)
+        self.block = b''
+        self.pos = 0
+        if self.threads > 1:
+            pool = _get_pool(self.threads)
+            while not self.eof and len(self.pending) < 2 * self.threads:
+                raw = self.__read_raw_block()
+                if raw is not None:
+                    self.pending.append(pool.apply_async(_decompress_block,
+                                                         (raw,)))
+            if not self.pending:
+                return False
+            self.block = self.pending.popleft().get()
+            return True
+        raw = self.__read_raw_block()
+        if raw is None:
+            return False
+        self.block = _decompress_block(raw)
+        return True
+
+    def __read_raw_block(self):
+        """\
+        Read one compressed block from the file (None at the end).
+        """
+        header = self.fh.read(_HEADER_SIZE)
+        if not header:
+            self.eof = True
+            return None
+        size = _block_size(header)
+        if size is None:
+            raise IOError('Invalid block header in ' + self.filename +
+                          ' at offset ' + str(self.fh.tell() - len(header)))
+        rest = self.fh.read(size - _HEADER_SIZE)
+        if len(rest) != size - _HEADER_SIZE:
+            raise IOError('Truncated block in ' + self.filename)
+        return header + rest
+
+    def __get_total(self):
+        """\
+        Return the total size of the uncompressed data (load the block
+        index if needed).
+        """
+        if self.total is None:
+            self.index, self.total = _read_index(self.filename)
+            self.uoffsets = [uoffset for _, uoffset in self.index]
+        return self.total
+
+
+def _get_pool(threads):
+    """\
+    Return the shared thread pool (created anew in forked processes).
+    """
+    global _POOL, _POOL_PID
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_PID != os.getpid():
+            _POOL = ThreadPool(threads)
+            _POOL_PID = os.getpid()
+        return _POOL
+
+
+def _compress_block(data, level):
+    """\
+    Compress the data into one GZip member with the BGZF block header.
+    """
+    comp = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = comp.compress(data) + comp.flush()
+    header = _HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2,
+                          len(cdata) + _HEADER_SIZE + _TRAILER.size - 1)
+    return header + cdata + _TRAILER.pack(zlib.crc32(data) & 0xffffffff,
+                                          len(data))
+
+
+def _decompress_block(raw):
+    """\
+    Decompress one block (with its header and trailer), check its CRC.
+    """
+    xlen = struct.unpack(b'<H', raw[10:12])[0]
+    data = zlib.decompress(raw[12 + xlen:-_TRAILER.size], -15)
+    crc, size = _TRAILER.unpack(raw[-_TRAILER.size:])
+    if size != len(data) or crc != zlib.crc32(data) & 0xffffffff:
+        raise IOError('CRC check failed for a GZip block.')
+    return data
+
+
+def _block_size(header):
+    """\
+    Return the total size of a block given its header, or None if
+    the header is not a blocked GZip header.
+    """
+    if len(header) < _HEADER_SIZE:
+        return None
+    fields = _HEADER.unpack(header)
+    if fields[:4] != (31, 139, 8, 4) or fields[7:11] != (6, 66, 67, 2):
+        return None
+    return fields[11] + 1
+
+
+def _read_index(filename):
+    """\
+    Return the block index of the given file as a list of (compressed
+    offset, uncompressed offset) pairs, and the total uncompressed size.
+    The index file is used if it is up to date; otherwise, the index is
+    built from the block headers.
+    """
+    index_file = filename + '.gzi'
+    if os.path.isfile(index_file) and \
+            os.path.getmtime(index_file) >= os.path.getmtime(filename):
+        with open(index_file, 'rb') as fh:
+            data = fh.read()
+        count = struct.unpack(b'<Q', data[:8])[0]
+        if len(data) == 8 + 16 * count:
+            offsets = struct.unpack(b'<' + b'Q' * (2 * count), data[8:])
+            index = [(0, 0)] + zip(offsets[::2], offsets[1::2])
+            return index, _total_size(filename, index)
+    # scan the block headers
+    index = []
+    uoffset = 0
+    with open(filename, 'rb') as fh:
+        while True:
+            coffset = fh.tell()
+            header = fh.read(_HEADER_SIZE)
+            if not header:
+                break
+            size = _block_size(header)
+            if size is None:
+                raise IOError('Invalid block header in ' + filename)
+            fh.seek(coffset + size - 4)
+            isize = struct.unpack(b'<I', fh.read(4))[0]
+            if isize or not index:
+                index.append((coffset, uoffset))
+            uoffset += isize
+    return index or [(0, 0)], uoffset
+
+
+def _total_size(filename, index):
+    """\
+    Return the total uncompressed size of the file, given its index
+    (the uncompressed size of the last block is read from its trailer).
+    """
+    with open(filename, 'rb') as fh:
+        coffset, uoffset = index[-1]
+        fh.seek(coffset)
+        while True:
+            header = fh.read(_HEADER_SIZE)
+            size = _block_size(header)
+            if size is None:
+                return uoffset
+            fh.seek(coffset + size - 4)
+            uoffset += struct.unpack(b'<I', fh.read(4))[0]
+            coffset += size
+            fh.seek(coffset)
+
+
+def _write_index(filename, index):
+    """\
+    Save the block index into <filename>.gzi (in the bgzip format:
+    the number of entries and (compressed, uncompressed) offset pairs for
+    all blocks except the first one).
+    """
+    entries = [entry for entry in index if entry != (0, 0)]
+    with open(filename + '.gzi', 'wb') as fh:
+        fh.write(struct.pack(b'<Q', len(entries)))
+        for coffset, uoffset in entries:
+            fh.write(struct.pack(b'<QQ', coffset, uoffset))
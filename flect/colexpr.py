@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Column expressions: conditions on attribute values that are evaluated
+on all instances of a data set at once.
+
+Expressions are built from attribute references created by col(), e.g.:
+
+data.where(col('Tag_POS') == 'N')
+data.where(col('Lemma').lower() != col('Form').lower())
+data.where(~col('Lemma').matches(r'^\\p{P}'))
+data.split(col('Tag_POS'))
+
+Values of each attribute are represented by a table of distinct values
+(the labels of nominal and string attributes, the sorted distinct values
+of numeric attributes) and an array of codes pointing into this table.
+String operations and comparisons are computed just once for each distinct
+value and the results are then spread to all instances by array indexing.
+
+The semantics are the same as if the expressions were evaluated on the
+instances in dictionary form (see DataSet.instance()): missing values are
+None for nominal and string attributes and NaN for numeric attributes,
+value code 0 is used for absent values in sparse data sets. In addition,
+comparing to None matches missing values of all attributes, and string
+constants compared to numeric values are converted to numbers (as values
+are written in ARFF files, e.g. col('word_id') == '1').
+"""
+
+from __future__ import unicode_literals
+import regex
+import numpy as np
+
+__author__ = "Ondřej Dušek"
+__date__ = "2013"
+
+
+def col(name):
+    """\
+    Return an expression referring to the values of the given attribute.
+    """
+    return Column(name)
+
+
+class Expression(object):
+    """\
+    An expression yielding a value for each instance of a data set.
+    """
+
+    def table(self, data):
+        """\
+        Evaluate the expression on the given data set, return an array
+        of value codes for all instances and a list of values the codes
+        point to. The last value stands for missing values.
+        """
+        raise NotImplementedError()
+
+    @property
+    def attribs(self):
+        """\
+        Names of all attributes used by the expression.
+        """
+        raise NotImplementedError()
+
+    def lower(self):
+        """\
+        Return an expression with the (string) values in lowercase.
+        """
+        return Mapped(self, lambda val: (val.lower()
+                                         if isinstance(val, basestring)
+                                         else val), 'lower')
+
+    def upper(self):
+        """\
+        Return an expression with the (string) values in uppercase.
+        """
+        return Mapped(self, lambda val: (val.upper()
+                                         if isinstance(val, basestring)
+                                         else val), 'upper')
+
+    def map(self, func):
+        """\
+        Return an expression with the given function applied to all
+        values (except missing values).
+        """
+        return Mapped(self, func)
+
+    def matches(self, pattern, ignore_case=False):
+        """\
+        Return a condition that holds if the given regular expression
+        is found anywhere in the value (use ^ to anchor it at the beginning;
+        missing values never match).
+        """
+        return Match(self, pattern, ignore_case)
+
+    def isin(self, values):
+        """\
+        Return a condition that holds if the value is one of the given
+        values.
+        """
+        return Comparison(self, set(values), 'in')
+
+    def __eq__(self, other):
+        return Comparison(self, other, '==')
+
+    def __ne__(self, other):
+        return ~Comparison(self, other, '==')
+
+
+class Column(Expression):
+    """\
+    The values of one attribute.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def table(self, data):
+        attr = data.get_attrib(self.name)
+        values = data.attrib_as_array(self.name)
+        missing = np.isnan(values)
+        if attr.type == 'numeric':
+            uniq, codes = np.unique(values[~missing], return_inverse=True)
+            table = uniq.tolist() + [float('NaN')]
+        else:
+            codes = values[~missing]
+            table = list(attr.labels) + [None]
+        ret = np.empty(len(values), dtype=np.intp)
+        ret[~missing] = codes
+        ret[missing] = len(table) - 1
+        return ret, table
+
+    @property
+    def attribs(self):
+        return [self.name]
+
+    def __repr__(self):
+        return 'col(' + repr(self.name) + ')'
+
+
+class Mapped(Expression):
+    """\
+    The values of another expression with a function applied to them.
+    """
+
+    def __init__(self, expr, func, name=None):
+        self.expr = expr
+        self.func = func
+        self.name = name
+
+    def table(self, data):
+        codes, table = self.expr.table(data)
+        missing = len(table) - 1
+        mapped = [None] * missing + [table[missing]]
+        for code in _used_codes(codes):
+            if code != missing:
+                mapped[code] = self.func(table[code])
+        return codes, mapped
+
+    @property
+    def attribs(self):
+        return self.expr.attribs
+
+    def __repr__(self):
+        if self.name is not None:
+            return repr(self.expr) + '.' + self.name + '()'
+        return repr(self.expr) + '.map(' + repr(self.func) + ')'
+
+
+class Condition(object):
+    """\
+    A condition on instances of a data set, which is evaluated
+    to a boolean mask of all instances. Conditions may be combined using
+    the &, | and ~ operators.
+    """
+
+    def mask(self, data):
+        """\
+        Evaluate the condition on the given data set, return a boolean
+        array with the result for all instances.
+        """
+        raise NotImplementedError()
+
+    @property
+    def attribs(self):
+        """\
+        Names of all attributes used by the condition.
+        """
+        raise NotImplementedError()
+
+    def __and__(self, other):
+        return Combined(self, other, np.logical_and)
+
+    def __or__(self, other):
+        return Combined(self, other, np.logical_or)
+
+    def __invert__(self):
+        return Negated(self)
+
+
+class Comparison(Condition):
+    """\
+    Equality of an expression to a constant or to another expression,
+    or membership of its values in a set.
+    """
+
+    def __init__(self, expr, other, op):
+        self.expr = expr
+        self.other = other
+        self.op = op
+
+    def mask(self, data):
+        codes, table = self.expr.table(data)
+        if isinstance(self.other, Expression):
+            return self.__compare(codes, table, *self.other.table(data))
+        if self.op == 'in':
+            func = lambda val: _known(val) in self.other
+        else:
+            other = _coerce(self.other, table)
+            func = lambda val: _known(val) == other
+        return _apply(codes, table, func)
+
+    @property
+    def attribs(self):
+        if isinstance(self.other, Expression):
+            return self.expr.attribs + self.other.attribs
+        return self.expr.attribs
+
+    def __compare(self, codes, table, other_codes, other_table):
+        """\
+        Compare two expressions, assigning the same integer to equal
+        values of both tables (NaNs are not equal to anything).
+        """
+        ids = {}
+        left = _value_ids(codes, table, ids, -1)
+        right = _value_ids(other_codes, other_table, ids, -2)
+        return left[codes] == right[other_codes]
+
+    def __repr__(self):
+        return repr(self.expr) + ' ' + self.op + ' ' + repr(self.other)
+
+
+class Match(Condition):
+    """\
+    Regular expression search in the values of an expression.
+    """
+
+    def __init__(self, expr, pattern, ignore_case=False):
+        self.expr = expr
+        self.pattern = regex.compile(pattern, regex.UNICODE |
+                                     (regex.IGNORECASE if ignore_case else 0))
+
+    def mask(self, data):
+        codes, table = self.expr.table(data)
+        return _apply(codes, table, self.__search)
+
+    @property
+    def attribs(self):
+        return self.expr.attribs
+
+    def __search(self, val):
+        """\
+        Return true if the pattern is found in the given value.
+        """
+        val = _known(val)
+        if val is None:
+            return False
+        if not isinstance(val, basestring):
+            val = unicode(val)
+        return self.pattern.search(val) is not None
+
+    def __repr__(self):
+        return repr(self.expr) + '.matches(' + \
+            repr(self.pattern.pattern) + ')'
+
+
+class Combined(Condition):
+    """\
+    Two conditions combined by a logical operator.
+    """
+
+    def __init__(self, first, second, op):
+        self.first = first
+        self.second = second
+        self.op = op
+
+    def mask(self, data):
+        return self.op(self.first.mask(data), self.second.mask(data))
+
+    @property
+    def attribs(self):
+        return self.first.attribs + self.second.attribs
+
+    def __repr__(self):
+        return '(' + repr(self.first) + ') ' + \
+            ('&' if self.op is np.logical_and else '|') + \
+            ' (' + repr(self.second) + ')'
+
+
+class Negated(Condition):
+    """\
+    Negation of a condition.
+    """
+
+    def __init__(self, cond):
+        self.cond = cond
+
+    def mask(self, data):
+        return ~self.cond.mask(data)
+
+    @property
+    def attribs(self):
+        return self.cond.attribs
+
+    def __repr__(self):
+        return '~(' + repr(self.cond) + ')'
+
+
+def _used_codes(codes):
+    """\
+    Return the list of distinct codes in the given code array.
+    """
+    return np.unique(codes).tolist()
+
+
+def _known(val):
+    """\
+    Return the given value, or None if it is missing (None or NaN).
+    """
+    if isinstance(val, float) and val != val:
+        return None
+    return val
+
+
+def _coerce(value, table):
+    """\
+    Convert a string constant to a number if it is compared to numeric
+    values (i.e. all values in the table are floats).
+    """
+    if isinstance(value, basestring) and \
+            all(isinstance(val, float) for val in table):
+        return float(value)
+    return value
+
+
+def _apply(codes, table, func):
+    """\
+    Apply a boolean function to all values of the table that are used
+    in the code array, return its results for all instances.
+    """
+    res = np.zeros(len(table), dtype=bool)
+    for code in _used_codes(codes):
+        res[code] = bool(func(table[code]))
+    return res[codes]
+
+
+def _value_ids(codes, table, ids, nan_id):
+    """\
+    Return an array which maps the codes to integer identifiers of the
+    values they point to, using and updating the given dictionary
+    (values -> identifiers). NaNs get the given identifier.
+    """
+    res = np.empty(len(table), dtype=np.intp)
+    res.fill(nan_id)
+    for code in _used_codes(codes):
+        val = table[code]
+        if isinstance(val, float) and val != val:
+            continue
+        res[code] = ids.setdefault(val, len(ids))
+    return res
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Columnar storage of dense data set values.
+
+The values of each attribute are kept in one NumPy array: values of numeric
+attributes as float64 (NaN for missing values), label codes of nominal and
+string attributes as uint8 if they all fit into it, int32 otherwise (the
+largest uint8 value or -1, respectively, stands for a missing value).
+This takes 1-8 bytes per value, instead of a Python float object referenced
+from a list of instance values.
+
+Outside of the store, values are exchanged in the same representation as
+in sparse data sets: floats, with label codes converted to floats and NaN
+for missing values.
+
+The column arrays are never modified in place (all changes replace them),
+so that they may be shared by several stores.
+"""
+
+from __future__ import unicode_literals
+import numpy as np
+
+__author__ = "Ondřej Dušek"
+__date__ = "2013"
+
+
+# label code array types and the codes of missing values
+MISSING_CODES = {np.dtype(np.uint8): 255, np.dtype(np.int32): -1}
+# missing value
+NAN = float('NaN')
+
+
+class ColumnStore(object):
+    """\
+    The values of a dense data set, stored as one array per attribute.
+
+    A store may also be a view of the instances of another store: it then
+    shares the other store's column arrays and only holds an array of the
+    selected instance indexes. The selected values are copied out
+    when the view is changed (instances or attributes are added to it).
+    """
+
+    def __init__(self, columns=None, length=0, index=None):
+        """\
+        Create a store from a list of column arrays in the storage format
+        (see encode()). The number of instances must be given if there are
+        no columns. If index is given, the store is a view of the instances
+        at the given positions of the column arrays.
+        """
+        self.columns = columns if columns is not None else []
+        self.index = index
+        if index is not None:
+            self.length = len(index)
+        else:
+            self.length = len(self.columns[0]) if self.columns else length
+        self.__missing = (None, [])
+
+    @staticmethod
+    def from_values(values, numeric):
+        """\
+        Create a store from instances given as a 2-D array or a list of lists
+        of values (shorter instances are padded with missing values).
+        The attribute types are given as a list of booleans (True for
+        numeric attributes).
+        """
+        values = _as_matrix(values, len(numeric))
+        return ColumnStore([encode(values[:, idx], num)
+                            for idx, num in enumerate(numeric)], len(values))
+
+    @property
+    def width(self):
+        """\
+        Return the number of attributes in the store.
+        """
+        return len(self.columns)
+
+    @property
+    def is_view(self):
+        """\
+        Return true if this store is a view of another store's instances.
+        """
+        return self.index is not None
+
+    def column(self, idx):
+        """\
+        Return the values of the given attribute as a new float array.
+        """
+        return decode(self.__column(idx))
+
+    def get(self, index, col):
+        """\
+        Return the value of the given instance and attribute.
+        """
+        if self.index is not None:
+            index = self.index[index]
+        return _scalar(self.columns[col], index)
+
+    def row(self, index):
+        """\
+        Return the given instance as a list of values.
+        """
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('Instance index out of range')
+        if self.index is not None:
+            index = self.index.item(index)
+        return [NAN if val == missing else float(val) for val, missing
+                in zip([col.item(index) for col in self.columns],
+                       self.__missing_codes())]
+
+    def values(self, start=None, stop=None, cols=None):
+        """\
+        Return a 2-D float array with values of the given range of instances
+        (all by default) and the given list of attributes (all by default).
+        """
+        columns = self.columns
+        if cols is not None:
+            columns = [columns[idx] for idx in cols]
+        rows = slice(start, stop)
+        if self.index is not None:
+            rows = self.index[rows]
+        length = len(xrange(*slice(start, stop).indices(self.length)))
+        matrix = np.empty((length, len(columns)))
+        for idx, col in enumerate(columns):
+            col = col[rows]
+            matrix[:, idx] = col
+            if col.dtype in MISSING_CODES:
+                matrix[col == MISSING_CODES[col.dtype], idx] = np.nan
+        return matrix
+
+    def take(self, idxs):
+        """\
+        Return a view of the instances of the given indexes (an array or
+        a list) which shares the column arrays with this store.
+        """
+        idxs = np.array(idxs, dtype=np.intp)
+        idxs[idxs < 0] += self.length
+        if len(idxs) and (idxs.min() < 0 or idxs.max() >= self.length):
+            raise IndexError('Instance index out of range')
+        if self.index is not None:
+            idxs = self.index[idxs]
+        return ColumnStore(self.columns, len(idxs), idxs)
+
+    def select(self, cols):
+        """\
+        Return a new store with the attributes of the given indexes
+        (sharing the column arrays with this store).
+        """
+        return ColumnStore([self.columns[idx] for idx in cols], self.length,
+                           self.index)
+
+    def append(self, values, numeric):
+        """\
+        Append instances given as a 2-D array or a list of lists of values
+        (see from_values()).
+        """
+        self.extend(ColumnStore.from_values(values, numeric))
+
+    def extend(self, other):
+        """\
+        Append the instances of another store. If this store has fewer
+        attributes, they are added with missing values for all the instances
+        already stored.
+        """
+        if other.width < self.width:
+            raise ValueError('Cannot append instances with fewer attributes.')
+        self.__materialize()
+        columns = self.columns + [_missing_column(self.length, col.dtype)
+                                  for col in other.columns[self.width:]]
+        self.columns = [_concat([mine, other.__column(idx)]) for idx, mine
+                        in enumerate(columns)]
+        self.length += other.length
+
+    def add_columns(self, columns):
+        """\
+        Add the given column arrays (in the storage format) as new attributes.
+        """
+        for col in columns:
+            if len(col) != self.length:
+                raise ValueError('The column length must match ' +
+                                 'the number of instances!')
+        self.__materialize()
+        self.columns = self.columns + list(columns)
+
+    def merge(self, other):
+        """\
+        Add all attributes of another store with the same number of
+        instances (the column arrays are shared if both stores are
+        views of the same instances, or both are not views).
+        """
+        if other.index is self.index:
+            if other.length != self.length:
+                raise ValueError('The number of instances must match!')
+            self.columns = self.columns + other.columns
+            return
+        self.add_columns([other.__column(idx) for idx in xrange(other.width)])
+
+    def __column(self, idx):
+        """\
+        Return the array with the given attribute's values of the instances
+        in this store (copied out if this store is a view).
+        """
+        if self.index is not None:
+            return self.columns[idx][self.index]
+        return self.columns[idx]
+
+    def __materialize(self):
+        """\
+        Turn a view into a store with its own column arrays.
+        """
+        if self.index is not None:
+            self.columns = [self.__column(idx) for idx in xrange(self.width)]
+            self.index = None
+
+    def __missing_codes(self):
+        """\
+        Return the list of missing value codes of all columns (None for
+        numeric ones), cached as long as the list of columns is the same.
+        """
+        columns, codes = self.__missing
+        if columns is not self.columns or len(codes) != len(self.columns):
+            codes = [MISSING_CODES.get(col.dtype) for col in self.columns]
+            self.__missing = (self.columns, codes)
+        return codes
+
+    def __getstate__(self):
+        """\
+        Pickle views with just the values of their own instances.
+        """
+        state = dict(self.__dict__)
+        state['columns'] = [self.__column(idx) for idx in xrange(self.width)]
+        state['index'] = None
+        state['_ColumnStore__missing'] = (None, [])
+        return state
+
+    def __setstate__(self, state):
+        """\
+        Unpickle stores, including those saved without the index.
+        """
+        state.setdefault('index', None)
+        self.__dict__.update(state)
+
+    def __len__(self):
+        """\
+        Return the number of instances in the store.
+        """
+        return self.length
+
+
+def encode(values, numeric):
+    """\
+    Convert a vector of float values to the storage format: a float64 array
+    for numeric attributes, the smallest label code array type otherwise.
+    """
+    values = np.array(values, dtype=np.float64)
+    if numeric:
+        return values
+    missing = np.isnan(values)
+    known = values[~missing]
+    if not len(known) or known.max() < MISSING_CODES[np.dtype(np.uint8)]:
+        dtype = np.dtype(np.uint8)
+    else:
+        dtype = np.dtype(np.int32)
+    values[missing] = MISSING_CODES[dtype]
+    return values.astype(dtype)
+
+
+def decode(column):
+    """\
+    Convert a column array in the storage format to a new float64 array
+    (with NaN for missing values).
+    """
+    values = column.astype(np.float64)
+    if column.dtype in MISSING_CODES:
+        values[column == MISSING_CODES[column.dtype]] = np.nan
+    return values
+
+
+def _scalar(column, index):
+    """\
+    Return one value of a column array as a float.
+    """
+    val = column[index]
+    if column.dtype in MISSING_CODES and val == MISSING_CODES[column.dtype]:
+        return NAN
+    return float(val)
+
+
+def _as_matrix(values, width):
+    """\
+    Convert instances to a 2-D float array of the given width, padding
+    shorter instances with missing values.
+    """
+    try:
+        return np.asarray(values, dtype=np.float64).reshape((len(values),
+                                                             width))
+    except ValueError:
+        # instances have different lengths
+        matrix = np.empty((len(values), width))
+        matrix.fill(np.nan)
+        for idx, inst in enumerate(values):
+            matrix[idx, :len(inst)] = inst
+        return matrix
+
+
+def _missing_column(length, dtype):
+    """\
+    Return a column array of the given type with all values missing.
+    """
+    column = np.empty(length, dtype=dtype)
+    column.fill(MISSING_CODES.get(dtype, np.nan))
+    return column
+
+
+def _concat(columns):
+    """\
+    Concatenate column arrays, converting uint8 label codes to int32 if any
+    of the arrays needs it.
+    """
+    if any(col.dtype == np.int32 for col in columns):
+        columns = [_widen(col) for col in columns]
+    return np.concatenate(columns)
+
+
+def _widen(column):
+    """\
+    Convert a uint8 label code array to int32 (keeping missing values).
+    """
+    if column.dtype != np.uint8:
+        return column
+    ret = column.astype(np.int32)
+    ret[column == MISSING_CODES[column.dtype]] = MISSING_CODES[ret.dtype]
+    return ret
@@ -7,28 +7,52 @@ Data set representation with ARFF I/O.
 
 from __future__ import unicode_literals
 import re
+import os
 import numpy as np
 import scipy.sparse as sp
 import copy
 from sklearn.datasets.base import Bunch
 import math
-from varutil import file_stream
+import sys
+from multiprocessing import Pool
+from varutil import file_stream, intern_string
+from arffio import split_weight, split_dense, split_sparse, SPEC_CHARS, \
+    split_data_section, read_lines, quote, count_data_lines
+from arffcache import load_cache, save_cache
+from mmapstore import StoreWriter, open_store
+from sampling import check_sample, needs_total, sample_items
+from colstore import ColumnStore, encode, decode
+from colexpr import Expression, Condition
+from labeltable import LabelTable, LabelIndex
 
 __author__ = "Ondřej Dušek"
 __date__ = "2013"
 
 
+# missing value
+NAN = float('NaN')
+
 class Attribute(object):
     """\
     This represents an attribute of the data set.
+
+    String and nominal attributes hold a list of labels and a dictionary
+    mapping the labels to their (integer) codes, or a LabelTable and
+    a LabelIndex if they are frozen (see freeze()).
+
+    Copies of an attribute (see __copy__()) share the label list and
+    dictionary until new labels are added to either of them.
     """
 
+    __slots__ = ['name', 'type', 'labels', 'values', 'shared']
+
     def __init__(self, name, type_spec):
         """\
         Initialize an attribute, given its ARFF specification.
         Sets the attribute type, list of labels and list of possible values.
         """
         self.name = name
+        self.shared = False
         # numeric attributes
         if type_spec.lower() in ['numeric', 'real', 'integer']:
             self.type = 'numeric'
@@ -41,22 +65,18 @@ class Attribute(object):
             self.values = {}
         # nominal attributes
         elif type_spec.startswith('{'):
-            # strip '{', '}', append comma to match last value
-            type_spec = type_spec[1:-1] + ','
             self.type = 'nominal'
             self.values = {}
             self.labels = []
-            for match in re.finditer(DataSet.DENSE_FIELD, type_spec):
-                val = match.group(1)
-                # quoted value
-                if re.match(r'^[\'"].*[\'"]$', val):
-                    val = val[1:-1]
-                    val = re.sub(r'\\([\n\r\'"\\\t%])', '\1', val)
-                # plain value
-                else:
-                    val = val.strip()
-                self.values[val] = float(len(self.labels))
-                self.labels.append(val)
+            # strip '{', '}'
+            type_spec = type_spec[1:-1]
+            if type_spec.strip():
+                for val in split_dense(type_spec):
+                    if val is None:
+                        val = '?'
+                    val = intern_string(val)
+                    self.values[val] = len(self.labels)
+                    self.labels.append(val)
         # other attribute types are not supported
         else:
             raise TypeError('Unsupported attribute type: ' + type_spec)
@@ -83,8 +103,7 @@ class Attribute(object):
         # return values for string attributes, adding new ones is possible
         else:
             if not value in self.values:
-                self.values[value] = float(len(self.labels))
-                self.labels.append(value)
+                return self.__add_label(value)
             return self.values[value]
 
     def soft_numeric_value(self, value, add_values):
@@ -110,10 +129,8 @@ class Attribute(object):
         else:
             if not value in self.values:
                 if add_values:
-                    self.values[value] = float(len(self.labels))
-                    self.labels.append(value)
-                else:
-                    return float('NaN')
+                    return self.__add_label(value)
+                return float('NaN')
             return self.values[value]
 
     def value(self, numeric_val):
@@ -130,6 +147,72 @@ class Attribute(object):
             return None
         return self.labels[int(numeric_val)]
 
+    def freeze(self):
+        """\
+        Convert the labels of a string or nominal attribute to a compact
+        read-only LabelTable, which is shared by all copies of the attribute.
+        The attribute is unfrozen automatically if new labels are added.
+        """
+        if self.type != 'numeric' and not self.is_frozen:
+            self.labels = LabelTable(self.labels)
+            self.values = LabelIndex(self.labels)
+            self.shared = False
+
+    def thaw(self):
+        """\
+        Convert the labels of a frozen attribute back to a list and
+        a dictionary.
+        """
+        if self.is_frozen:
+            self.labels = list(self.labels)
+            self.values = {label: code
+                           for code, label in enumerate(self.labels)}
+            self.shared = False
+
+    @property
+    def is_frozen(self):
+        """\
+        Return true if the labels are stored in a read-only LabelTable.
+        """
+        return isinstance(self.labels, LabelTable)
+
+    def memory_usage(self, deep=True):
+        """\
+        Return the memory used by the labels of the attribute, in bytes
+        (the label list and dictionary, or the frozen label table). If deep
+        is set, the label strings and codes in the list and dictionary
+        are included (strings shared with other attributes are counted
+        for each of them).
+        """
+        if self.type == 'numeric':
+            return 0
+        if self.is_frozen:
+            table = self.labels
+            return sys.getsizeof(table) + sys.getsizeof(self.values) + \
+                len(table.data) + table.offsets.nbytes + \
+                table.hashes.nbytes + table.order.nbytes
+        size = sys.getsizeof(self.labels) + sys.getsizeof(self.values)
+        if deep:
+            size += sum(sys.getsizeof(label) for label in self.labels)
+            size += sum(sys.getsizeof(code) for code in self.values.itervalues()
+                        if not -5 <= code <= 256)  # small ints are shared
+        return size
+
+    def __add_label(self, value):
+        """\
+        Add a new label (a shared copy, see intern_string()), return its code.
+        """
+        self.thaw()
+        if self.shared:
+            self.labels = list(self.labels)
+            self.values = dict(self.values)
+            self.shared = False
+        value = intern_string(value)
+        code = len(self.labels)
+        self.values[value] = code
+        self.labels.append(value)
+        return code
+
     def get_arff_type(self):
         """\
         Return the ARFF type of the given attribute (numeric, string or
@@ -160,6 +243,47 @@ class Attribute(object):
         else:
             return len(self.labels)
 
+    def __getstate__(self):
+        """\
+        Return the attribute values for pickling.
+        """
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state):
+        """\
+        Restore the attribute from pickled values (also supports attributes
+        pickled before __slots__ were used). Labels are replaced by shared
+        copies (see intern_string()).
+        """
+        for slot, value in state.iteritems():
+            setattr(self, slot, value)
+        self.shared = False
+        if isinstance(self.labels, list):
+            self.labels = [intern_string(label) for label in self.labels]
+            self.values = {intern_string(label): code
+                           for label, code in self.values.iteritems()}
+
+    def __copy__(self):
+        """\
+        Return a copy of the attribute which shares the label list and
+        dictionary with this attribute (both are copied as soon as a new
+        label is added to either of the attributes).
+        """
+        ret = Attribute.__new__(Attribute)
+        ret.name = self.name
+        ret.type = self.type
+        ret.labels = self.labels
+        ret.values = self.values
+        ret.shared = self.shared = \
+            self.type != 'numeric' and not self.is_frozen
+        return ret
+
+    def __deepcopy__(self, memo):
+        """\
+        Deep copies are the same as shallow copies (see __copy__()).
+        """
+        return self.__copy__()
+
     def __repr__(self):
         """\
         This is the same as __str__.
@@ -179,25 +303,20 @@ class DataSet(object):
     ARFF relation data representation.
     """
 
-    # Regex matching an ARFF sparse instance field
-    SPARSE_FIELD = r'([0-9]+)\s+' + \
-                   r'([^"\'\s][^,]*|' + \
-                   r'\'[^\']*(\\\'[^\']*)*\'|' + \
-                   r'"[^"]*(\\"[^"]*)*"),'
-    # Regex matching an ARFF dense instance field
-    DENSE_FIELD = r'([^"\'][^,]*|' + \
-                  r'\'[^\']*(\\\'[^\']*)*(?<!\\)\'|' + \
-                  r'"[^"]*(\\"[^"]*)*(?<!\\)"),'
     # ARFF special characters for regexps
-    SPEC_CHARS = r'[\n\r\'"\\\t%]'
+    SPEC_CHARS = SPEC_CHARS
+    # number of instances written to the output at once
+    WRITE_CHUNK = 10000
+    # number of instances converted to the data set storage at once
+    READ_CHUNK = 10000
 
     def __init__(self):
         """\
         Just initialize the internal data structures (as empty).
         """
         self.relation_name = ''
-        self.data = []
-        self.inst_weights = []
+        self.data = ColumnStore()
+        self.inst_weights = np.zeros(0)
         self.attribs = []
         self.attribs_by_name = {}
         self.is_sparse = False
@@ -207,7 +326,7 @@ class DataSet(object):
         """\
         Return true if the data structures are empty.
         """
-        return not self.relation_name and not self.data and not self.attribs
+        return not self.relation_name and not len(self) and not self.attribs
 
     def as_dict(self, mask_attrib=[], select_attrib=[]):
         """\
@@ -220,14 +339,20 @@ class DataSet(object):
         If mask_attrib is not set but select_attrib is set, only attributes
         listed in select_attrib are added to the dictionary.
         """
-        ret = []
         mask_set = self.__get_mask_set(select_attrib, mask_attrib)
-        for inst in self.data:
-            # find relevant data (different for sparse and dense)
-            if self.is_sparse:
-                num_vals = zip(inst.rows[0], inst.data[0])
-            else:
-                num_vals = enumerate(inst)
+        # dense data: fill in the dictionaries column by column
+        if not self.is_sparse:
+            ret = [{} for _ in xrange(len(self))]
+            for attr_num, attr in enumerate(self.attribs):
+                if attr_num in mask_set:
+                    continue
+                for inst, val in zip(ret, self.data.column(attr_num).tolist()):
+                    if not math.isnan(val):
+                        inst[attr.name] = attr.value(val)
+            return ret
+        ret = []
+        for idx in xrange(len(self)):
+            num_vals = zip(*self.__sparse_row(idx))
             # add the data to a dictionary which is appended to the list
             ret.append({self.attribs[attr_num].name:
                         self.attribs[attr_num].value(val)
@@ -240,6 +365,10 @@ class DataSet(object):
         """\
         Return the data as a scikit-learn Bunch object. The target parameter
         specifies the class attribute.
+
+        The attributes are selected at once for all instances: by one
+        selection of columns of the dense storage, or one column slice
+        of the sparse matrix.
         """
         mask_set = self.__get_mask_set(select_attrib, mask_attrib + [target])
         # prepare the data matrixes
@@ -247,112 +376,293 @@ class DataSet(object):
         y = np.empty(shape=(1, 0))
         # identify the target attribute
         target = self.attrib_index(target)
+        keep = [idx for idx in xrange(len(self.attribs)) if idx not in mask_set]
         # divide and convert the data to X, y
-        if self.data:
+        if len(self):
+            y = self.attrib_as_array(target)
             # dense matrix
             if not self.is_sparse:
-                y = np.array([inst[target] for inst in self.data])
-                X = np.matrix([[val for idx, val in enumerate(inst)
-                                if idx not in mask_set]
-                               for inst in self.data])
-            # sparse matrix
+                X = np.matrix(self.data.values(cols=keep))
+            # sparse matrix (select columns)
             else:
-                y = np.array([inst[0, target] for inst in self.data])
-                data_buf = []
-                for inst in self.data:
-                    filt_inst = sp.csr_matrix([val for idx, val
-                                               in enumerate(inst.toarray()[0])
-                                               if idx not in mask_set])
-                    data_buf.append(filt_inst)
-                X = sp.vstack(tuple(data_buf), 'csr')
+                X = self.data[:, keep]
+                X.eliminate_zeros()
         # return as Bunch
         return Bunch(data=X,
                      DESCR=self.relation_name,
                      target=y,
                      target_names=self.attribs[target].labels)
 
-    def load_from_arff(self, filename, encoding='UTF-8', headers_only=False):
+    def load_from_arff(self, filename, encoding='UTF-8', headers_only=False,
+                       cache=None, workers=1, select_attrib=None, sample=None):
         """\
         Load an ARFF file/stream, filling the data structures.
 
         @param filename: the ARFF file to read
         @param encoding: the encoding (defaults to UTF-8)
         @param headers_only: read just the headers, ignore data
+        @param cache: use the binary cache of the file if it is valid \
+            (None = default), also create the cache if it is missing or \
+            outdated (True), or ignore the cache (False)
+        @param workers: number of processes used to parse the data \
+            (applies to files, not streams; the encoding must be ASCII-based)
+        @param select_attrib: names of attributes to load (None = all); \
+            other attributes are skipped while parsing
+        @param sample: load only a sample of the instances (see \
+            flect.sampling for the possible values; None = all); \
+            lines not included in the sample are not parsed (the file \
+            is always parsed by a single process)
         """
         # initialize
         if not self.is_empty:
             raise IOError('Cannot store second data set into the same object.')
-        status = 'header'  # we first assume to read the header
-        line_num = 1  # line counter
+        if sample is not None:
+            check_sample(sample)
+        # try loading from cache
+        if cache is not False:
+            cached = load_cache(filename, encoding, headers_only)
+            # the cache always contains all attributes and instances, so it
+            # must be created from a full load
+            if cached is None and cache and not headers_only and \
+                    (select_attrib is not None or sample is not None) and \
+                    isinstance(filename, basestring):
+                DataSet().load_from_arff(filename, encoding, cache=True,
+                                         workers=workers)
+                cached = load_cache(filename, encoding)
+            if cached is not None:
+                if not headers_only:
+                    cached = self.__sample_cached(cached, sample)
+                self.__load_cached(cached, headers_only, select_attrib)
+                return
+        # parse the file in parallel
+        if workers > 1 and not headers_only and sample is None and \
+                isinstance(filename, basestring):
+            self.__load_arff_parallel(filename, encoding, workers,
+                                      select_attrib)
+        # parse the file
+        else:
+            total = None
+            if sample is not None and not headers_only and \
+                    needs_total(sample):
+                total = self.__count_instances(filename, encoding)
+            # open the file
+            fh = file_stream(filename, encoding=encoding)
+            line_num, columns = self.__read_arff_header(fh, select_attrib)
+            if not headers_only:
+                self.data, self.inst_weights = self.__collect_instances(
+                        self.__read_arff_data(fh, line_num, columns, sample,
+                                              total))
+            fh.close()
+        # create the cache, if required
+        if cache and not headers_only and select_attrib is None and \
+                sample is None and isinstance(filename, basestring):
+            save_cache(filename, encoding, self)
+
+    def parse_arff_part(self, filename, start, end, encoding='UTF-8',
+                        columns=None):
+        """\
+        Parse the instances in a part of an ARFF file's data section, given
+        by byte offsets at line boundaries, using the headers of this data
+        set (used for parallel loading). If only some of the file's
+        attributes are loaded, columns gives the position of each
+        file attribute in this data set (or None if it is skipped).
+
+        The instances are not stored; they are returned as an array (a list
+        if the lines have different lengths, a CSR matrix for sparse data),
+        along with a list of their weights. New string values are added
+        to the attributes of this data set.
+        """
         instances = []
         weights = []
-        # open the file
-        fh = file_stream(filename, encoding=encoding)
-        # parse the file
-        for line in fh:
-            line = line.strip()
-            # skip comments
-            if line.startswith('%'):
-                continue
-            # relation name
-            elif line.lower().startswith('@relation'):
-                tokens = line.split(None, 1)
-                if len(tokens) > 1:
-                    self.relation_name = tokens[1]
-            # attribute definition
-            elif line.lower().startswith('@attribute'):
-                attr_name, attr_type = line.split(None, 2)[1:]
-                self.attribs.append(Attribute(attr_name, attr_type))
-            # data section start
-            elif line.lower().startswith('@data'):
-                status = 'data'
-                if headers_only:  # stop after reading headers
-                    break
-            # data lines
-            elif status == 'data' and line != '':
-                inst, weight = self.__parse_line(line, line_num)
+        fh = file_stream(filename, mode='rb', encoding=None)
+        try:
+            for inst, weight in self.__read_arff_data(read_lines(fh, start, end,
+                                                                 encoding),
+                                                      0, columns):
                 instances.append(inst)
                 weights.append(weight)
-            line_num += 1
+        except (ValueError, TypeError), e:
+            raise type(e)(e.message + ' (in the part starting at byte ' +
+                          str(start) + ')')
         fh.close()
-        # store the resulting matrix
-        self.data = instances
-        self.inst_weights = weights
-        # remember attribute names
-        self.attribs_by_name = {attr.name: idx
-                                for idx, attr in enumerate(self.attribs)}
+        if self.is_sparse:
+            return self.__instances_to_data(instances), weights
+        # convert dense instances to an array
+        try:
+            values = np.array(instances, dtype=np.float64)
+            return values.reshape((len(instances), len(self.attribs))), weights
+        except ValueError:
+            return instances, weights
+
+    @staticmethod
+    def iter_arff(filename, encoding='UTF-8', batch_size=10000, cache=None,
+                  select_attrib=None, sample=None):
+        """\
+        Read an ARFF file/stream in batches, without loading all of it into
+        memory. The headers are parsed once, then DataSet objects with
+        at most batch_size instances are yielded.
+
+        All the batches share the same Attribute objects, so that string
+        attribute values are numbered consistently throughout the file.
+        At least one (possibly empty) batch is always yielded.
 
-    def save_to_arff(self, filename, encoding='UTF-8'):
+        @param filename: the ARFF file to read
+        @param encoding: the encoding (defaults to UTF-8)
+        @param batch_size: maximum number of instances in one batch
+        @param cache: use the binary cache of the file if it is valid \
+            (None/True = default) or ignore it (False)
+        @param select_attrib: names of attributes to load (None = all)
+        @param sample: read only a sample of the instances (see \
+            flect.sampling; None = all)
+        """
+        if batch_size < 1:
+            raise ValueError('Batch size must be positive.')
+        if sample is not None:
+            check_sample(sample)
+        headers = DataSet()
+        # read from cache
+        cached = load_cache(filename, encoding) if cache is not False else None
+        if cached is not None:
+            cached = headers.__sample_cached(cached, sample)
+            cached = headers.__select_cached(cached, select_attrib)
+            headers.__load_cached(cached, headers_only=True)
+            length = len(cached['weights'])
+            for start in xrange(0, max(length, 1), batch_size):
+                instances, weights = headers.__cached_instances(
+                        cached, start, min(start + batch_size, length))
+                yield headers.__batch_copy(instances, weights)
+            return
+        # read from the ARFF file
+        total = None
+        if sample is not None and needs_total(sample):
+            total = headers.__count_instances(filename, encoding)
+        fh = file_stream(filename, encoding=encoding)
+        line_num, columns = headers.__read_arff_header(fh, select_attrib)
+        instances = []
+        weights = []
+        yielded = False
+        for inst, weight in headers.__read_arff_data(fh, line_num, columns,
+                                                     sample, total):
+            instances.append(inst)
+            weights.append(weight)
+            if len(instances) >= batch_size:
+                yield headers.__batch_copy(instances, weights)
+                yielded = True
+                instances = []
+                weights = []
+        fh.close()
+        if instances or not yielded:
+            yield headers.__batch_copy(instances, weights)
+
+    def save_to_arff(self, filename, encoding='UTF-8', headers=True):
         """\
-        Save the data set to an ARFF file
+        Save the data set to an ARFF file.
+
+        If headers is set to False, only the data lines are written
+        (this allows to write several batches into one open stream).
         """
         # open the file
-        fh = file_stream(filename, 'w', encoding)
-        # print the relation name
-        print >> fh, '@relation ' + (self.relation_name
-                                     if self.relation_name is not None
-                                     else '<noname>')
-        # print the list of attributes
-        for attrib in self.attribs:
-            print >> fh, '@attribute ' + attrib.name + ' ' + \
-                    attrib.get_arff_type()
-        # print instances
-        print >> fh, '@data'
-        for inst, weight in zip(self.data, self.inst_weights):
-            print >> fh, self.__get_arff_line(inst, weight)
+        fh = file_stream(filename, 'w', encoding, index=True)
+        if headers:
+            # print the relation name
+            print >> fh, '@relation ' + (self.relation_name
+                                         if self.relation_name is not None
+                                         else '<noname>')
+            # print the list of attributes
+            for attrib in self.attribs:
+                print >> fh, '@attribute ' + attrib.name + ' ' + \
+                        attrib.get_arff_type()
+            # print instances
+            print >> fh, '@data'
+        self.__write_lines(fh, self.__get_value_tables())
+        if isinstance(filename, basestring):
+            fh.close()
 
     def save_to_csv(self, filename, encoding='UTF-8'):
+        """\
+        Save the data set to a CSV file (with attribute names on the first
+        line). Only dense data sets are supported.
+        """
         if self.is_sparse:
             raise Exception('CSV output not supported for sparse data sets!')
         fh = file_stream(filename, 'w', encoding)
         # header
         print >> fh, ','.join([attrib.name for attrib in self.attribs])
         # instances
-        for inst in self.data:
-            # undo some ARFF escaping (change \' to '')
-            line = re.sub(r'\\\'', r'\'\'', self.__get_arff_line(inst))
-            line = re.sub(r'\\', '', line)
-            print >> fh, line
+        self.__write_lines(fh, self.__get_value_tables(csv=True), False)
+        if isinstance(filename, basestring):
+            fh.close()
+
+    def save_to_mmap(self, dirname):
+        """\
+        Save the data set to a memory-mapped store in the given directory
+        (see flect.mmapstore), replacing any store there. The instances
+        are written in chunks.
+        """
+        writer = StoreWriter(dirname, self.__numeric_flags(), self.is_sparse)
+        try:
+            for start in xrange(0, len(self), self.WRITE_CHUNK):
+                writer.write(*self.__store_chunk(start,
+                                                 start + self.WRITE_CHUNK))
+            writer.close(self.relation_name, self.__frozen_attribs())
+        finally:
+            writer.abort()
+
+    def load_from_mmap(self, dirname, select_attrib=None, sample=None):
+        """\
+        Open a memory-mapped data set store (see flect.mmapstore). The values
+        are not loaded into memory; they are read from the disk as they are
+        needed and shared with all other processes that open the same store.
+
+        Subsets of dense data sets also share the values with the store until
+        they are changed; any changes are made in memory only.
+
+        @param dirname: the store directory
+        @param select_attrib: names of attributes to use (None = all)
+        @param sample: use only a sample of the instances (see \
+            flect.sampling; None = all); the sample is copied into memory
+        """
+        if not self.is_empty:
+            raise IOError('Cannot store second data set into the same object.')
+        if sample is not None:
+            check_sample(sample)
+        stored = open_store(dirname)
+        stored = self.__sample_cached(stored, sample)
+        stored = self.__select_cached(stored, select_attrib)
+        self.relation_name = stored['relation_name']
+        self.attribs = stored['attribs']
+        self.attribs_by_name = {attr.name: idx
+                                for idx, attr in enumerate(self.attribs)}
+        self.is_sparse = stored['is_sparse']
+        self.inst_weights = stored['weights']
+        if self.is_sparse:
+            self.data = stored['matrix']
+        else:
+            self.data = ColumnStore(stored['columns'], len(self.inst_weights))
+
+    @staticmethod
+    def arff_to_mmap(filename, dirname, encoding='UTF-8', batch_size=10000,
+                     select_attrib=None, sample=None):
+        """\
+        Convert an ARFF file/stream to a memory-mapped data set store
+        (see flect.mmapstore) without loading all of it into memory:
+        the file is read and written in batches of the given size
+        (see iter_arff() for the parameters).
+        """
+        writer = None
+        try:
+            for batch in DataSet.iter_arff(filename, encoding, batch_size,
+                                           select_attrib=select_attrib,
+                                           sample=sample):
+                if writer is None:
+                    writer = StoreWriter(dirname, batch.__numeric_flags(),
+                                         batch.is_sparse)
+                writer.write(*batch.__store_chunk(0, len(batch)))
+            # all batches share the attributes, the last one has all labels
+            writer.close(batch.relation_name, batch.__frozen_attribs())
+        finally:
+            if writer is not None:
+                writer.abort()
 
     def load_from_matrix(self, attr_list, matrix):
         """\
@@ -371,10 +681,10 @@ class DataSet(object):
         self.is_sparse = sp.issparse(matrix)
         # store data
         if self.is_sparse:
-            self.data = [matrix[line, :].tolil()
-                         for line in xrange(matrix.shape[0])]
+            self.data = sp.csr_matrix(matrix, dtype=np.float64, copy=True)
         else:
-            self.data = [matrix[line] for line in xrange(matrix.shape[0])]
+            self.data = ColumnStore.from_values(matrix, self.__numeric_flags())
+        self.inst_weights = np.ones(matrix.shape[0])
 
     def load_from_vect(self, attrib, vect):
         """\
@@ -387,7 +697,10 @@ class DataSet(object):
         self.attribs_by_name = {attrib.name: 0}
         self.is_sparse = False
         # store the data
-        self.data = [[attrib.soft_numeric_value(val, True)] for val in vect]
+        self.data = ColumnStore.from_values(
+                [[attrib.soft_numeric_value(val, True)] for val in vect],
+                self.__numeric_flags())
+        self.inst_weights = np.ones(len(self.data))
 
     def load_from_dict(self, data, attrib_types={}, attrib_order=[], sparse=False, default_val=None):
         """\
@@ -453,18 +766,79 @@ class DataSet(object):
     def get_headers(self):
         """\
         Return a copy of the headers of this data set (just attributes list,
-        relation name and sparse/dense setting)
+        relation name and sparse/dense setting). The labels of attributes
+        are shared until new labels are added (see Attribute.__copy__()).
 
         @rtype DataSet
         """
         ret = DataSet()
-        ret.attribs = copy.deepcopy(self.attribs)
-        ret.attribs_by_name = copy.deepcopy(self.attribs_by_name)
-        ret.data = []
-        ret.is_sparse = copy.deepcopy(self.is_sparse)
-        ret.relation_name = copy.deepcopy(self.relation_name)
+        ret.attribs = [copy.copy(attr) for attr in self.attribs]
+        ret.attribs_by_name = dict(self.attribs_by_name)
+        ret.is_sparse = self.is_sparse
+        ret.data = ret.__empty_data()
+        ret.relation_name = self.relation_name
         return ret
 
+    def memory_usage(self, deep=True):
+        """\
+        Return the memory used by this data set, in bytes, as a dictionary
+        with the following keys:
+
+        attribs = a list of triples (attribute name, label table size,
+            instance values size) for all attributes
+        index = the view index (dense data sets sharing values with another
+            data set, see subset()) or row pointers (sparse data sets)
+        weights = instance weights
+        headers = attribute objects and the attribute name index
+        total = sum of all the above
+
+        Values shared with other data sets are fully counted (e.g. the whole
+        columns of the original data set for subsets). If deep is set,
+        label strings are counted, too (see Attribute.memory_usage()).
+        """
+        if self.is_sparse:
+            data = self.data.tocsr()
+            counts = np.bincount(data.indices, minlength=len(self.attribs))
+            values = (counts * (data.data.itemsize +
+                                data.indices.itemsize)).tolist()
+            index = data.indptr.nbytes
+        else:
+            values = [col.nbytes for col in self.data.columns]
+            index = self.data.index.nbytes if self.data.is_view else 0
+        attribs = [(attr.name, attr.memory_usage(deep), size)
+                   for attr, size in zip(self.attribs, values)]
+        headers = sys.getsizeof(self.attribs) + \
+            sys.getsizeof(self.attribs_by_name) + \
+            sum(sys.getsizeof(attr) for attr in self.attribs)
+        if deep:
+            headers += sum(sys.getsizeof(attr.name) for attr in self.attribs)
+        usage = {'attribs': attribs, 'index': index,
+                 'weights': self.inst_weights.nbytes, 'headers': headers}
+        usage['total'] = sum(labels + size for _, labels, size in attribs) + \
+            index + usage['weights'] + headers
+        return usage
+
+    def freeze_headers(self):
+        """\
+        Convert the labels of all string and nominal attributes to compact
+        read-only tables (see Attribute.freeze()).
+        """
+        for attr in self.attribs:
+            attr.freeze()
+
+    def attrib_as_array(self, attrib):
+        """\
+        Return the specified attribute (by index or name) as a NumPy array
+        of floats in the internal representation: values of numeric
+        attributes, label codes of nominal and string attributes, NaN for
+        missing values.
+        """
+        if isinstance(attrib, basestring):
+            attrib = self.attrib_index(attrib)
+        if self.is_sparse:
+            return self.data[:, attrib].toarray()[:, 0]
+        return self.data.column(attrib)
+
     def attrib_as_vect(self, attrib, dtype=None):
         """\
         Return the specified attribute (by index or name) as a list
@@ -483,10 +857,7 @@ class DataSet(object):
         elif dtype == int:
             dtype = lambda x: int(x) if not math.isnan(x) else None
         # return the values
-        if self.is_sparse:
-            return [dtype(line[0, attrib]) for line in self.data]
-        else:
-            return [dtype(line[attrib]) for line in self.data]
+        return [dtype(val) for val in self.attrib_as_array(attrib).tolist()]
 
     def rename_attrib(self, old_name, new_name):
         """\
@@ -508,44 +879,17 @@ class DataSet(object):
         separ.is_sparse = self.is_sparse
         separ.relation_name = self.relation_name + \
                  '-sep-' + ",".join([str(attrib) for attrib in attribs])
-        separ.inst_weights = copy.deepcopy(self.inst_weights)
+        separ.inst_weights = self.inst_weights.copy()
+        keep = [idx for idx in xrange(len(self.attribs))
+                if idx not in attribs_set]
         # separate columns in sparse matrixes
         if self.is_sparse:
-            # cache column shifting (i.e. number of deleted to the left)
-            # and new indexes for the separated data
-            shifts = {idx: len([a for a in attribs if a < idx])
-                      for idx in xrange(len(self.attribs))}
-            for sep_idx, old_idx in enumerate(attribs):
-                shifts[old_idx] = old_idx - sep_idx
-            # separate data in individual instances
-            for inst in self.data:
-                # find sparse indexes to split-out
-                sep_inst = sp.lil_matrix((1, len(attribs)))
-                sep_cols = [col in attribs_set for col in inst.rows[0]]
-                # shift sparse column indexes
-                lshift = np.array([shifts[col] for col in inst.rows[0]])
-                inst.rows[0] -= lshift
-                # split out the desired columns
-                sep_inst.rows[0] = [col for col, sep
-                                    in zip(inst.rows[0], sep_cols) if sep]
-                inst.rows[0] = [col for col, sep
-                                in zip(inst.rows[0], sep_cols) if not sep]
-                sep_inst.data[0] = [val for val, sep
-                                    in zip(inst.data[0], sep_cols) if sep]
-                inst.data[0] = [val for val, sep
-                                in zip(inst.data[0], sep_cols) if not sep]
-                # update the original instance shape
-                inst._shape = (1, len(self.attribs) - len(attribs))
-                # add the separated data to the other data set
-                separ.data.append(sep_inst)
-        # separate columns in dense matrixes
+            separ.data = self.data[:, sorted(attribs_set)]
+            self.data = self.data[:, keep]
+        # separate columns in dense data
         else:
-            for idx, inst in enumerate(self.data):
-                self.data[idx] = [val for col, val in enumerate(inst)
-                                  if col not in attribs_set]
-                sep_inst = [val for col, val in enumerate(inst)
-                            if col in attribs_set]
-                separ.data.append(sep_inst)
+            separ.data = self.data.select(sorted(attribs_set))
+            self.data = self.data.select(keep)
         # separate metadata
         separ.attribs = [attr for idx, attr in enumerate(self.attribs)
                          if idx in attribs_set]
@@ -563,25 +907,14 @@ class DataSet(object):
         Accepts a list of names or indexes, or one name, or one index.
         """
         attribs, attribs_set = self.__get_attrib_list(attribs)
+        keep = [idx for idx in xrange(len(self.attribs))
+                if idx not in attribs_set]
         # delete columns in sparse matrixes
         if self.is_sparse:
-            # cache column shifting (i.e. number of deleted to the left)
-            lshifts = {idx: len([a for a in attribs if a < idx])
-                       for idx in xrange(len(self.attribs))}
-            for inst in self.data:
-                # find sparse indexes to remove
-                rem = [idx for idx, col in enumerate(inst.rows[0])
-                       if col in attribs_set]
-                # shift sparse column indexes
-                lshift = np.array([lshifts[col] for col in inst.rows[0]])
-                inst.rows[0] -= lshift
-                # remove the desired columns and update the shape
-                inst.rows[0] = np.delete(inst.rows[0], rem)
-                inst.data[0] = np.delete(inst.data[0], rem)
-                inst._shape = (1, len(self.attribs) - len(attribs))
-        # delete columns in dense matrixes
+            self.data = self.data[:, keep]
+        # delete columns in dense data
         else:
-            self.data = [np.delete(inst, attribs) for inst in self.data]
+            self.data = self.data.select(keep)
         # delete the attributes from metadata
         self.attribs = [attr for idx, attr in enumerate(self.attribs)
                         if not idx in attribs_set]
@@ -602,18 +935,11 @@ class DataSet(object):
             raise ValueError('Data sets are not compatible!')
         # merge instances
         if self.is_sparse:
-            for my_inst, other_inst in zip(self.data, other.data):
-                my_inst.rows[0].extend([col + len(self.attribs)
-                                        for col in other_inst.rows[0]])
-                my_inst.data[0].extend(other_inst.data[0])
-                my_inst._shape = (1, len(self.attribs) + len(other.attribs))
+            self.data = sp.hstack([self.data, other.data], 'csr')
         else:
-            for my_inst, other_inst in zip(self.data, other.data):
-                my_inst.extend(other_inst)
+            self.data.merge(other.data)
         # merge meta data
-        self.attribs.extend(other.attribs)
-        self.attribs_by_name = {attr.name: idx
-                                for idx, attr in enumerate(self.attribs)}
+        self.__add_attrib_headers(other.attribs)
         self.relation_name += '_' + other.relation_name
 
     def append(self, other):
@@ -625,14 +951,22 @@ class DataSet(object):
         self.__check_headers(other)
         # append the instances
         # update possible values for string and nominal using loose_nominal
-        for inst in other.data:
-            self.data.append(other.__convert_to_headers(inst, self, True))
-            self.inst_weights.extend(copy.deepcopy(other.inst_weights))
+        data = other.__remap_to_headers(self, True)
+        if self.is_sparse:
+            self.__append_rows(data)
+        else:
+            self.data.extend(data)
+        self.inst_weights = np.concatenate([self.inst_weights,
+                                            other.inst_weights])
 
     def add_attrib(self, attrib, values=None):
         """\
         Add a new attribute to the data set, with pre-filled values
-        (or missing, if not set).
+        (or missing, if not set). Values of numeric attributes may also be
+        given as a NumPy array.
+
+        The values are stored as a new column, the values of other attributes
+        are not touched (except in sparse data sets).
         """
         # create a vector of missing values, if none are given
         if values is None:
@@ -640,10 +974,23 @@ class DataSet(object):
         # if values are given, check vector size
         elif len(values) != len(self):
             raise ValueError('The size of the attribute vector must match!')
-        # create a temporary data set and merge
-        temp = DataSet()
-        temp.load_from_vect(attrib, values)
-        self.merge(temp)
+        # convert the values (allow adding values for nominal attributes)
+        attrib = copy.deepcopy(attrib)
+        if attrib.type == 'numeric' and isinstance(values, np.ndarray):
+            values = values.astype(np.float64)
+        else:
+            values = np.array([attrib.soft_numeric_value(val, True)
+                               for val in values], dtype=np.float64)
+        # add the column and the attribute (as when merging with
+        # an unnamed data set)
+        if self.is_sparse:
+            self.data = sp.hstack([self.data,
+                                   sp.csr_matrix(values[:, np.newaxis])],
+                                  'csr')
+        else:
+            self.data.add_columns([encode(values, attrib.type == 'numeric')])
+        self.__add_attrib_headers([attrib])
+        self.relation_name += '_'
 
     def match_headers(self, other, add_values=False):
         """\
@@ -657,8 +1004,7 @@ class DataSet(object):
         # sanity checks
         self.__check_headers(other)
         # go through nominal and string attribute values
-        for idx, inst in enumerate(self.data):
-            self.data[idx] = self.__convert_to_headers(inst, other, add_values)
+        self.data = self.__remap_to_headers(other, add_values)
         # copy the headers from other
         self.attribs = [copy.deepcopy(attr) for attr in other.attribs]
 
@@ -670,25 +1016,31 @@ class DataSet(object):
             attr_idx = self.attrib_index(attr_idx)
         attr = self.attribs[attr_idx]
         if self.is_sparse:
-            return attr.value(self.data[instance][0, attr_idx])
-        return attr.value(self.data[instance][attr_idx])
+            return attr.value(self.data[instance, attr_idx])
+        return attr.value(self.data.get(instance, attr_idx))
 
     def instance(self, index, dtype='dict', do_copy=True):
         """\
         Return the given instance as a dictionary (or a list, if specified).
 
-        If do_copy is set to False, do not create a copy of the list for
-        dense instances (other types must be copied anyway).
+        The do_copy parameter is ignored (instances are always created anew
+        from the stored values); it is kept for compatibility.
         """
-        inst = self.data[index]
+        if self.is_sparse:
+            cols, vals = self.__sparse_row(index)
+            if dtype == 'list':
+                inst = [0.0] * len(self.attribs)
+                for col, val in zip(cols, vals):
+                    inst[col] = val
+                return inst
+            elif dtype == 'dict':
+                return {self.attribs[attr].name: self.attribs[attr].value(val)
+                        for attr, val in zip(cols, vals)}
+            raise ValueError('Unsupported data type')
+        inst = self.data.row(index)
         if dtype == 'list':
-            if self.is_sparse:
-                return inst.toarray()[0].tolist()
-            return copy.deepcopy(inst) if do_copy else inst
+            return inst
         elif dtype == 'dict':
-            if self.is_sparse:
-                return {self.attribs[attr].name: self.attribs[attr].value(val)
-                        for attr, val in zip(inst.rows[0], inst.data[0])}
             return {self.attribs[attr].name: self.attribs[attr].value(val)
                     for attr, val in enumerate(inst)}
         raise ValueError('Unsupported data type')
@@ -697,18 +1049,22 @@ class DataSet(object):
         """\
         Return a data set representing a subset of this data set's values.
 
-        Args can be a slice or [start, ] stop [, stride] to create a slice.
-        No arguments result in a complete copy of the original.
+        Args can be a slice, a list of instance indexes, or [start, ] stop
+        [, stride] to create a slice. No arguments result in a complete
+        copy of the original.
 
         Kwargs may contain just one value -- if copy is set to false,
         the sliced values are removed from the original data set.
+
+        The values of dense data sets are not copied: the subset shares them
+        with the original until instances or attributes are added to it.
         """
         # obtain the real arguments
         if len(args) > 3:
             raise TypeError('Too many arguments')
         elif len(args) == 0:
             indexes = slice(len(self))
-        elif len(args) == 1 and isinstance(args[0], slice):
+        elif len(args) == 1 and isinstance(args[0], (slice, list)):
             indexes = args[0]
         else:
             indexes = slice(*args)
@@ -716,24 +1072,21 @@ class DataSet(object):
             raise TypeError('Unsupported keyword arguments')
         keep_copy = kwargs.get('copy', True)
         # copy metadata
-        subset = self.__metadata_copy('_slice_' + str(indexes.start) +
-                                      '-' + str(indexes.stop) +
-                                      '-' + str(indexes.step))
-        # copy/move instances
-        if keep_copy:
-            subset.data = [copy.deepcopy(self.data[idx])
-                           for idx in xrange(*indexes.indices(len(self)))]
-            subset.inst_weights = [self.inst_weights[idx] for idx
-                                   in xrange(*indexes.indices(len(self)))]
+        if isinstance(indexes, list):
+            idxs = indexes
+            subset = self.__metadata_copy('_subset')
         else:
             idxs = range(*indexes.indices(len(self)))
-            subset.data = [self.data[idx] for idx in idxs]
-            subset.inst_weights = [self.inst_weights[idx] for idx in idxs]
-            idxs_set = set(idxs)
-            self.data = [self.data[idx] for idx in xrange(len(self))
-                         if not idx in idxs_set]
-            self.inst_weights = [self.inst_weights[idx] for idx
-                                 in xrange(len(self)) if not idx in idxs_set]
+            subset = self.__metadata_copy('_slice_' + str(indexes.start) +
+                                          '-' + str(indexes.stop) +
+                                          '-' + str(indexes.step))
+        # copy/move instances
+        subset.data, subset.inst_weights = self.__take_rows(idxs)
+        if not keep_copy:
+            rest = np.ones(len(self), dtype=bool)
+            rest[np.asarray(idxs, dtype=np.intp)] = False
+            self.data, self.inst_weights = self.__take_rows(
+                    np.flatnonzero(rest))
         return subset
 
     def filter(self, filter_func, keep_copy=True):
@@ -743,32 +1096,40 @@ class DataSet(object):
 
         The filtering function must take two arguments - current instance
         index and the instance itself in an attribute-value dictionary
-        form - and return a boolean.
+        form - and return a boolean. A column expression condition may
+        be given instead (see where()).
 
         If keep_copy is set to False, filtered instances will be removed from
         the original data set.
         """
         filtered = self.__metadata_copy('_filtered')
-        filt_res = [filter_func(idx, self.instance(idx))
-                    for idx in xrange(len(self))]
-        true_idxs = [idx for idx, res in enumerate(filt_res) if res]
-        if keep_copy:
-            filtered.data = [copy.deepcopy(self.data[idx])
-                             for idx in true_idxs]
-            filtered.inst_weights = [self.inst_weights[idx]
-                                     for idx in true_idxs]
+        if isinstance(filter_func, Condition):
+            filt_res = filter_func.mask(self)
         else:
-            false_idxs = [idx for idx, res in enumerate(filt_res) if not res]
-            data_true = [self.data[idx] for idx in true_idxs]
-            weights_true = [self.inst_weights[idx] for idx in true_idxs]
-            data_false = [self.data[idx] for idx in false_idxs]
-            weights_false = [self.inst_weights[idx] for idx in false_idxs]
-            self.data = data_false
-            self.inst_weights = weights_false
-            filtered.data = data_true
-            filtered.inst_weights = weights_true
+            filt_res = np.array([bool(filter_func(idx, self.instance(idx)))
+                                 for idx in xrange(len(self))], dtype=bool)
+        filtered.data, filtered.inst_weights = self.__take_rows(
+                np.flatnonzero(filt_res))
+        if not keep_copy:
+            self.data, self.inst_weights = self.__take_rows(
+                    np.flatnonzero(~filt_res))
         return filtered
 
+    def where(self, cond, keep_copy=True):
+        """\
+        Return a data set with the instances that satisfy the given column
+        expression condition, e.g. col('Tag_POS') == 'N' (see the colexpr
+        module). The condition is evaluated on whole attribute columns,
+        without creating the instances in dictionary form.
+
+        If keep_copy is set to False, the selected instances will be removed
+        from the original data set.
+        """
+        if not isinstance(cond, Condition):
+            raise TypeError('Not a column expression condition: ' +
+                            repr(cond))
+        return self.filter(cond, keep_copy)
+
     def split(self, split_func, keep_copy=True):
         """\
         Split the data set using a splitting function and return a dictionary
@@ -778,81 +1139,538 @@ class DataSet(object):
 
         The splitting function takes two arguments - the current instance index
         and the instance itself as an attribute-value dictionary. Its return
-        value determines the split.
+        value determines the split. A column expression may be given instead
+        (e.g. col('Tag_POS'), see the colexpr module); its values are then
+        used to split the data set, with instances with missing values
+        (None or NaN) under the key None.
 
         If keep_copy is set to False, ALL instances will be removed from
         the original data set.
         """
+        idxs = {}
+        if isinstance(split_func, Expression):
+            # group instances by value codes, then codes by their values
+            codes, table = split_func.table(self)
+            order = np.argsort(codes, kind='mergesort')
+            bounds = np.flatnonzero(np.diff(codes[order])) + 1
+            for code_idxs in np.split(order, bounds) if len(self) else []:
+                key = table[codes[code_idxs[0]]]
+                if isinstance(key, float) and key != key:
+                    key = None
+                idxs.setdefault(key, []).append(code_idxs)
+            idxs = {key: np.sort(np.concatenate(parts))
+                    for key, parts in idxs.iteritems()}
+        else:
+            for idx in xrange(len(self)):
+                key = split_func(idx, self.instance(idx))
+                idxs.setdefault(key, []).append(idx)
         ret = {}
-        for idx in xrange(len(self)):
-            key = split_func(idx, self.instance(idx))
-            if not key in ret:
-                ret[key] = self.__metadata_copy('_split_' + key)
-            if keep_copy:
-                ret[key].data.append(self.data[idx])
-            else:
-                ret[key].data.append(copy.deepcopy(self.data[idx]))
+        for key, key_idxs in idxs.iteritems():
+            name = '?' if key is None else unicode(key)
+            ret[key] = self.__metadata_copy('_split_' + name)
+            ret[key].data, ret[key].inst_weights = self.__take_rows(key_idxs)
         if not keep_copy:
-            self.data = []
+            self.data = self.__empty_data()
+            self.inst_weights = np.zeros(0)
         return ret
 
-    def __parse_line(self, line, line_num):
-        """"\
-        Parse one ARFF data line (dense or sparse, return appropriate
-        array).
-        """
-        # check weight, if needed
-        weight = 1.0
-        match_weight = re.search(r',\s*\{([0-9]+(\.[0-9]*)?|\.[0-9]+)\}$',
-                                 line)
-        if match_weight:
-            weight = float(match_weight.group(1))
-            line = re.sub(r',\s*\{[^\{\}]+\}$', '', line)
-        # sparse instance
-        if line.startswith('{'):
-            self.is_sparse = True  # trigger sparseness
-            line = line.strip('{}') + ','  # append comma to match last value
-            values = np.zeros(len(self.attribs))
-            # capture all fields
-            for match in re.finditer(self.SPARSE_FIELD, line):
-                # extract index and value
-                idx, val = match.group(1, 2)
-                idx = int(idx)
-                # undefined value
-                if val == '?':
-                    values[idx] = float('NaN')
-                # quoted value
-                elif re.match(r'^[\'"].*[\'"]$', val):
-                    val = val[1:-1]
-                    val = re.sub(r'\\(' + self.SPEC_CHARS + ')', r'\1', val)
-                    values[idx] = self.__get_numeric_value(idx, val, line_num)
-                # plain value
+    def __read_arff_header(self, fh, select_attrib=None):
+        """\
+        Read ARFF headers from the given open stream, up to and including
+        the @data line. Only keep the given attributes if select_attrib
+        is set.
+
+        Return the number of lines read and the positions of all file
+        attributes in this data set (None for skipped ones; the whole list
+        is None if all attributes are kept).
+        """
+        line_num = 0
+        for line in fh:
+            line_num += 1
+            line = line.strip()
+            # skip comments
+            if line.startswith('%'):
+                continue
+            # relation name
+            elif line.lower().startswith('@relation'):
+                tokens = line.split(None, 1)
+                if len(tokens) > 1:
+                    self.relation_name = tokens[1]
+            # attribute definition
+            elif line.lower().startswith('@attribute'):
+                attr_name, attr_type = line.split(None, 2)[1:]
+                self.attribs.append(Attribute(attr_name, attr_type))
+            # data section start
+            elif line.lower().startswith('@data'):
+                break
+        # select attributes
+        columns = None
+        if select_attrib is not None:
+            select_attrib = set(select_attrib)
+            columns = []
+            attribs = []
+            for attr in self.attribs:
+                columns.append(len(attribs) if attr.name in select_attrib
+                               else None)
+                if attr.name in select_attrib:
+                    attribs.append(attr)
+            self.attribs = attribs
+        # remember attribute names
+        self.attribs_by_name = {attr.name: idx
+                                for idx, attr in enumerate(self.attribs)}
+        return line_num, columns
+
+    def __read_arff_data(self, fh, line_num=0, columns=None, sample=None,
+                         total=None):
+        """\
+        Parse ARFF data lines from the given open stream (positioned
+        after the headers), yield (instance, weight) pairs. Only load
+        some of the file attributes if their positions are given in
+        columns (see __read_arff_header). If sample is set, only the
+        sampled lines are parsed (total is the number of instances in the
+        file, if known).
+        """
+        limit = None
+        if columns is None:
+            columns = range(len(self.attribs))
+        elif None in columns:
+            # number of dense values to parse (up to the last selected one)
+            limit = max([idx + 1 for idx, col in enumerate(columns)
+                         if col is not None] + [1])
+        converters = [self.attribs[col].numeric_value if col is not None
+                      else None for col in columns]
+        lines = self.__data_lines(fh, line_num)
+        if sample is not None:
+            lines = sample_items(lines, sample, total,
+                                 self.__get_sample_key(sample, columns))
+        for line_num, line in lines:
+            yield self.__parse_line(line, line_num, converters, columns,
+                                    limit)
+
+    def __data_lines(self, fh, line_num=0):
+        """\
+        Yield (line number, line) pairs for all ARFF data lines in the
+        given open stream (skipping comments and empty lines).
+        """
+        for line in fh:
+            line_num += 1
+            line = line.strip()
+            # skip comments and empty lines
+            if line == '' or line.startswith('%'):
+                continue
+            yield line_num, line
+
+    def __get_sample_key(self, sample, columns):
+        """\
+        Return a function that finds the value of the stratification
+        attribute in a (line number, line) pair without parsing the whole
+        line (or None if the sample is not stratified).
+
+        The keys are the same as used for cached data (see
+        __sample_cached()): numeric values and label codes as floats (absent
+        sparse values are 0), None for missing values. String values are
+        numbered in the order of their appearance in the file, as when
+        the whole file is loaded.
+        """
+        mode, _, attrib = check_sample(sample)
+        if mode != 'stratified':
+            return None
+        if attrib not in self.attribs_by_name:
+            raise ValueError('Cannot stratify by attribute ' + attrib +
+                             ', which is not loaded.')
+        attr = self.attribs[self.attribs_by_name[attrib]]
+        col = columns.index(self.attribs_by_name[attrib])
+        codes = {}
+
+        def key(item):
+            line_num, line = item
+            line = split_weight(line)[0]
+            try:
+                if line.startswith('{'):
+                    vals = dict(split_sparse(line[1:-1] if line.endswith('}')
+                                             else line[1:]))
+                    if col not in vals:
+                        return 0.0
+                    val = vals[col]
                 else:
-                    val = val.strip()
-                    values[idx] = self.__get_numeric_value(idx, val, line_num)
-            # return in sparse format
-            return sp.lil_matrix(values), weight
-        # dense instance
+                    vals = split_dense(line, col + 1)
+                    val = vals[col] if len(vals) > col else None
+                if val is None:
+                    return None
+                if attr.type == 'string':
+                    return float(codes.setdefault(val, len(codes)))
+                return float(attr.numeric_value(val))
+            except ValueError, e:
+                raise ValueError(e.message + ' on line ' + str(line_num))
+        return key
+
+    def __count_instances(self, filename, encoding):
+        """\
+        Return the number of instances in an ARFF file, without parsing
+        them (used for sampling a part of the file).
+        """
+        if not isinstance(filename, basestring):
+            raise ValueError('Sampling a part of the instances is ' +
+                             'not possible with streams.')
+        fh = file_stream(filename, mode='rb', encoding=None)
+        total = count_data_lines(fh, encoding)
+        fh.close()
+        return total
+
+    def __load_cached(self, cached, headers_only=False, select_attrib=None):
+        """\
+        Fill in the data structures from a loaded ARFF cache (keeping only
+        the given attributes if select_attrib is set).
+        """
+        cached = self.__select_cached(cached, select_attrib)
+        self.relation_name = cached['relation_name']
+        self.attribs = cached['attribs']
+        self.attribs_by_name = {attr.name: idx
+                                for idx, attr in enumerate(self.attribs)}
+        self.is_sparse = cached['is_sparse']
+        if not headers_only:
+            self.data, self.inst_weights = self.__cached_instances(
+                    cached, 0, len(cached['weights']))
+
+    def __select_cached(self, cached, select_attrib):
+        """\
+        Return a loaded ARFF cache with only the given attributes
+        (or the same cache if select_attrib is None).
+        """
+        if select_attrib is None:
+            return cached
+        select_attrib = set(select_attrib)
+        keep = [idx for idx, attr in enumerate(cached['attribs'])
+                if attr.name in select_attrib]
+        ret = dict(cached)
+        ret['attribs'] = [cached['attribs'][idx] for idx in keep]
+        if 'columns' in cached:
+            ret['columns'] = [cached['columns'][idx] for idx in keep]
+        if 'matrix' in cached:
+            ret['matrix'] = cached['matrix'][:, keep].tocsr()
+        return ret
+
+    def __sample_cached(self, cached, sample):
+        """\
+        Return a loaded ARFF cache with only a sample of the instances
+        (or the same cache if sample is None).
+        """
+        if sample is None:
+            return cached
+        mode, _, attrib = check_sample(sample)
+        length = len(cached['weights'])
+        key = None
+        if mode == 'stratified':
+            names = [attr.name for attr in cached['attribs']]
+            if attrib not in names:
+                raise ValueError('Cannot stratify by attribute ' + attrib +
+                                 ', which is not present.')
+            idx = names.index(attrib)
+            if 'matrix' in cached:
+                vals = cached['matrix'][:, idx].toarray().ravel().tolist()
+            else:
+                vals = decode(cached['columns'][idx]).tolist()
+            # missing values (NaN) must all have the same key (the keys are
+            # the same as for ARFF files, see __get_sample_key())
+            key = lambda pos: vals[pos] if vals[pos] == vals[pos] else None
+        idxs = np.fromiter(sample_items(xrange(length), sample, length, key),
+                           dtype=np.int64)
+        ret = dict(cached)
+        ret['weights'] = cached['weights'][idxs]
+        if 'columns' in cached:
+            ret['columns'] = [col[idxs] for col in cached['columns']]
+        if 'matrix' in cached:
+            ret['matrix'] = cached['matrix'][idxs]
+        return ret
+
+    def __cached_instances(self, cached, start, stop):
+        """\
+        Return instances and weights in the given range from a loaded ARFF
+        cache (in the format used by this data set).
+        """
+        weights = cached['weights'][start:stop]
+        if self.is_sparse:
+            return cached['matrix'][start:stop], weights
+        # the (memory-mapped) arrays are used as they are
+        return ColumnStore([col[start:stop] for col in cached['columns']],
+                           len(weights)), weights
+
+    def __load_arff_parallel(self, filename, encoding, workers,
+                             select_attrib=None):
+        """\
+        Load an ARFF file, parsing its data section in parallel by the
+        given number of worker processes.
+        """
+        # read the headers
+        fh = file_stream(filename, encoding=encoding)
+        _, columns = self.__read_arff_header(fh, select_attrib)
+        fh.close()
+        # split the data section into parts
+        fh = file_stream(filename, mode='rb', encoding=None)
+        parts = split_data_section(fh, encoding, workers)
+        fh.close()
+        # string attributes start with a placeholder value in the workers,
+        # so that no actual value is coded as 0 (and omitted in sparse data)
+        headers = self.get_headers()
+        for attr in headers.attribs:
+            if attr.type == 'string':
+                attr.labels = [None]
+                attr.values = {None: 0}
+        # parse the data and merge the results in the file order
+        pool = Pool(min(workers, len(parts)))
+        try:
+            for part_data in pool.imap(_parse_arff_part,
+                                       [(headers, filename, start, end,
+                                         encoding, columns)
+                                        for start, end in parts]):
+                self.__merge_arff_part(*part_data)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def __merge_arff_part(self, labels, is_sparse, values, weights):
+        """\
+        Add instances parsed by a worker process to this data set, converting
+        the worker's string attribute value codes to this data set's codes.
+        """
+        # build value code conversion tables for string attributes
+        remaps = {}
+        for idx, (attr, part_labels) in enumerate(zip(self.attribs, labels)):
+            if part_labels is not None:
+                remap = np.zeros(len(part_labels))
+                for code, label in enumerate(part_labels[1:], start=1):
+                    remap[code] = attr.numeric_value(label)
+                remaps[idx] = remap
+        # convert and store the instances
+        if is_sparse:
+            for idx, remap in remaps.iteritems():
+                mask = (values.indices == idx) & ~np.isnan(values.data)
+                values.data[mask] = remap[values.data[mask].astype(int)]
+            values.eliminate_zeros()
+            self.data = (sp.vstack([self.data, values], 'csr')
+                         if self.is_sparse else values)
+            self.is_sparse = True
+        elif isinstance(values, np.ndarray):
+            for idx, remap in remaps.iteritems():
+                col = values[:, idx]
+                mask = ~np.isnan(col)
+                col[mask] = remap[col[mask].astype(int)]
+            self.data.append(values, self.__numeric_flags())
         else:
-            values = []
-            line += ','  # append comma to match last value
-            for match in re.finditer(self.DENSE_FIELD, line):
-                val = match.group(1)
-                # undefined value
-                if val == '?':
-                    values.append(float('NaN'))
-                # quoted value
-                elif re.match(r'^[\'"].*[\'"]$', val):
-                    val = val[1:-1]
-                    val = re.sub(r'\\(' + self.SPEC_CHARS + ')', r'\1', val)
-                    values.append(self.__get_numeric_value(len(values),
-                                                           val, line_num))
-                # plain value
-                else:
-                    val = val.strip()
-                    values.append(self.__get_numeric_value(len(values),
-                                                           val, line_num))
-            return values, weight
+            for inst in values:
+                for idx, remap in remaps.iteritems():
+                    if idx < len(inst) and not math.isnan(inst[idx]):
+                        inst[idx] = float(remap[int(inst[idx])])
+            self.data.append(values, self.__numeric_flags())
+        self.inst_weights = np.concatenate([self.inst_weights, weights])
+
+    def __collect_instances(self, pairs):
+        """\
+        Convert parsed (instance, weight) pairs to the format used by this
+        data set, return the data and an array of weights. The instances
+        are converted in chunks, so that only a few of them are held as lists
+        of values at a time.
+        """
+        parts = []
+        weights = []
+        instances = []
+        for inst, weight in pairs:
+            instances.append(inst)
+            weights.append(weight)
+            if len(instances) >= self.READ_CHUNK:
+                parts.append(self.__instances_to_data(instances))
+                instances = []
+        if instances or not parts:
+            parts.append(self.__instances_to_data(instances))
+        weights = np.array(weights, dtype=np.float64)
+        if len(parts) == 1:
+            return parts[0], weights
+        if self.is_sparse:
+            return sp.vstack(parts, 'csr'), weights
+        data = parts[0]
+        for part in parts[1:]:
+            data.extend(part)
+        return data, weights
+
+    def __instances_to_data(self, instances):
+        """\
+        Convert a list of parsed instances to the format used by this data set
+        (a CSR matrix for sparse data sets, built at once from the lists of
+        column indexes and values of all instances, or a column store for
+        dense data sets). Matrices and column stores are returned unchanged.
+        """
+        if sp.issparse(instances) or isinstance(instances, ColumnStore):
+            return instances
+        if not self.is_sparse:
+            return ColumnStore.from_values(instances, self.__numeric_flags())
+        indptr = [0]
+        indices = []
+        values = []
+        for cols, vals in instances:
+            indices.extend(cols)
+            values.extend(vals)
+            indptr.append(len(indices))
+        return sp.csr_matrix((np.array(values, dtype=np.float64),
+                              np.array(indices, dtype=np.int32),
+                              np.array(indptr, dtype=np.int32)),
+                             shape=(len(instances), len(self.attribs)))
+
+    def __empty_data(self):
+        """\
+        Return an empty data storage for this data set (an empty column
+        store or an empty CSR matrix for sparse data sets).
+        """
+        if self.is_sparse:
+            return sp.csr_matrix((0, len(self.attribs)))
+        return ColumnStore.from_values([], self.__numeric_flags())
+
+    def __add_attrib_headers(self, attribs):
+        """\
+        Append the given attributes to the attribute list and the index
+        of attribute names.
+        """
+        for attr in list(attribs):
+            self.attribs_by_name[attr.name] = len(self.attribs)
+            self.attribs.append(attr)
+
+    def __store_chunk(self, start, stop):
+        """\
+        Return the values (a 2-D float array or a CSR matrix) and weights
+        of the given range of instances, for writing into a data set store.
+        """
+        if self.is_sparse:
+            return self.data[start:stop], self.inst_weights[start:stop]
+        return self.data.values(start, stop), self.inst_weights[start:stop]
+
+    def __frozen_attribs(self):
+        """\
+        Return frozen copies of the attributes of this data set.
+        """
+        headers = self.get_headers()
+        headers.freeze_headers()
+        return headers.attribs
+
+    def __numeric_flags(self):
+        """\
+        Return a list of booleans telling which attributes are numeric
+        (used to set up the column store).
+        """
+        return [attr.type == 'numeric' for attr in self.attribs]
+
+    def __rows(self):
+        """\
+        Return all instances as lists of values.
+        """
+        if self.is_sparse:
+            return [self.instance(idx, 'list') for idx in xrange(len(self))]
+        return self.data.values().tolist()
+
+    def __take_rows(self, idxs):
+        """\
+        Return the data and weights of the instances with the given indexes
+        (a list or an array).
+        """
+        idxs = np.asarray(idxs, dtype=np.intp)
+        if self.is_sparse:
+            return self.__sparse_rows(idxs), self.inst_weights[idxs]
+        return self.data.take(idxs), self.inst_weights[idxs]
+
+    def __sparse_row(self, index):
+        """\
+        Return the column indexes and values of the given instance of
+        a sparse data set, as two lists.
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Instance index out of range')
+        start, end = self.data.indptr[index], self.data.indptr[index + 1]
+        return (self.data.indices[start:end].tolist(),
+                self.data.data[start:end].tolist())
+
+    def __sparse_rows(self, idxs):
+        """\
+        Return a CSR matrix with the given instances (rows) of a sparse
+        data set.
+        """
+        if not len(idxs):
+            return sp.csr_matrix((0, len(self.attribs)))
+        return self.data[idxs]
+
+    def __append_rows(self, rows):
+        """\
+        Append instances given as pairs of lists of column indexes and values
+        (or as a CSR matrix) to a sparse data set (whose attribute list may
+        have grown).
+        """
+        data = self.data
+        if not sp.issparse(data):
+            data = self.__empty_data()
+        elif data.shape[1] < len(self.attribs):
+            data = sp.csr_matrix((data.data, data.indices, data.indptr),
+                                 shape=(data.shape[0], len(self.attribs)))
+        self.data = sp.vstack([data, self.__instances_to_data(rows)], 'csr')
+
+    def __batch_copy(self, instances, weights):
+        """\
+        Return a data set with the given instances and weights which shares
+        the attributes of this data set (used for batch reading).
+        """
+        batch = DataSet()
+        batch.relation_name = self.relation_name
+        batch.is_sparse = self.is_sparse
+        batch.attribs = list(self.attribs)
+        batch.attribs_by_name = dict(self.attribs_by_name)
+        batch.data = self.__instances_to_data(instances)
+        batch.inst_weights = np.asarray(weights, dtype=np.float64)
+        return batch
+
+    def __parse_line(self, line, line_num, converters, columns, limit=None):
+        """\
+        Parse one ARFF data line (dense or sparse, return a list of values
+        or a pair of lists of column indexes and values, respectively).
+        Use the given list of value conversion functions (numeric_value()
+        for all attributes, None for skipped ones) and positions of the
+        attributes in this data set. If limit is set, only the given number
+        of dense values is parsed.
+        """
+        line, weight = split_weight(line)
+        try:
+            # sparse instance
+            if line.startswith('{'):
+                self.is_sparse = True  # trigger sparseness
+                values = {}
+                for idx, val in split_sparse(line[1:-1] if line.endswith('}')
+                                             else line[1:]):
+                    if idx >= len(converters):
+                        raise TypeError('Attribute number ' + str(idx) +
+                                        ' out of range on line ' +
+                                        str(line_num))
+                    if converters[idx] is not None:
+                        values[columns[idx]] = (converters[idx](val)
+                                                if val is not None else NAN)
+                # return in sparse format (column indexes and values,
+                # without zeros)
+                cols = sorted(col for col, val in values.iteritems()
+                              if val != 0)
+                return (cols, [values[col] for col in cols]), weight
+            # dense instance, all attributes
+            if limit is None:
+                vals = split_dense(line)
+                if len(vals) > len(converters):
+                    raise TypeError('Attribute number ' +
+                                    str(len(converters)) +
+                                    ' out of range on line ' + str(line_num))
+                return [conv(val) if val is not None else NAN
+                        for conv, val in zip(converters, vals)], weight
+            # dense instance, selected attributes (the rest of the line
+            # after the last selected attribute is not parsed)
+            vals = split_dense(line, limit)
+            return [conv(val) if val is not None else NAN
+                    for conv, val in zip(converters, vals)
+                    if conv is not None], weight
+        except ValueError, e:
+            raise ValueError(e.message + ' on line ' + str(line_num))
 
     def __add_from_dict(self, data, add_attribs, add_values, attrib_types={}, default_val=None):
         """\
@@ -888,15 +1706,23 @@ class DataSet(object):
                 inst[idx] = val
             buf.append(inst)
         # convert instances to numeric representation and add to my list
+        rows = []
         for str_inst in buf:
             if len(str_inst) < len(self.attribs):
                 str_inst += [default_val] * (len(self.attribs) - len(str_inst))
             inst = [self.get_attrib(idx).soft_numeric_value(val, add_values)
                     for idx, val in enumerate(str_inst)]
             if self.is_sparse:
-                inst = sp.lil_matrix(inst)
-            self.data.append(inst)
-            self.inst_weights.append(1.0)
+                rows.append(([col for col, val in enumerate(inst) if val != 0],
+                             [val for val in inst if val != 0]))
+            else:
+                rows.append(inst)
+        if self.is_sparse:
+            self.__append_rows(rows)
+        else:
+            self.data.append(rows, self.__numeric_flags())
+        self.inst_weights = np.concatenate([self.inst_weights,
+                                            np.ones(len(rows))])
 
     def __get_attrib_list(self, attribs):
         """\
@@ -927,85 +1753,154 @@ class DataSet(object):
                 raise ValueError('Attributes ' + str(my_attr) + ' and ' +
                                  str(other_attr) + ' must be of the same type!')
 
-    def __convert_to_headers(self, inst, other, add_values):
-        """\
-        Convert numeric values for an instance to match the string/nominal
-        headers of the given data set. Returns a new instance (dense or
-        sparse).
-        """
-        if other.is_sparse:
-            # convert through dense as 0 may have a different meaning
-            vals = [self.attribs[col].value(val)
-                    for col, val in enumerate(inst.toarray()[0])]
-            vals = [other.attribs[col].soft_numeric_value(val, add_values)
-                    for col, val in enumerate(vals)]
-            new_inst = sp.lil_matrix((1, len(other.attribs)))
-            new_inst.rows[0] = [col for col, val in enumerate(vals)
-                                if val != 0]
-            new_inst.data[0] = [val for col, val in enumerate(vals)
-                                if val != 0]
-            return new_inst
-        # dense data sets
-        else:
-            vals = [self.attribs[col].value(val)
-                    for col, val in enumerate(inst)]
-            return [other.attribs[col].soft_numeric_value(val, add_values)
-                              for col, val in enumerate(vals)]
-
-    def __get_numeric_value(self, attr_num, value, line_num):
-        """\
-        Return the attribute value as a float,
-        i.e. convert the string value to number for numeric attributes,
-        look up the value number for nominal ones and keep track of possible
-        values for string attributes.
-        """
-        if attr_num >= len(self.attribs):
-            raise TypeError('Attribute number ' + str(attr_num) +
-                            ' out of range on line ' + str(line_num))
-        attr = self.attribs[attr_num]
-        try:
-            return attr.numeric_value(value)
-        except ValueError, e:
-            raise ValueError(e.message + ' on line ' + str(line_num))
+    def __remap_to_headers(self, other, add_values):
+        """\
+        Return the values of this data set converted to match the
+        string/nominal headers of the given data set, in its storage format
+        (a CSR matrix or a ColumnStore). Label codes of each attribute are
+        converted using a table computed just once (see __remap_table()).
+        """
+        if self.is_sparse:
+            matrix = self.data.tocsc()
+        columns = []
+        for idx, attr in enumerate(self.attribs):
+            # convert through dense columns as 0 may have a different meaning
+            if self.is_sparse:
+                start, end = matrix.indptr[idx:idx + 2]
+                values = np.zeros(len(self))
+                values[matrix.indices[start:end]] = matrix.data[start:end]
+            else:
+                values = self.data.column(idx)
+            if attr.type != 'numeric':
+                table = self.__remap_table(attr, values, other.attribs[idx],
+                                           add_values)
+                codes = np.where(np.isnan(values), len(table) - 1, values)
+                values = np.take(table, codes.astype(np.intp))
+            columns.append(values)
+        if not other.is_sparse:
+            return ColumnStore([encode(values, attr.type == 'numeric')
+                                for values, attr in zip(columns, other.attribs)],
+                               len(self))
+        nonzero = [np.flatnonzero(values) for values in columns]
+        data = np.concatenate([np.zeros(0)] + [values[nz] for values, nz
+                                               in zip(columns, nonzero)])
+        indices = np.concatenate([np.zeros(0, dtype=np.intp)] + nonzero)
+        indptr = np.cumsum([0] + [len(nz) for nz in nonzero])
+        return sp.csc_matrix((data, indices, indptr),
+                             shape=(len(self), len(columns))).tocsr()
+
+    def __remap_table(self, attr, values, other_attr, add_values):
+        """\
+        Return a table (a float array) which maps the label codes of
+        a string/nominal attribute to the label codes of the corresponding
+        attribute of another data set, with NaN for unknown labels
+        (or the labels are added to the other attribute if add_values is
+        set). Only labels that occur in the given values are converted,
+        in the order of their first occurrence. The last entry of the table
+        is NaN, for missing values.
+        """
+        table = np.empty(len(attr.labels) + 1)
+        table.fill(np.nan)
+        uniq, first = np.unique(values[~np.isnan(values)], return_index=True)
+        for code in uniq[np.argsort(first)].astype(int).tolist():
+            table[code] = other_attr.soft_numeric_value(attr.labels[code],
+                                                        add_values)
+        return table
+
+    def __write_lines(self, fh, tables, weights=True):
+        """\
+        Write all instances as ARFF (or CSV) data lines to the given
+        stream, in large chunks.
+        """
+        for start in xrange(0, len(self), self.WRITE_CHUNK):
+            lines = self.__get_arff_lines(tables, start,
+                                          start + self.WRITE_CHUNK, weights)
+            fh.write('\n'.join(lines) + '\n')
+
+    def __get_value_tables(self, csv=False):
+        """\
+        Return a list of output string tables for all attributes (indexed by
+        label codes, with '?' for missing values appended at the end),
+        or None for numeric attributes. The labels are escaped and quoted
+        just once for the whole data set.
 
-    def __get_arff_line(self, inst, weight=1.0):
+        If csv is set, the ARFF escaping is partially undone (\\' is changed
+        to '' and other backslashes are removed).
+        """
+        tables = []
+        for attrib in self.attribs:
+            if attrib.type == 'numeric':
+                tables.append(None)
+                continue
+            table = [quote(label) for label in attrib.labels]
+            if csv:
+                table = [label.replace('\\\'', '\'\'').replace('\\', '')
+                         for label in table]
+            tables.append(table + ['?'])
+        return tables
+
+    def __get_arff_lines(self, tables, start, stop, weights=True):
         """\
-        Return a sparse or a dense ARFF data line
+        Return a list of sparse or dense ARFF data lines for the given
+        range of instances, using the given output string tables.
+        Instance weights are included only if weights is set.
         """
         if self.is_sparse:
-            ret = "{" + ",".join([str(int(idx)) + ' ' +
-                                  self.__get_arff_val(idx, attr)
-                                  for idx, attr in zip(inst.rows[0],
-                                                       inst.data[0])]) + '}'
+            idx_strs = [str(idx) + ' ' for idx in xrange(len(self.attribs))]
+            chunk = self.data[start:stop]
+            chunk.sort_indices()
+            indptr = chunk.indptr.tolist()
+            indices = chunk.indices.tolist()
+            values = chunk.data.tolist()
+            lines = ['{' + ','.join([idx_strs[idx] +
+                                     self.__get_output_val(tables, idx, val)
+                                     for idx, val in zip(indices[beg:end],
+                                                         values[beg:end])]) +
+                     '}' for beg, end in zip(indptr[:-1], indptr[1:])]
         else:
-            ret = ",".join([self.__get_arff_val(idx, attr)
-                            for idx, attr in enumerate(inst)])
-        if weight != 1.0:
-            ret += ', {' + str(weight) + '}'
-        return ret
+            lines = self.__get_dense_lines(tables,
+                                           self.data.values(start, stop))
+        if weights:
+            for line_no, weight in enumerate(
+                    self.inst_weights[start:stop].tolist()):
+                if weight != 1.0:
+                    lines[line_no] += ', {' + str(weight) + '}'
+        return lines
+
+    def __get_dense_lines(self, tables, values):
+        """\
+        Return a list of dense ARFF data lines for the given instances
+        (a 2-D array of values), formatting each attribute as a whole column.
+        """
+        if not tables:
+            return [''] * len(values)
+        cols = []
+        for idx, table in enumerate(tables):
+            col = values[:, idx]
+            missing = np.isnan(col)
+            if table is None:
+                strs = np.array([str(val) for val in col.tolist()],
+                                dtype=object)
+                strs[missing] = '?'
+            else:
+                codes = np.where(missing, len(table) - 1, col).astype(int)
+                strs = np.array(table, dtype=object)[codes]
+            cols.append(strs)
+        return [','.join(vals) for vals in zip(*cols)]
 
-    def __get_arff_val(self, attr_num, value):
+    def __get_output_val(self, tables, attr_num, value):
         """\
-        Return an ARFF-output safe value.
+        Return an ARFF-output safe value, using the given output
+        string tables.
         """
         # missing values
-        if math.isnan(value):
+        if value != value:
             return '?'
         # numeric values
-        if self.attribs[attr_num].type == 'numeric':
+        if tables[attr_num] is None:
             return str(value)
         # stringy values
-        else:
-            value = self.attribs[attr_num].value(value)
-            # decide if it needs to be quoted
-            quote = False
-            if value == '' or \
-                    re.search('(' + self.SPEC_CHARS + '|[{}?, ])', value):
-                quote = True
-            # backslash for special chars
-            value = re.sub('(' + self.SPEC_CHARS + ')', r'\\\1', value)
-            # return the result (quoted or not)
-            return value if not quote else "'" + value + "'"
+        return tables[attr_num][int(value)]
 
     def __metadata_copy(self, add_to_name=''):
         """\
@@ -1014,10 +1909,10 @@ class DataSet(object):
         """
         my_copy = DataSet()
         my_copy.is_sparse = self.is_sparse
-        my_copy.attribs = copy.deepcopy(self.attribs)
-        my_copy.attribs_by_name = copy.deepcopy(self.attribs_by_name)
+        my_copy.attribs = [copy.copy(attr) for attr in self.attribs]
+        my_copy.attribs_by_name = dict(self.attribs_by_name)
         my_copy.relation_name = self.relation_name + add_to_name
-        my_copy.data = []
+        my_copy.data = my_copy.__empty_data()
         return my_copy
 
     def __get_mask_set(self, select_attrib, mask_attrib):
@@ -1038,6 +1933,8 @@ class DataSet(object):
         """\
         Return the number of instances in this data set.
         """
+        if sp.issparse(self.data):
+            return self.data.shape[0]
         return len(self.data)
 
     def __getitem__(self, key):
@@ -1062,7 +1959,7 @@ class DataSet(object):
         elif isinstance(key, slice):
             return self.subset(key)
         # filtering
-        elif hasattr(key, '__call__'):
+        elif isinstance(key, Condition) or hasattr(key, '__call__'):
             return self.filter(key)
         raise ValueError('Unsupported index type!')
 
@@ -1094,6 +1991,17 @@ class DataSet(object):
         """
         return DataSetIterator(self)
 
+    def __setstate__(self, state):
+        """\
+        Convert dense instances and weights stored as lists by older versions
+        (e.g., in pickled model headers) to the current format.
+        """
+        self.__dict__.update(state)
+        if not self.is_sparse and isinstance(self.data, list):
+            self.data = ColumnStore.from_values(self.data,
+                                                self.__numeric_flags())
+        self.inst_weights = np.asarray(self.inst_weights, dtype=np.float64)
+
 
 class DataSetIterator(object):
     """\
@@ -1120,3 +2028,177 @@ class DataSetIterator(object):
             return res
         except IndexError:
             raise StopIteration
+
+
+class ArffWriter(object):
+    """\
+    An incremental ARFF file writer. It writes the headers given by
+    a declared attribute schema and then the instances as they are produced,
+    so that data sets of any size can be written without holding them in
+    memory (string attributes need no list of values in the headers).
+    """
+
+    def __init__(self, filename, attribs=None, relation_name='<noname>',
+                 encoding='UTF-8', append=False, buffer_size=10000):
+        """\
+        Open the output file and write the headers.
+
+        @param filename: the ARFF file to write
+        @param attribs: the attribute schema -- a list of Attribute objects \
+            or (name, ARFF type) pairs, or a DataSet whose attributes are used
+        @param relation_name: the relation name to write into the headers
+        @param encoding: the encoding (defaults to UTF-8)
+        @param append: append instances to an existing file, whose headers \
+            are checked against the schema (or used as the schema if none \
+            is given); a new file is created if it does not exist
+        @param buffer_size: number of instances written to the file at once
+        """
+        if isinstance(attribs, DataSet):
+            relation_name = attribs.relation_name or relation_name
+            attribs = attribs.attribs
+        elif attribs is not None:
+            attribs = [attr if isinstance(attr, Attribute)
+                       else Attribute(*attr) for attr in attribs]
+        self.buffer_size = buffer_size
+        self.lines = []
+        # reopen an existing file
+        if append and os.path.isfile(filename):
+            headers = DataSet()
+            headers.load_from_arff(filename, encoding, headers_only=True,
+                                   cache=False)
+            if attribs is not None:
+                self.__check_schema(headers.attribs, attribs)
+            self.attribs = headers.attribs
+            newline = self.__needs_newline(filename)
+            self.fh = file_stream(filename, 'a', encoding, index=True)
+            if newline:
+                self.fh.write('\n')
+        # create a new file
+        else:
+            if attribs is None:
+                raise ValueError('Attribute schema must be given ' +
+                                 'for new ARFF files.')
+            self.attribs = attribs
+            self.fh = file_stream(filename, 'w', encoding, index=True)
+            headers = DataSet()
+            headers.relation_name = relation_name
+            headers.attribs = attribs
+            headers.save_to_arff(self.fh, None)
+        self.names = [attr.name for attr in self.attribs]
+        self.name_set = set(self.names)
+
+    def write(self, instances, weights=None):
+        """\
+        Write one or more instances. An instance may be a dictionary
+        (attribute name -> value; missing attributes are written as
+        missing values, unknown ones raise a ValueError) or a list of values
+        in the order of the attributes.
+        A DataSet with the same attributes may also be given.
+
+        @param instances: one instance, a list of instances, or a DataSet
+        @param weights: weight(s) of the instance(s) (default: 1.0)
+        """
+        if isinstance(instances, DataSet):
+            if [attr.name for attr in instances.attribs] != self.names:
+                raise ValueError('Attributes of the data set do not match ' +
+                                 'the ARFF file.')
+            self.flush()
+            instances.save_to_arff(self.fh, None, headers=False)
+            return
+        # a single instance
+        if isinstance(instances, dict) or \
+                (instances and not isinstance(instances[0], (dict, list, tuple))):
+            instances = [instances]
+            weights = [weights] if weights is not None else None
+        if weights is None:
+            weights = [1.0] * len(instances)
+        for inst, weight in zip(instances, weights):
+            if isinstance(inst, dict):
+                if not self.name_set.issuperset(inst):
+                    raise ValueError('Unknown attributes: ' + ', '.join(
+                            sorted(set(inst) - self.name_set)))
+                inst = [inst.get(name) for name in self.names]
+            elif len(inst) != len(self.attribs):
+                raise ValueError('Instance length does not match the ' +
+                                 'number of attributes.')
+            line = ','.join([self.__get_arff_val(attr, val)
+                             for attr, val in zip(self.attribs, inst)])
+            if weight != 1.0:
+                line += ', {' + str(weight) + '}'
+            self.lines.append(line)
+        if len(self.lines) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """\
+        Write all buffered instances to the file.
+        """
+        if self.lines:
+            self.fh.write('\n'.join(self.lines) + '\n')
+            self.lines = []
+
+    def close(self):
+        """\
+        Write all buffered instances and close the file.
+        """
+        self.flush()
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __get_arff_val(self, attr, value):
+        """\
+        Return an ARFF-output safe value of the given attribute.
+        """
+        # missing values
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return '?'
+        if attr.type == 'numeric':
+            return str(float(value))
+        if not isinstance(value, basestring):
+            value = unicode(value)
+        if attr.type == 'nominal' and value not in attr.values:
+            raise ValueError('Invalid nominal value "' + value + '" ' +
+                             'of attribute ' + attr.name)
+        return quote(value)
+
+    def __check_schema(self, file_attribs, attribs):
+        """\
+        Check that the attributes of an existing file match the given
+        schema.
+        """
+        if [(attr.name, attr.type) for attr in file_attribs] != \
+                [(attr.name, attr.type) for attr in attribs]:
+            raise ValueError('Attributes of the existing ARFF file do not ' +
+                             'match the given schema.')
+
+    def __needs_newline(self, filename):
+        """\
+        Check if an existing (uncompressed, nonempty) file does not end with
+        a newline.
+        """
+        if filename.endswith('.gz') or not os.path.getsize(filename):
+            return False
+        fh = open(filename, 'rb')
+        fh.seek(-1, 2)
+        last = fh.read(1)
+        fh.close()
+        return last != b'\n'
+
+
+def _parse_arff_part(args):
+    """\
+    Parse a part of an ARFF file (worker process function for parallel
+    loading). Return string attribute labels, sparseness, instance values
+    and weights.
+    """
+    headers, filename, start, end, encoding, columns = args
+    values, weights = headers.parse_arff_part(filename, start, end, encoding,
+                                              columns)
+    return ([attr.labels if attr.type == 'string' else None
+             for attr in headers.attribs],
+            headers.is_sparse, values, weights)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Compact read-only storage of attribute labels.
+
+A frozen attribute keeps its labels in a LabelTable instead of a list
+of Python strings and a dictionary mapping them to their codes: all the
+labels are stored UTF-8-encoded in one byte string, with an array of their
+offsets, a sorted array of hashes of the labels and an array of the
+corresponding label codes. Codes of labels are then found by binary search
+over the hashes. This takes about 20 bytes per label (plus the label
+itself) instead of well over 100 bytes for the string objects, list and
+dictionary entries. The hashes are not pickled, but computed anew
+when the table is loaded.
+
+Label tables are never changed, so they are shared instead of copied
+(also by copy.deepcopy()). Attributes are unfrozen (converted back to a list
+and a dictionary) when new labels are added to them.
+"""
+
+from __future__ import unicode_literals
+import numpy as np
+
+__author__ = "Ondřej Dušek"
+__date__ = "2013"
+
+
+class LabelTable(object):
+    """\
+    A read-only list of labels (supports indexing by label codes,
+    iteration, len() and the in operator).
+    """
+
+    __slots__ = ['data', 'offsets', 'hashes', 'order']
+
+    def __init__(self, labels):
+        """\
+        Create a table from a list of labels (strings).
+        """
+        encoded = [label.encode('UTF-8') for label in labels]
+        self.data = b''.join(encoded)
+        offsets = np.cumsum([0] + [len(label) for label in encoded])
+        self.offsets = offsets.astype(np.uint32 if len(self.data) < 2 ** 32
+                                      else np.int64)
+        self.__index(labels)
+
+    def index(self, label):
+        """\
+        Return the code of the given label, raise a ValueError if it is
+        not in the table.
+        """
+        code = self.get(label)
+        if code is None:
+            raise ValueError(repr(label) + ' is not in the label table')
+        return code
+
+    def get(self, label, default=None):
+        """\
+        Return the code of the given label, or the default if it is not
+        in the table.
+        """
+        if not isinstance(label, basestring):
+            return default
+        hashed = hash(label)
+        pos = int(self.hashes.searchsorted(hashed))
+        while pos < len(self.hashes) and self.hashes[pos] == hashed:
+            code = int(self.order[pos])
+            if self[code] == label:
+                return code
+            pos += 1
+        return default
+
+    def encoded(self, code):
+        """\
+        Return the UTF-8-encoded label of the given code.
+        """
+        return self.data[self.offsets[code]:self.offsets[code + 1]]
+
+    def __getitem__(self, code):
+        if isinstance(code, slice):
+            return [self[idx] for idx in xrange(*code.indices(len(self)))]
+        if code < 0:
+            code += len(self)
+        if not 0 <= code < len(self):
+            raise IndexError('Label code out of range')
+        return self.encoded(code).decode('UTF-8')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for code in xrange(len(self)):
+            yield self.encoded(code).decode('UTF-8')
+
+    def __contains__(self, label):
+        return self.get(label) is not None
+
+    def __eq__(self, other):
+        if isinstance(other, LabelTable):
+            return self.data == other.data and \
+                np.array_equal(self.offsets, other.offsets)
+        return list(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __index(self, labels):
+        """\
+        Build the hash index of the given labels (the labels of this table).
+        """
+        hashes = np.fromiter((hash(label) for label in labels),
+                             dtype=np.int64, count=len(self))
+        self.order = np.argsort(hashes, kind='mergesort').astype(np.int32)
+        self.hashes = hashes[self.order]
+
+    def __getstate__(self):
+        return {'data': self.data, 'offsets': self.offsets}
+
+    def __setstate__(self, state):
+        self.data = state['data']
+        self.offsets = state['offsets']
+        self.__index(self)
+
+    def __repr__(self):
+        return 'LabelTable(' + repr(self[:10])[:-1] + \
+            (', ...' if len(self) > 10 else '') + '])'
+
+
+class LabelIndex(object):
+    """\
+    A read-only mapping of labels to their codes in a LabelTable
+    (used in place of the label -> code dictionary of attributes).
+    """
+
+    __slots__ = ['table']
+
+    def __init__(self, table):
+        self.table = table
+
+    def get(self, label, default=None):
+        return self.table.get(label, default)
+
+    def __getitem__(self, label):
+        code = self.table.get(label)
+        if code is None:
+            raise KeyError(label)
+        return code
+
+    def __contains__(self, label):
+        return self.table.get(label) is not None
+
+    def __len__(self):
+        return len(self.table)
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self):
+        return {'table': self.table}
+
+    def __setstate__(self, state):
+        self.table = state['table']
+
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Memory-mapped on-disk storage of data sets.
+
+A store is a directory with one raw binary file per array: the column
+arrays of dense data sets in the column store format (label codes of nominal
+and string attributes as uint8 or int32, values of numeric attributes as
+float64, see flect.colstore), or the data, indices and index pointer arrays
+of the CSR matrix of sparse data sets, and the instance weights. A small
+pickle file holds the headers (with frozen label tables, see
+flect.labeltable) and the array types and lengths.
+
+Stores are written in batches of instances (see StoreWriter), so that
+a data set never needs to be held in memory as a whole. When a store
+is opened, the arrays are memory-mapped read-only: instance values are only
+read from the disk when they are accessed, and several processes which open
+the same store share its pages in the operating system's page cache.
+Opened arrays are never changed (data sets replace them on all
+changes), so they may only be copied into memory, not written back.
+
+A store is written into a temporary directory first and renamed into place
+when complete, so that incomplete stores are never opened.
+"""
+
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import cPickle as pickle
+import numpy as np
+import scipy.sparse as sp
+
+__author__ = "Ondřej Dušek"
+__date__ = "2013"
+
+
+# store format version (increase on incompatible changes)
+STORE_VERSION = 1
+# header pickle file name
+META_FILE = 'meta.pickle'
+# number of values converted at once when array files are rewritten
+CONVERT_CHUNK = 1048576
+# largest uint8 label code (the next one stands for missing values)
+MAX_UINT8_CODE = 254
+# largest value of int32 sparse matrix indexes
+MAX_INT32 = 2 ** 31 - 1
+
+
+def is_store(dirname):
+    """\
+    Return true if the given path is a (complete) data set store.
+    """
+    return isinstance(dirname, basestring) and \
+        os.path.isfile(os.path.join(dirname, META_FILE))
+
+
+def open_store(dirname):
+    """\
+    Open a data set store. Return a dictionary with the keys relation_name,
+    attribs, is_sparse, weights, and columns (list of memory-mapped column
+    arrays in the column store format; dense data sets only) or matrix
+    (CSR matrix over memory-mapped arrays; sparse data sets only).
+
+    Raise an IOError if the directory does not contain a valid store.
+    """
+    try:
+        fh = open(os.path.join(dirname, META_FILE), 'rb')
+        meta = pickle.load(fh)
+        fh.close()
+    except (EOFError, pickle.UnpicklingError):
+        raise IOError('Invalid data set store: ' + dirname)
+    if meta.get('version') != STORE_VERSION:
+        raise IOError('Unsupported data set store version: ' + dirname)
+    arrays = meta['arrays']
+    ret = {'relation_name': meta['relation_name'],
+           'attribs': meta['attribs'],
+           'is_sparse': meta['is_sparse'],
+           'weights': _open_array(dirname, 'weights', *arrays['weights'])}
+    if meta['is_sparse']:
+        ret['matrix'] = sp.csr_matrix(
+                tuple(_open_array(dirname, name, *arrays[name])
+                      for name in ['data', 'indices', 'indptr']),
+                shape=(meta['length'], len(meta['attribs'])), copy=False)
+    else:
+        ret['columns'] = [_open_array(dirname, _column_name(idx),
+                                      *arrays[_column_name(idx)])
+                          for idx in xrange(len(meta['attribs']))]
+    return ret
+
+
+class StoreWriter(object):
+    """\
+    Writing a data set store in batches of instances.
+
+    All batches must have the same attributes. Label codes are written
+    as int32 and converted to uint8 when the store is closed if all of them
+    fit into it.
+    """
+
+    def __init__(self, dirname, numeric, is_sparse):
+        """\
+        Start writing a store into the given directory (which is replaced
+        when the store is closed). The attribute types are given as a list
+        of booleans (True for numeric attributes).
+        """
+        self.dirname = dirname
+        self.numeric = list(numeric)
+        self.is_sparse = is_sparse
+        self.length = 0
+        self.nnz = 0
+        # largest label code written to each column
+        self.max_codes = [-1] * len(self.numeric)
+        self.tmp_dir = tempfile.mkdtemp(
+                prefix=os.path.basename(os.path.abspath(dirname)) + '-',
+                dir=os.path.dirname(os.path.abspath(dirname)))
+        self.arrays = {'weights': (np.dtype(np.float64).str, 0)}
+        if is_sparse:
+            self.arrays['data'] = (np.dtype(np.float64).str, 0)
+            self.arrays['indices'] = (np.dtype(np.int32).str, 0)
+            self.arrays['indptr'] = (np.dtype(np.int64).str, 0)
+            self.__append('indptr', np.zeros(1, dtype=np.int64))
+        else:
+            for idx, num in enumerate(self.numeric):
+                self.arrays[_column_name(idx)] = \
+                    (np.dtype(np.float64 if num else np.int32).str, 0)
+
+    def write(self, values, weights):
+        """\
+        Append a batch of instances, given as a 2-D float array (dense data
+        sets; label codes as floats, NaN for missing values) or a CSR matrix
+        (sparse data sets), along with their weights.
+        """
+        if self.tmp_dir is None:
+            raise IOError('Cannot write to a closed store.')
+        if values.shape[1] != len(self.numeric) or \
+                sp.issparse(values) != self.is_sparse:
+            raise ValueError('The batch does not match the store attributes.')
+        if self.is_sparse:
+            matrix = sp.csr_matrix(values, copy=True)
+            matrix.sort_indices()
+            self.__append('data', matrix.data.astype(np.float64))
+            self.__append('indices', matrix.indices.astype(np.int32))
+            self.__append('indptr', matrix.indptr[1:].astype(np.int64) +
+                          self.nnz)
+            self.nnz += matrix.nnz
+        else:
+            for idx, num in enumerate(self.numeric):
+                col = np.asarray(values[:, idx], dtype=np.float64)
+                if not num:
+                    missing = np.isnan(col)
+                    if not missing.all():
+                        self.max_codes[idx] = max(self.max_codes[idx],
+                                                  int(col[~missing].max()))
+                    col = np.where(missing, -1, col).astype(np.int32)
+                self.__append(_column_name(idx), col)
+        self.__append('weights', np.asarray(weights, dtype=np.float64))
+        self.length += values.shape[0]
+
+    def close(self, relation_name, attribs):
+        """\
+        Finish the store, saving the given headers (a list of attributes,
+        preferably frozen, matching the attribute types given on creation).
+        The store is then moved to its final location.
+        """
+        if self.is_sparse:
+            if self.nnz <= MAX_INT32:
+                self.__convert('indptr', np.int32)
+            else:
+                self.__convert('indices', np.int64)
+        else:
+            for idx, max_code in enumerate(self.max_codes):
+                if not self.numeric[idx] and max_code <= MAX_UINT8_CODE:
+                    self.__convert(_column_name(idx), np.uint8,
+                                   lambda col: np.where(col < 0,
+                                                        MAX_UINT8_CODE + 1,
+                                                        col))
+        meta = {'version': STORE_VERSION,
+                'relation_name': relation_name,
+                'attribs': attribs,
+                'is_sparse': self.is_sparse,
+                'length': self.length,
+                'arrays': self.arrays}
+        # the header file is written last, so that incomplete stores
+        # are never used
+        fh = open(os.path.join(self.tmp_dir, META_FILE), 'wb')
+        pickle.dump(meta, fh, pickle.HIGHEST_PROTOCOL)
+        fh.close()
+        if os.path.isdir(self.dirname):
+            shutil.rmtree(self.dirname)
+        os.rename(self.tmp_dir, self.dirname)
+        self.tmp_dir = None
+
+    def abort(self):
+        """\
+        Remove the unfinished store (does nothing if it has been closed).
+        """
+        if self.tmp_dir is not None:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            self.tmp_dir = None
+
+    def __append(self, name, array):
+        """\
+        Append values to the given array file.
+        """
+        dtype, length = self.arrays[name]
+        fh = open(os.path.join(self.tmp_dir, name + '.bin'), 'ab')
+        np.ascontiguousarray(array, dtype=dtype).tofile(fh)
+        fh.close()
+        self.arrays[name] = (dtype, length + len(array))
+
+    def __convert(self, name, dtype, func=None):
+        """\
+        Rewrite the given array file with values of a different type,
+        in chunks (applying the given function to the values first).
+        """
+        old_dtype, length = self.arrays[name]
+        path = os.path.join(self.tmp_dir, name + '.bin')
+        src = _open_array(self.tmp_dir, name, old_dtype, length)
+        fh = open(path + '.tmp', 'wb')
+        chunk = None
+        for start in xrange(0, length, CONVERT_CHUNK):
+            chunk = src[start:start + CONVERT_CHUNK]
+            if func is not None:
+                chunk = func(chunk)
+            np.asarray(chunk).astype(dtype).tofile(fh)
+        fh.close()
+        src = chunk = None
+        os.rename(path + '.tmp', path)
+        self.arrays[name] = (np.dtype(dtype).str, length)
+
+
+def _column_name(idx):
+    """\
+    Return the array file name for the given dense data set column.
+    """
+    return 'attr-' + str(idx)
+
+
+def _open_array(dirname, name, dtype, length):
+    """\
+    Memory-map one array file of a store read-only.
+    """
+    if not length:
+        # empty files cannot be mapped
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(os.path.join(dirname, name + '.bin'), dtype=dtype,
+                     mode='r', shape=(length,))
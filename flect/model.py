@@ -14,6 +14,8 @@ from varutil import file_stream
 from logf import log_info
 from sklearn.metrics import accuracy_score
 from dataset import DataSet
+from mmapstore import is_store, open_store
+from onehot import OneHotEncoder
 from sklearn.dummy import DummyClassifier
 from sklearn.feature_extraction.dict_vectorizer import DictVectorizer
 from cluster import Job
@@ -46,26 +48,81 @@ class AbstractModel(object):
         self.attr_mask = None
         # part of the training data to be used
         self.train_part = config.get('train_part', 1)
+        # how the part of training data is selected: 'head' (first instances),
+        # 'stride' (evenly spread), 'reservoir' (random), 'stratified'
+        # (evenly spread, keeping the class distribution)
+        self.train_sample = config.get('train_sample', 'head')
         # 'unknown' value for instances that have unknown parameters (defaults to None/missing)
         self.unknown_value = config.get('unknown_value', None)
+        # create binary caches of the data files (existing ones are used anyway)
+        self.cache_data = config.get('cache_data', False)
+        # number of processes used for loading data files
+        self.load_workers = config.get('load_workers', 1)
 
-    def evaluate(self, test_file, encoding='UTF-8', classif_file=None):
+    def evaluate(self, test_file, encoding='UTF-8', classif_file=None,
+                 batch_size=None):
         """\
         Evaluate on the given test data file. Return accuracy.
         If classif_file is set, save the classification results to this file.
+        If batch_size is set, the test data are read, classified and saved
+        in batches of the given size instead of all at once.
         """
+        if batch_size is not None:
+            return self.__evaluate_batches(test_file, encoding, classif_file,
+                                           batch_size)
         test = DataSet()
-        test.load_from_arff(test_file, encoding)
+        test.load_from_arff(test_file, encoding,
+                            cache=True if self.cache_data else None,
+                            workers=self.load_workers,
+                            select_attrib=(self.get_load_attr()
+                                           if classif_file is None else None))
         values = self.classify(test)
         golden = self.get_classes(test, dtype=None)
         if classif_file is not None:
-            classif = DataSet()
-            classif.load_from_vect(test.get_attrib(self.class_attr), values)
-            classif.rename_attrib(self.class_attr, self.PREDICTED)
-            test.merge(classif)
+            test.merge(self.__get_classif(test, values))
             test.save_to_arff(classif_file, encoding)
         return accuracy_score(golden, values)
 
+    def __evaluate_batches(self, test_file, encoding, classif_file,
+                           batch_size):
+        """\
+        Evaluate on the given test data file, reading it in batches.
+        Return accuracy.
+        """
+        good = 0
+        total = 0
+        fh = None
+        if classif_file is not None:
+            fh = file_stream(classif_file, 'w', encoding, index=True)
+        select_attrib = self.get_load_attr() if classif_file is None else None
+        for batch_num, test in enumerate(DataSet.iter_arff(
+                test_file, encoding, batch_size,
+                select_attrib=select_attrib)):
+            if not len(test):
+                values = []
+            else:
+                values = self.classify(test)
+            golden = self.get_classes(test, dtype=None)
+            good += sum(1 for gold, val in zip(golden, values) if gold == val)
+            total += len(test)
+            if fh is not None:
+                test.merge(self.__get_classif(test, values))
+                test.save_to_arff(fh, None, headers=(batch_num == 0))
+        if fh is not None:
+            fh.close()
+        if not total:
+            return float('NaN')
+        return good / float(total)
+
+    def __get_classif(self, test, values):
+        """\
+        Return a one-attribute data set with the predicted values.
+        """
+        classif = DataSet()
+        classif.load_from_vect(test.get_attrib(self.class_attr), values)
+        classif.rename_attrib(self.class_attr, self.PREDICTED)
+        return classif
+
     @staticmethod
     def load_from_file(model_file):
         """\
@@ -84,17 +141,38 @@ class AbstractModel(object):
 
     def load_training_set(self, filename, encoding='UTF-8'):
         """\
-        Load the given training data set into memory and strip it if
-        configured to via the train_part parameter.
+        Load the given training data set (an ARFF file or a memory-mapped
+        data set store) into memory; only load a part of it if configured
+        to via the train_part and train_sample parameters.
         """
         log_info('Loading training data set from ' + str(filename) + '...')
         train = DataSet()
-        train.load_from_arff(filename, encoding)
-        if self.train_part < 1:
-            train = train.subset(0, int(round(self.train_part * len(train))),
-                                 copy=False)
+        # memory-mapped data set stores are opened, not loaded
+        if is_store(filename):
+            train.load_from_mmap(filename,
+                                 self.get_load_attr(training=True),
+                                 self.get_train_sample())
+            return train
+        train.load_from_arff(filename, encoding,
+                             cache=True if self.cache_data else None,
+                             workers=self.load_workers,
+                             select_attrib=self.get_load_attr(training=True),
+                             sample=self.get_train_sample())
         return train
 
+    def get_train_sample(self):
+        """\
+        Return the sample specification for loading the training data
+        (see flect.sampling), or None if all the data should be used.
+        """
+        if self.train_part >= 1:
+            return None
+        if self.train_sample == 'stratified':
+            return ('stratified', float(self.train_part), self.class_attr)
+        if self.train_sample == 'stride':
+            return ('stride', max(1, int(round(1.0 / self.train_part))))
+        return (self.train_sample, float(self.train_part))
+
     def save_to_file(self, model_file):
         """\
         Save the model to a pickle file or stream (supports GZip compression).
@@ -141,6 +219,19 @@ class AbstractModel(object):
         """
         return NotImplementedError()
 
+    def get_load_attr(self, training=False):
+        """\
+        Return the set of attributes that need to be loaded from data files
+        to train (or evaluate) the model, i.e., the selected attributes and
+        the class attribute. Return None if all attributes are needed.
+        """
+        if not training and self.attr_mask is not None:
+            return set(self.attr_mask) | set([self.class_attr])
+        if training and self.select_attr:
+            return (set(self.select_attr) - set(self.ignore_attr)) | \
+                    set([self.class_attr])
+        return None
+
 
 class Model(AbstractModel):
 
@@ -229,6 +320,7 @@ class Model(AbstractModel):
         """
         log_info('Preparing data set...')
         self.data_headers = train.get_headers()
+        self.data_headers.freeze_headers()
         self.attr_mask = self.get_attr_mask()
         train_vect = self.__vectorize(train)
         train_classes = self.get_classes(train)
@@ -290,6 +382,16 @@ class Model(AbstractModel):
             return values[0]
         return values
 
+    def get_load_attr(self, training=False):
+        # post-processing may use any attribute
+        if not training and self.postprocess:
+            return None
+        # data without vectorization must have the same attributes as
+        # the whole training data file
+        if self.vectorizer is None:
+            return None
+        return super(Model, self).get_load_attr(training)
+
     def get_attr_mask(self):
         # only use attributes present in data headers
         attr_mask = set([attr.name for attr in self.data_headers.attribs])
@@ -316,6 +418,15 @@ class Model(AbstractModel):
             # TODO pre-filtering here?
             return data.as_bunch(target=self.class_attr,
                                  select_attrib=self.attr_mask).data
+        # DictVectorizer on a DataSet: encode label codes directly
+        if isinstance(data, DataSet) and \
+                OneHotEncoder.supports(self.vectorizer):
+            encoder = OneHotEncoder(self.vectorizer, self.attr_mask,
+                                    self.filter_attr)
+            if not self.vectorizer_trained:
+                encoder.fit(data)
+                self.vectorizer_trained = True
+            return encoder.transform(data)
         # vectorization needed: converted to dictionary
         # and passed to the vectorizer
         if isinstance(data, DataSet):
@@ -391,6 +502,12 @@ class Model(AbstractModel):
             state['postprocess'] = None
         if 'ignore_attr' not in state:
             state['ignore_attr'] = []
+        if 'cache_data' not in state:
+            state['cache_data'] = False
+        if 'load_workers' not in state:
+            state['load_workers'] = 1
+        if 'train_sample' not in state:
+            state['train_sample'] = 'head'
         self.__dict__ = state
         if not hasattr(self, 'attr_mask'):
             self.attr_mask = self.get_attr_mask()
@@ -408,6 +525,9 @@ class SplitModel(AbstractModel):
         super(SplitModel, self).__init__(config)
         # create storage for split models
         self.divide_func = config['divide_func']
+        # attributes used by the divide function (if not given, its string
+        # literals are used if they are all attribute names)
+        self.divide_attr = config.get('divide_attr')
         self.config = config
         self.models = {}
         self.backoff_model = None
@@ -421,6 +541,7 @@ class SplitModel(AbstractModel):
         # load the entire data set
         train = self.load_training_set(train_file, encoding)
         self.data_headers = train.get_headers()
+        self.data_headers.freeze_headers()
         self.attr_mask = self.get_attr_mask()
         # train a backoff model
         log_info('Training a backoff model...')
@@ -457,6 +578,59 @@ class SplitModel(AbstractModel):
     def get_attr_mask(self):
         return self.models.itervalues().next().get_attr_mask()
 
+    def load_training_set(self, filename, encoding='UTF-8'):
+        """\
+        Load the given training data set; read its headers first so that
+        the attributes used by the divide function can be checked.
+        """
+        if getattr(self, 'divide_attr', None) is None:
+            self.data_headers = DataSet()
+            if is_store(filename):
+                self.data_headers.attribs = open_store(filename)['attribs']
+            else:
+                self.data_headers.load_from_arff(filename, encoding,
+                                                 headers_only=True)
+        return super(SplitModel, self).load_training_set(filename, encoding)
+
+    def get_load_attr(self, training=False):
+        """\
+        Return the set of attributes needed by the model, including
+        the attributes used by the divide function. Return None if all
+        attributes are needed.
+        """
+        divide_attr = self.__get_divide_attr()
+        if divide_attr is None:
+            return None
+        if training:
+            load_attrs = [super(SplitModel, self).get_load_attr(training)]
+        else:
+            load_attrs = [model.get_load_attr()
+                          for model in self.models.values() + [self.backoff_model]
+                          if model is not None]
+        if None in load_attrs:
+            return None
+        return set([self.class_attr]).union(*load_attrs) | divide_attr
+
+    def __get_divide_attr(self):
+        """\
+        Return the set of attributes used by the divide function: the
+        divide_attr setting, or all string literals in the function if
+        they are all attribute names in the data headers. Return None if
+        the attributes are not known.
+        """
+        divide_attr = getattr(self, 'divide_attr', None)
+        if divide_attr is not None:
+            return set(divide_attr)
+        if self.data_headers is None:
+            return None
+        literals = set([lit for lits in re.findall(
+                r'(?:\'([^\'\\]*)\'|"([^"\\]*)")', self.divide_func)
+                for lit in lits if lit])
+        names = set([attr.name for attr in self.data_headers.attribs])
+        if not literals or not literals <= names:
+            return None
+        return literals
+
     @staticmethod
     def load_from_files(config, model_files):
         model = SplitModel(config)
@@ -517,6 +691,13 @@ class ConcatModel(AbstractModel):
     def get_attr_mask(self):
         return self.models[0].get_attr_mask()
 
+    def get_load_attr(self, training=False):
+        # the member models may use different attributes
+        load_attrs = [model.get_load_attr(training) for model in self.models]
+        if None in load_attrs:
+            return None
+        return set([self.class_attr]).union(*load_attrs)
+
     @staticmethod
     def load_from_files(config, model_files):
         model = ConcatModel(config)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Direct one-hot encoding of data sets into sparse feature matrices.
+
+The encoder produces the same feature columns as a scikit-learn
+DictVectorizer applied to the output of DataSet.as_dict(): one binary
+column for each "attribute=label" combination of nominal and string
+attributes, one column holding the value of each numeric attribute.
+Instead of creating a dictionary for each instance, it uses the label codes
+stored in the data set: for each attribute, a table maps the label codes to
+the columns of the vectorizer's vocabulary, and the whole feature matrix is
+then built by array operations. String conditions (feature filters) are
+evaluated just once for each distinct label.
+
+The vocabulary is stored in the DictVectorizer itself, so that models
+trained either way may be used interchangeably.
+"""
+
+from __future__ import unicode_literals
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.dict_vectorizer import DictVectorizer
+
+__author__ = "Ondřej Dušek"
+__date__ = "2013"
+
+
+class OneHotEncoder(object):
+    """\
+    Conversion of data sets to feature matrices compatible with
+    a DictVectorizer.
+    """
+
+    def __init__(self, vectorizer, select_attrib=None, filter_func=None):
+        """\
+        Create an encoder.
+
+        @param vectorizer: the DictVectorizer which holds the vocabulary \
+            (see supports())
+        @param select_attrib: names of the attributes to use (None or \
+            empty = all, as in DataSet.as_dict())
+        @param filter_func: a function that takes an attribute name and \
+            a value and returns false for features that should be left out
+        """
+        if not OneHotEncoder.supports(vectorizer):
+            raise TypeError('Unsupported vectorizer: ' + repr(vectorizer))
+        self.vectorizer = vectorizer
+        self.select_attrib = set(select_attrib) if select_attrib else None
+        self.filter_func = filter_func
+
+    @staticmethod
+    def supports(vectorizer):
+        """\
+        Return true if the given vectorizer can be replaced by the encoder
+        (a DictVectorizer with sparse output and sorted features).
+        """
+        return type(vectorizer) == DictVectorizer and vectorizer.sparse and \
+            vectorizer.sort
+
+    def fit(self, data):
+        """\
+        Create the vocabulary of the vectorizer from all features that occur
+        in the given data set.
+        """
+        names = set()
+        for attr, _, values in self.__attrib_values(data):
+            if attr.type == 'numeric':
+                if self.__numeric_filter(attr, values).any():
+                    names.add(attr.name)
+                continue
+            for code in np.unique(values.astype(np.intp)).tolist():
+                label = attr.labels[code]
+                if self.filter_func is None or \
+                        self.filter_func(attr.name, label):
+                    names.add(self.__feature_name(attr, label))
+        self.vectorizer.feature_names_ = sorted(names)
+        self.vectorizer.vocabulary_ = {name: col for col, name
+                                       in enumerate(sorted(names))}
+        return self
+
+    def transform(self, data):
+        """\
+        Return a CSR matrix with features of all instances of the given
+        data set.
+        """
+        vocab = self.vectorizer.vocabulary_
+        rows = []
+        cols = []
+        vals = []
+        for attr, idxs, values in self.__attrib_values(data):
+            # numeric attributes: one column with the values
+            if attr.type == 'numeric':
+                if attr.name not in vocab:
+                    continue
+                mask = self.__numeric_filter(attr, values)
+                rows.append(idxs[mask])
+                cols.append(np.repeat(vocab[attr.name], mask.sum()))
+                vals.append(values[mask])
+                continue
+            # nominal and string attributes: map label codes to columns
+            codes = values.astype(np.intp)
+            table = self.__label_table(attr, np.unique(codes))
+            feats = table[codes]
+            mask = feats >= 0
+            rows.append(idxs[mask])
+            cols.append(feats[mask])
+            vals.append(np.ones(mask.sum()))
+        if not rows:
+            return sp.csr_matrix((len(data), len(vocab)),
+                                 dtype=self.vectorizer.dtype)
+        matrix = sp.csr_matrix((np.concatenate(vals),
+                                (np.concatenate(rows), np.concatenate(cols))),
+                               shape=(len(data), len(vocab)),
+                               dtype=self.vectorizer.dtype)
+        matrix.sort_indices()
+        return matrix
+
+    def fit_transform(self, data):
+        """\
+        Create the vocabulary from the given data set and return its
+        feature matrix.
+        """
+        return self.fit(data).transform(data)
+
+    def __attrib_values(self, data):
+        """\
+        Yield the selected attributes of the given data set with the indexes
+        of instances where their values are not missing, and the values
+        (as in DataSet.as_dict(), value code 0 is taken as not set
+        in sparse data sets).
+        """
+        if data.is_sparse:
+            matrix = data.data.tocsc()
+        for attr_num, attr in enumerate(data.attribs):
+            if self.select_attrib is not None and \
+                    attr.name not in self.select_attrib:
+                continue
+            if data.is_sparse:
+                start, end = matrix.indptr[attr_num:attr_num + 2]
+                idxs = matrix.indices[start:end]
+                values = matrix.data[start:end]
+            else:
+                values = data.attrib_as_array(attr_num)
+                idxs = np.arange(len(values))
+            known = ~np.isnan(values)
+            yield attr, idxs[known], values[known]
+
+    def __numeric_filter(self, attr, values):
+        """\
+        Return a boolean mask of the values of a numeric attribute that
+        pass the filter (calling the filter function once per distinct
+        value).
+        """
+        if self.filter_func is None:
+            return np.ones(len(values), dtype=bool)
+        uniq = np.unique(values)
+        keep = np.array([bool(self.filter_func(attr.name, val))
+                         for val in uniq.tolist()], dtype=bool)
+        return keep[np.searchsorted(uniq, values)]
+
+    def __label_table(self, attr, codes):
+        """\
+        Return an array mapping the given label codes of an attribute
+        to the vocabulary columns (-1 for unknown or filtered features).
+        """
+        vocab = self.vectorizer.vocabulary_
+        table = np.empty(len(attr.labels), dtype=np.intp)
+        table.fill(-1)
+        for code in codes.tolist():
+            label = attr.labels[code]
+            if self.filter_func is None or self.filter_func(attr.name, label):
+                table[code] = vocab.get(self.__feature_name(attr, label), -1)
+        return table
+
+    def __feature_name(self, attr, label):
+        """\
+        Return the DictVectorizer feature name for an attribute label.
+        """
+        return attr.name + self.vectorizer.separator + label
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Sampling of data instances while they are being read.
+
+A sample is specified as a tuple:
+
+('head', N) = the first N instances
+('stride', K[, offset]) = every K-th instance (starting at the given offset)
+('reservoir', N[, seed]) = N instances chosen uniformly at random
+('stratified', part, attrib) = the given part of instances of each value
+    of the given attribute (chosen systematically, so that the class
+    distribution of the sample follows the original one)
+
+The sizes for 'head' and 'reservoir' sampling may also be given as a part
+(a float between 0 and 1) of the total number of instances, which must then
+be known in advance.
+
+The samples always keep the original order of instances.
+"""
+
+from __future__ import unicode_literals
+import random
+from itertools import islice
+
+__author__ = "Ondřej Dušek"
+__date__ = "2013"
+
+
+SAMPLE_MODES = ['head', 'stride', 'reservoir', 'stratified']
+
+
+def check_sample(sample):
+    """\
+    Check a sample specification, return it as a (mode, size, parameter)
+    triple (parameter is the offset, seed, or attribute name, or None).
+    """
+    if not isinstance(sample, (tuple, list)) or not sample or \
+            sample[0] not in SAMPLE_MODES:
+        raise ValueError('Invalid sample specification: ' + repr(sample))
+    mode = sample[0]
+    if len(sample) not in ([3] if mode == 'stratified' else [2, 3]):
+        raise ValueError('Invalid number of parameters for ' + mode +
+                         ' sampling: ' + repr(sample))
+    size = sample[1]
+    param = sample[2] if len(sample) > 2 else None
+    if mode == 'stride':
+        if not isinstance(size, (int, long)) or size < 1 or \
+                (param is not None and param < 0):
+            raise ValueError('Invalid stride: ' + repr(sample))
+    elif mode == 'stratified' or isinstance(size, float):
+        if not 0 <= size <= 1:
+            raise ValueError('Invalid sample part: ' + repr(sample))
+    elif not isinstance(size, (int, long)) or size < 0:
+        raise ValueError('Invalid sample size: ' + repr(sample))
+    return mode, size, param
+
+
+def needs_total(sample):
+    """\
+    Return true if the given sample size is a part of the total number of
+    instances (which must be known before sampling).
+    """
+    mode, size, _ = check_sample(sample)
+    return mode in ['head', 'reservoir'] and isinstance(size, float)
+
+
+def sample_items(items, sample, total=None, key=None):
+    """\
+    Return an iterator over a sample of the given items. The items are
+    consumed lazily: 'head' sampling stops reading them as soon as the
+    sample is complete, 'reservoir' sampling only yields items after
+    reading all of them.
+
+    @param items: an iterable of items to sample
+    @param sample: the sample specification (see the module description)
+    @param total: the total number of items (required if the sample size \
+        is given as a part)
+    @param key: a function returning the stratification attribute value \
+        of an item (required for stratified sampling)
+    """
+    mode, size, param = check_sample(sample)
+    if needs_total(sample):
+        if total is None:
+            raise ValueError('The total number of instances must be known ' +
+                             'to sample a part of them.')
+        size = int(round(size * total))
+    if mode == 'head':
+        return islice(items, size)
+    elif mode == 'stride':
+        return islice(items, param or 0, None, size)
+    elif mode == 'reservoir':
+        return _sample_reservoir(items, size, random.Random(param))
+    if key is None:
+        raise ValueError('Stratified sampling requires a key function.')
+    return _sample_stratified(items, size, key)
+
+
+def _sample_reservoir(items, size, rnd):
+    """\
+    Reservoir sampling (Algorithm R): keep a uniform random sample of the
+    given size while reading, yield it in the original order at the end.
+    """
+    reservoir = []
+    for pos, item in enumerate(items):
+        if pos < size:
+            reservoir.append((pos, item))
+            continue
+        slot = rnd.randint(0, pos)
+        if slot < size:
+            reservoir[slot] = (pos, item)
+    reservoir.sort(key=lambda pair: pair[0])
+    for _, item in reservoir:
+        yield item
+
+
+def _sample_stratified(items, part, key):
+    """\
+    Systematic stratified sampling: take the given part of items with each
+    key value, evenly spread over the items with that value.
+    """
+    counts = {}
+    for item in items:
+        val = key(item)
+        count = counts.get(val, 0) + 1
+        counts[val] = count
+        if int(count * part + 0.5) > int((count - 1) * part + 0.5):
+            yield item
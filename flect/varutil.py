@@ -6,10 +6,11 @@ Small utility functions.
 """
 
 from __future__ import unicode_literals
+import io
 import codecs
-import gzip
-from io import IOBase
+from io import IOBase, TextIOBase
 from codecs import StreamReader, StreamWriter
+from blockgzip import open_gzip
 
 __author__ = "Ondřej Dušek"
 __date__ = "2013"
@@ -36,22 +37,86 @@ def as_list(value):
     return [value]
 
 
-def file_stream(filename, mode='r', encoding='UTF-8'):
+# pool of shared strings (see intern_string())
+_INTERNED = {}
+
+
+def intern_string(value):
+    """\
+    Return a shared copy of the given Unicode string: all equal strings
+    passed to this function are replaced by the same object (unlike
+    the built-in intern(), this works for Unicode strings). Other values
+    are returned unchanged. The strings are kept until clear_interned()
+    is called.
+    """
+    if type(value) is unicode:
+        return _INTERNED.setdefault(value, value)
+    return value
+
+
+def clear_interned():
+    """\
+    Empty the pool of shared strings (the strings are then freed as soon
+    as they are no longer used elsewhere).
+    """
+    _INTERNED.clear()
+
+
+# default buffer size for file streams
+BUFFER_SIZE = 1048576
+
+
+def file_stream(filename, mode='r', encoding='UTF-8', buffer_size=BUFFER_SIZE,
+                index=False):
     """\
     Given a file stream or a file name, return the corresponding stream,
     handling GZip. Depending on mode, open an input or output stream.
+
+    Files are opened as buffered io streams with the given buffer size
+    (text streams if encoding is set, binary streams otherwise).
+    GZip files are written as blocked GZip, which is compressed and
+    decompressed in parallel (see flect.blockgzip); the block index
+    is saved with them if index is set (used for data files).
+
+    Text io streams are returned unchanged, binary io streams are
+    wrapped to decode the given encoding. Other streams (such as
+    sys.stdin) are wrapped using the codecs module.
     """
-    # open file
-    if isinstance(filename, (file, IOBase, StreamReader, StreamWriter)):
+    # open streams
+    if isinstance(filename, TextIOBase):
+        return filename
+    if isinstance(filename, IOBase):
         fh = filename
+    elif isinstance(filename, (file, StreamReader, StreamWriter)):
+        if encoding is None:
+            return filename
+        if mode.startswith('r'):
+            return codecs.getreader(encoding)(filename)
+        return codecs.getwriter(encoding)(filename)
+    # open files
     elif filename.endswith('.gz'):
-        fh = gzip.open(filename, mode)
+        fh = open_gzip(filename, mode, buffer_size=buffer_size, index=index)
     else:
-        fh = open(filename, mode)
+        fh = io.open(filename, mode[0] + 'b', buffering=buffer_size)
     # support encodings
-    if encoding is not None:
-        if mode.startswith('r'):
-            fh = codecs.getreader(encoding)(fh)
-        else:
-            fh = codecs.getwriter(encoding)(fh)
-    return fh
+    if encoding is None:
+        return fh
+    return _TextStream(fh, encoding, buffer_size)
+
+
+class _TextStream(io.TextIOWrapper):
+    """\
+    A text stream over a buffered binary stream, which also accepts
+    byte strings for writing (as print >> does for newlines and
+    non-Unicode values).
+    """
+
+    def __init__(self, fh, encoding, buffer_size=BUFFER_SIZE):
+        super(_TextStream, self).__init__(fh, encoding, newline='\n')
+        # decode larger chunks at once
+        self._CHUNK_SIZE = buffer_size
+
+    def write(self, text):
+        if isinstance(text, bytes):
+            text = text.decode(self.encoding)
+        return super(_TextStream, self).write(text)